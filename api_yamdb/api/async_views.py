@@ -0,0 +1,90 @@
+"""
+Асинхронные представления чтения произведений, отзывов и комментариев
+для ASGI.
+
+Django 3.2 выполняет синхронные представления под ASGI в одном общем
+потоке по очереди. Асинхронная обертка выполняет чтение вьюсета
+(аутентификация, запросы, сериализация, рендеринг) в пуле из
+ASYNC_READ_THREADS потоков, а цикл событий тем временем принимает
+другие соединения и отдает ответы медленным клиентам. Асинхронного
+интерфейса ORM в Django 3.2 нет, поэтому запросы выполняются в потоках
+пула, как в database_sync_to_async из Channels.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import URLPattern
+from rest_framework.permissions import SAFE_METHODS
+
+from api.views import CommentViewSet, ReviewViewSet, TitleViewSet
+
+ASYNC_VIEWSETS = (TitleViewSet, ReviewViewSet, CommentViewSet)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.ASYNC_READ_THREADS,
+        thread_name_prefix='async-read',
+    )
+
+
+def materialize(response):
+    """
+    Потоковый ответ собирается целиком в потоке пула: ASGIHandler
+    Django 3.2 читает его итератор в цикле событий, где ORM недоступен.
+    """
+    content = HttpResponse(
+        b''.join(response.streaming_content), status=response.status_code
+    )
+    for header, value in response.items():
+        content[header] = value
+    return content
+
+
+def read(view, request, *args, **kwargs):
+    """ Выполняет и рендерит представление; соединения потока закрывает """
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        return materialize(response) if response.streaming else response
+    finally:
+        close_old_connections()
+
+
+def asynchronous(view):
+    """
+    async-версия представления вьюсета: чтения идут в пул потоков,
+    записи - в общий поток синхронного кода, как у обычных представлений.
+    """
+    read_in_pool = sync_to_async(
+        read, thread_sensitive=False, executor=get_executor()
+    )
+    write = sync_to_async(view, thread_sensitive=True)
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await read_in_pool(view, request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    return async_view
+
+
+def make_async(urlpatterns):
+    """ Заменяет представления ASYNC_VIEWSETS их async-версиями """
+    return [
+        URLPattern(
+            pattern.pattern, asynchronous(pattern.callback),
+            pattern.default_args, pattern.name
+        )
+        if getattr(pattern.callback, 'cls', None) in ASYNC_VIEWSETS
+        else pattern
+        for pattern in urlpatterns
+    ]
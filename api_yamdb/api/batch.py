@@ -0,0 +1,136 @@
+"""
+Пакетные запросы: POST /api/v1/batch/ выполняет список подзапросов
+к API в том же процессе, через те же представления, и возвращает
+ответы одним списком.
+
+Подзапросы аутентифицированы пользователем пакета и делят кэш запроса
+(api.cache.memoize): одинаковые GET выполняются один раз, запись
+сбрасывает кэш. Пакет из одних чтений с parallel выполняется в
+BATCH_THREADS потоках, остальные - по порядку.
+"""
+import asyncio
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+
+from api import cache
+
+API_PREFIX = '/api/v1/'
+BATCH_PATH = f'{API_PREFIX}batch/'
+# Ключи окружения пакета, относящиеся к его собственному телу
+BODY_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'wsgi.input')
+
+
+def build_request(request, method, path, body):
+    """ Запрос Django для подзапроса с аутентификацией пакета """
+    url = urlsplit(path)
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in request.META.items()
+        if key not in BODY_META
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': BytesIO(content),
+    })
+    subrequest = WSGIRequest(environ)
+    if request.user.is_authenticated:
+        # Как force_authenticate в тестах DRF: токен повторно не
+        # проверяется. Анонимный подзапрос аутентифицируется сам, чтобы
+        # отказ был 401 с WWW-Authenticate, как у отдельного запроса
+        subrequest._force_auth_user = request.user
+        subrequest._force_auth_token = request.auth
+    return subrequest
+
+
+def get_body(response):
+    if hasattr(response, 'data'):
+        return response.data
+    content = (
+        b''.join(response.streaming_content) if response.streaming
+        else response.content
+    )
+    if not content:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content.decode(errors='replace')
+
+
+def call(request, item):
+    """ Выполняет подзапрос: {'status': код ответа, 'body': данные} """
+    try:
+        match = resolve(urlsplit(item['path']).path)
+    except Resolver404:
+        return {
+            'status': status.HTTP_404_NOT_FOUND,
+            'body': {'detail': 'Страница не найдена.'},
+        }
+    view = match.func
+    if asyncio.iscoroutinefunction(view):
+        # async-обертка чтения (api.async_views) над вьюсетом
+        view = view.__wrapped__
+    response = view(
+        build_request(
+            request, item['method'], item['path'], item.get('body')
+        ),
+        *match.args, **match.kwargs
+    )
+    return {'status': response.status_code, 'body': get_body(response)}
+
+
+def get_key(item):
+    return ('batch', item['method'], item['path'])
+
+
+def run_item(request, item):
+    if item['method'] in SAFE_METHODS:
+        return cache.memoize(get_key(item), partial(call, request, item))
+    try:
+        return call(request, item)
+    finally:
+        cache.clear_request_cache()
+
+
+def run_parallel(request, items):
+    """
+    Различные чтения - каждое в своем потоке; потоки видят контекст
+    пакета и его кэш.
+    """
+    unique = {get_key(item): item for item in items}
+    context = contextvars.copy_context()
+
+    def run(item):
+        try:
+            return context.copy().run(run_item, request, item)
+        finally:
+            connections.close_all()
+
+    workers = min(settings.BATCH_THREADS, len(unique))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        responses = dict(zip(unique, pool.map(run, unique.values())))
+    return [responses[get_key(item)] for item in items]
+
+
+def run_batch(request, items, parallel=False):
+    """ Ответы на подзапросы в их порядке """
+    with cache.request_scope():
+        if parallel and all(item['method'] in SAFE_METHODS for item in items):
+            return run_parallel(request, items)
+        return [run_item(request, item) for item in items]
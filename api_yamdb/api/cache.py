@@ -0,0 +1,163 @@
+import fcntl
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+
+from reviews.models import Category, Genre
+
+
+@contextmanager
+def version_lock():
+    """ Блокировка изменения версий, общая для процессов сервера """
+    settings.SHARED_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(settings.SHARED_CACHE_DIR / 'versions.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def get_version(key):
+    """
+    Версия данных в общем кэше: (поколение, счетчик). Пропавший из кэша
+    ключ начинает новое поколение, поэтому версия не повторяет прежнюю.
+    """
+    version = cache.get(key)
+    if version is None:
+        version = (uuid.uuid4().hex, 0)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    """ Следующая версия: счетчик увеличивается под version_lock """
+    with version_lock():
+        generation, counter = get_version(key)
+        version = (generation, counter + 1)
+        cache.set(key, version, None)
+    return version
+
+
+# Кэш в пределах запроса: {ключ: значение} или None вне request_scope.
+# Подзапросы пакета /batch/, в том числе в потоках, делят один кэш
+request_cache = ContextVar('request_cache', default=None)
+
+
+@contextmanager
+def request_scope():
+    """ Вложенная область, например подзапрос пакета, делит кэш внешней """
+    if request_cache.get() is not None:
+        yield
+        return
+    token = request_cache.set({})
+    try:
+        yield
+    finally:
+        request_cache.reset(token)
+
+
+def memoize(key, func):
+    """ func() один раз на key в пределах request_scope, вне его - всегда """
+    store = request_cache.get()
+    if store is None:
+        return func()
+    if key not in store:
+        store[key] = func()
+    return store[key]
+
+
+def clear_request_cache():
+    """ После записи прочитанное в пределах запроса могло устареть """
+    store = request_cache.get()
+    if store is not None:
+        store.clear()
+
+
+class CatalogCache:
+    """
+    Процесс-локальный снимок небольшого справочника (категории, жанры).
+    Снимок хранится в памяти процесса по id и по slug и перечитывается
+    целиком, когда меняется версия в общем для процессов кэше Django.
+    Снимок общий для всех запросов процесса, поэтому он читается из
+    default, а не с реплики, которая может отставать.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.version_key = f'catalog_version:{model._meta.label_lower}'
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_id = {}
+        self._by_slug = {}
+
+    def current_version(self):
+        """
+        Версия из общего кэша - файл на диске, поэтому в пределах
+        request_scope она читается один раз на запрос.
+        """
+        return memoize(
+            self.version_key, partial(get_version, self.version_key)
+        )
+
+    def invalidate(self):
+        """ Увеличивает версию справочника во всех процессах """
+        version = bump_version(self.version_key)
+        store = request_cache.get()
+        if store is not None:
+            store[self.version_key] = version
+
+    def _objects(self):
+        return self.model.objects.using(DEFAULT_DB_ALIAS)
+
+    def _snapshot(self):
+        version = self.current_version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    objects = list(self._objects().all())
+                    self._by_id = {obj.pk: obj for obj in objects}
+                    self._by_slug = {obj.slug: obj for obj in objects}
+                    self._version = version
+        return self._by_id, self._by_slug
+
+    def get(self, pk):
+        if pk is None:
+            return None
+        by_id, _ = self._snapshot()
+        obj = by_id.get(pk)
+        if obj is None:
+            obj = self._objects().filter(pk=pk).first()
+            if obj is not None:
+                self.invalidate()
+        return obj
+
+    def get_by_slug(self, slug):
+        _, by_slug = self._snapshot()
+        obj = by_slug.get(slug)
+        if obj is None:
+            obj = self._objects().filter(slug=slug).first()
+            if obj is not None:
+                self.invalidate()
+        return obj
+
+    def get_by_slug_or_404(self, slug):
+        obj = self.get_by_slug(slug)
+        if obj is None:
+            raise Http404(
+                f'{self.model._meta.object_name} со slug {slug} не найден.'
+            )
+        return obj
+
+    def all(self):
+        by_id, _ = self._snapshot()
+        return list(by_id.values())
+
+
+categories = CatalogCache(Category)
+genres = CatalogCache(Genre)
@@ -1,13 +1,131 @@
 from django_filters import rest_framework
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
 
-from reviews.models import Title
+from api import cache
+from api.index import GENRE_MODE_AND, GENRE_MODE_OR, iter_bits, title_index
+from reviews.models import GenreTitle, Title
+
+# Больше id не передаем в один запрос IN (...), фильтруем через БД
+MAX_INDEXED_IDS = 5000
+
+
+def split_slugs(value):
+    return [slug for slug in value.split(',') if slug]
 
 
 class TitleFilter(rest_framework.FilterSet):
-    """ Фильтрсет для фильтрации по связанным моделям категории и жанра"""
-    category = rest_framework.CharFilter(field_name='category__slug')
-    genre = rest_framework.CharFilter(field_name='genre__slug')
+    """
+    Фильтрсет произведений. Жанр, категория и год отбираются
+    пересечением битовых масок индекса, затем одним запросом id IN (...).
+    genre и category принимают несколько slug через запятую,
+    genre_mode задает логику по жанрам: or (любой) или and (все).
+    """
+    category = rest_framework.CharFilter(method='filter_indexed')
+    genre = rest_framework.CharFilter(method='filter_indexed')
+    genre_mode = rest_framework.ChoiceFilter(
+        method='filter_indexed',
+        choices=((GENRE_MODE_OR, GENRE_MODE_OR),
+                 (GENRE_MODE_AND, GENRE_MODE_AND)),
+    )
+    year = rest_framework.NumberFilter(method='filter_indexed')
+    year_min = rest_framework.NumberFilter(method='filter_indexed')
+    year_max = rest_framework.NumberFilter(method='filter_indexed')
 
     class Meta:
         model = Title
         fields = ['year', 'name', 'category', 'genre']
+
+    def filter_indexed(self, queryset, name, value):
+        """ Применяется целиком в filter_queryset """
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        conditions = self.get_index_conditions()
+        if conditions is None:
+            return queryset
+        bits = title_index.match(**conditions)
+        ids = []
+        for title_id in iter_bits(bits):
+            ids.append(title_id)
+            if len(ids) > MAX_INDEXED_IDS:
+                return self.filter_in_db(queryset, **conditions)
+        return queryset.filter(pk__in=ids)
+
+    def get_index_conditions(self):
+        """ Переводит slug в id по кэшу справочников """
+        data = self.form.cleaned_data
+        conditions = {}
+        if data.get('genre'):
+            slugs = split_slugs(data['genre'])
+            genre_ids = [
+                genre.pk for genre in map(cache.genres.get_by_slug, slugs)
+                if genre is not None
+            ]
+            genre_mode = data.get('genre_mode') or GENRE_MODE_OR
+            if genre_mode == GENRE_MODE_AND and len(genre_ids) < len(slugs):
+                genre_ids = []
+            conditions['genre_ids'] = genre_ids
+            conditions['genre_mode'] = genre_mode
+        if data.get('category'):
+            conditions['category_ids'] = [
+                category.pk for category in map(
+                    cache.categories.get_by_slug,
+                    split_slugs(data['category'])
+                ) if category is not None
+            ]
+        for name in ('year', 'year_min', 'year_max'):
+            if data.get(name) is not None:
+                conditions[name] = int(data[name])
+        return conditions or None
+
+    def filter_in_db(self, queryset, genre_ids=None, genre_mode=None,
+                     category_ids=None, year=None, year_min=None,
+                     year_max=None):
+        """ Те же условия без индекса, для очень больших выборок """
+        if genre_ids is not None:
+            if not genre_ids:
+                return queryset.none()
+            links = GenreTitle.objects.values('title_id')
+            if genre_mode == GENRE_MODE_AND:
+                for genre_id in genre_ids:
+                    queryset = queryset.filter(
+                        pk__in=links.filter(genre_id=genre_id)
+                    )
+            else:
+                queryset = queryset.filter(
+                    pk__in=links.filter(genre_id__in=genre_ids)
+                )
+        if category_ids is not None:
+            queryset = queryset.filter(category_id__in=category_ids)
+        if year is not None:
+            queryset = queryset.filter(year=year)
+        if year_min is not None:
+            queryset = queryset.filter(year__gte=year_min)
+        if year_max is not None:
+            queryset = queryset.filter(year__lte=year_max)
+        return queryset
+
+
+class StrictOrderingFilter(filters.OrderingFilter):
+    """
+    Сортировка только по одному полю из ordering_fields вьюсета.
+    Под каждое такое поле в БД есть индекс, поэтому неподдерживаемые
+    поля и сочетания полей отклоняются, а не сортируются целиком.
+    Для стабильной пагинации добавляется id в том же направлении.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if not params:
+            return self.get_default_ordering(view)
+        fields = [param.strip() for param in params.split(',')]
+        allowed = view.ordering_fields
+        if len(fields) != 1 or fields[0].lstrip('-') not in allowed:
+            raise ValidationError({self.ordering_param: (
+                'Поддерживается сортировка только по одному из полей: '
+                + ', '.join(allowed) + ' (с "-" для убывания).'
+            )})
+        field = fields[0]
+        return [field, '-id' if field.startswith('-') else 'id']
@@ -0,0 +1,261 @@
+import threading
+
+from django.db import DEFAULT_DB_ALIAS
+
+from api.cache import bump_version, get_version
+from reviews.models import GenreTitle, Title
+
+GENRE_MODE_OR = 'or'
+GENRE_MODE_AND = 'and'
+
+
+def iter_bits(bits):
+    """ Перебирает номера установленных битов по возрастанию """
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+def count_bits(bits):
+    return bin(bits).count('1')
+
+
+def bits_from_ids(ids):
+    """ Собирает битовую маску из id за один проход """
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        buffer[pk // 8] |= 1 << (pk % 8)
+    return int.from_bytes(buffer, 'little')
+
+
+def group_bits(pairs):
+    """ {ключ: маска id} из пар (ключ, id) """
+    ids = {}
+    for key, pk in pairs:
+        ids.setdefault(key, []).append(pk)
+    return {key: bits_from_ids(group) for key, group in ids.items()}
+
+
+class TitleIndex:
+    """
+    Инвертированный индекс произведений в памяти процесса.
+    Для каждого жанра, категории и года хранится битовая маска id
+    произведений (целое число Python, бит n соответствует id = n).
+    Индекс строится лениво одним проходом по Title и GenreTitle и затем
+    обновляется по сигналам записи. Запись в другом процессе меняет
+    версию в общем для процессов кэше Django, и индекс перестраивается.
+    Индекс общий для всех запросов процесса и строится по default, а не
+    по реплике, которая может отставать.
+    """
+
+    version_key = 'title_index_version'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._all = 0
+        self._by_genre = {}
+        self._by_category = {}
+        self._by_year = {}
+        self._title_category = {}
+        self._title_year = {}
+
+    def _build(self):
+        """
+        id собираются в списки по ключам, каждая маска строится одним
+        проходом bits_from_ids: OR по одному биту в большое целое
+        копировал бы маску на каждый id.
+        """
+        titles = list(Title.objects.using(DEFAULT_DB_ALIAS).values_list(
+            'id', 'year', 'category_id'
+        ).iterator())
+        self._title_year = {pk: year for pk, year, _ in titles}
+        self._title_category = {pk: category for pk, _, category in titles}
+        self._all = bits_from_ids(self._title_year)
+        self._by_year = group_bits(
+            (year, pk) for pk, year, _ in titles if year is not None
+        )
+        self._by_category = group_bits(
+            (category, pk) for pk, _, category in titles
+            if category is not None
+        )
+        self._by_genre = group_bits(
+            (genre_id, title_id) for title_id, genre_id in
+            GenreTitle.objects.using(DEFAULT_DB_ALIAS).values_list(
+                'title_id', 'genre_id'
+            ).iterator()
+        )
+
+    def _ensure_fresh(self):
+        version = get_version(self.version_key)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._build()
+                    self._version = version
+
+    def _bump_version(self):
+        """
+        Сообщает другим процессам об изменении. Если между нашими
+        изменениями никто больше не писал, локальный индекс остается
+        актуальным, иначе он будет перестроен при следующем запросе.
+        """
+        generation, counter = bump_version(self.version_key)
+        if self._version == (generation, counter - 1):
+            self._version = (generation, counter)
+        else:
+            self._version = None
+
+    @staticmethod
+    def _set_bit(bitmaps, key, title_id):
+        bitmaps[key] = bitmaps.get(key, 0) | (1 << title_id)
+
+    @staticmethod
+    def _clear_bit(bitmaps, key, title_id):
+        bits = bitmaps.get(key, 0) & ~(1 << title_id)
+        if bits:
+            bitmaps[key] = bits
+        else:
+            bitmaps.pop(key, None)
+
+    def _set_title(self, title_id, year, category_id):
+        self._all |= 1 << title_id
+        self._title_year[title_id] = year
+        self._title_category[title_id] = category_id
+        if year is not None:
+            self._set_bit(self._by_year, year, title_id)
+        if category_id is not None:
+            self._set_bit(self._by_category, category_id, title_id)
+
+    def _unset_title(self, title_id):
+        self._all &= ~(1 << title_id)
+        year = self._title_year.pop(title_id, None)
+        category_id = self._title_category.pop(title_id, None)
+        if year is not None:
+            self._clear_bit(self._by_year, year, title_id)
+        if category_id is not None:
+            self._clear_bit(self._by_category, category_id, title_id)
+
+    def _apply(self, change, *args):
+        with self._lock:
+            if self._version is not None:
+                change(*args)
+            self._bump_version()
+
+    def title_saved(self, title_id, year, category_id, created=False):
+        """ У нового произведения еще нет жанров, даже если id повторный """
+        def change(title_id, year, category_id):
+            self._unset_title(title_id)
+            self._set_title(title_id, year, category_id)
+            if created:
+                for genre_id in list(self._by_genre):
+                    self._clear_bit(self._by_genre, genre_id, title_id)
+        self._apply(change, title_id, year, category_id)
+
+    def title_deleted(self, title_id):
+        def change(title_id):
+            self._unset_title(title_id)
+            for genre_id in list(self._by_genre):
+                self._clear_bit(self._by_genre, genre_id, title_id)
+        self._apply(change, title_id)
+
+    def genres_added(self, title_id, genre_ids):
+        def change(title_id, genre_ids):
+            for genre_id in genre_ids:
+                self._set_bit(self._by_genre, genre_id, title_id)
+        self._apply(change, title_id, genre_ids)
+
+    def genres_removed(self, title_id, genre_ids=None):
+        """ Без genre_ids у произведения снимаются все жанры """
+        def change(title_id, genre_ids):
+            if genre_ids is None:
+                genre_ids = list(self._by_genre)
+            for genre_id in genre_ids:
+                self._clear_bit(self._by_genre, genre_id, title_id)
+        self._apply(change, title_id, genre_ids)
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+            self._bump_version()
+
+    def _genre_bits(self, genre_ids, genre_mode):
+        if not genre_ids:
+            return 0
+        bits = self._by_genre.get(genre_ids[0], 0)
+        for genre_id in genre_ids[1:]:
+            if genre_mode == GENRE_MODE_AND:
+                bits &= self._by_genre.get(genre_id, 0)
+            else:
+                bits |= self._by_genre.get(genre_id, 0)
+        return bits
+
+    def _year_bits(self, year_min, year_max):
+        bits = 0
+        for year, bitmap in self._by_year.items():
+            if year_min is not None and year < year_min:
+                continue
+            if year_max is not None and year > year_max:
+                continue
+            bits |= bitmap
+        return bits
+
+    def match(self, genre_ids=None, genre_mode=GENRE_MODE_OR,
+              category_ids=None, year=None, year_min=None, year_max=None):
+        """
+        Возвращает битовую маску произведений, подходящих под условия.
+        None в аргументе означает отсутствие условия.
+        """
+        self._ensure_fresh()
+        if year is not None:
+            year_min = year_max = year
+        with self._lock:
+            bits = self._all
+            if genre_ids is not None:
+                bits &= self._genre_bits(list(genre_ids), genre_mode)
+            if category_ids is not None:
+                category_bits = 0
+                for category_id in category_ids:
+                    category_bits |= self._by_category.get(category_id, 0)
+                bits &= category_bits
+            if year_min is not None or year_max is not None:
+                bits &= self._year_bits(year_min, year_max)
+            return bits
+
+    def facet_counts(self, bits):
+        """
+        Считает, сколько произведений из маски приходится на каждый
+        жанр, категорию и десятилетие. Нулевые значения не выводятся.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            genres = {
+                genre_id: count_bits(bits & bitmap)
+                for genre_id, bitmap in self._by_genre.items()
+            }
+            categories = {
+                category_id: count_bits(bits & bitmap)
+                for category_id, bitmap in self._by_category.items()
+            }
+            decades = {}
+            for year, bitmap in sorted(self._by_year.items()):
+                decade = year // 10 * 10
+                decades[decade] = (
+                    decades.get(decade, 0) + count_bits(bits & bitmap)
+                )
+        return {
+            'genre': {pk: count for pk, count in genres.items() if count},
+            'category': {
+                pk: count for pk, count in categories.items() if count
+            },
+            'decade': {
+                decade: count for decade, count in decades.items() if count
+            },
+        }
+
+
+title_index = TitleIndex()
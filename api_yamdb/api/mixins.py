@@ -1,4 +1,21 @@
-from rest_framework import mixins, viewsets
+from functools import lru_cache, partial
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from rest_framework import mixins, permissions, serializers, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from api import cache
+from api_yamdb import db_routers
+from api_yamdb.db_writer import writer
+from reviews import sharding
+
+# Поля, у которых to_representation не меняет значение, прочитанное из БД
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.FloatField,
+    serializers.SlugRelatedField,
+)
 
 
 class CreateListDeleteViewSet(
@@ -14,3 +31,301 @@ class CreateListDeleteViewSet(
         - удаление объекта
     """
     pass
+
+
+class RequestScopeMixin:
+    """
+    Запрос выполняется в cache.request_scope: версии справочников и
+    остальное через cache.memoize читаются один раз на запрос.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with cache.request_scope():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaReadMixin:
+    """
+    Запросы на чтение после аутентификации читают с одной случайной
+    реплики, если пользователь недавно ничего не записывал. Успешная запись
+    закрепляет чтения пользователя за основной БД (read-your-writes).
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (request.method in permissions.SAFE_METHODS
+                and not cache.memoize(
+                    ('pinned_to_primary', request.user.pk),
+                    partial(db_routers.is_pinned_to_primary, request.user)
+                )):
+            self._replica_token = db_routers.replica_reads.set(
+                db_routers.pick_replica()
+            )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            db_routers.replica_reads.reset(token)
+            self._replica_token = None
+        if (request.method not in permissions.SAFE_METHODS
+                and response.status_code < 400):
+            db_routers.pin_to_primary(request.user)
+        return super().finalize_response(
+            request, response, *args, **kwargs
+        )
+
+
+class SingleWriterMixin:
+    """
+    Сохранение сериализатора и удаление выполняются потоком-писателем
+    процесса: параллельные запросы не борются за блокировку записи
+    SQLite, а их записи фиксируются общими транзакциями. Проверка
+    данных и сборка ответа остаются в потоке запроса.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.request.method not in permissions.SAFE_METHODS:
+            save = serializer.save
+
+            def save_in_writer(**kwargs):
+                return writer.run(partial(save, **kwargs))
+
+            serializer.save = save_in_writer
+        return serializer
+
+    def perform_destroy(self, instance):
+        writer.run(partial(super().perform_destroy, instance))
+
+
+class StreamingRenderMixin:
+    """
+    Если согласован потоковый рендерер (streaming = True), ответ
+    отдается через StreamingHttpResponse по мере кодирования. Данные
+    ответа к этому моменту уже собраны: см. StreamingColumnarRenderer.
+    Нужен каждому вьюсету со списком, иначе генератор рендерера
+    склеивается в обычный ответ целиком.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        renderer = getattr(response, 'accepted_renderer', None)
+        if not getattr(renderer, 'streaming', False):
+            return response
+        content_type = f'{response.accepted_media_type}; charset=utf-8'
+        streaming = StreamingHttpResponse(
+            renderer.render(
+                response.data, response.accepted_media_type,
+                response.renderer_context
+            ),
+            status=response.status_code, content_type=content_type,
+        )
+        for header, value in response.items():
+            if header.lower() != 'content-type':
+                streaming[header] = value
+        return streaming
+
+
+def compile_row_builder(keys, converters):
+    """
+    Компилирует функцию, собирающую словарь ответа из кортежа values_list:
+    ключи в заданном порядке, converters[key] применяется к значению,
+    кроме None - как в Serializer.to_representation.
+    """
+    items = []
+    namespace = {}
+    for index, key in enumerate(keys):
+        value = f'row[{index}]'
+        if key in converters:
+            namespace[f'convert_{index}'] = converters[key]
+            value = f'(None if {value} is None else convert_{index}({value}))'
+        items.append(f'{key!r}: {value}')
+    source = 'def build(row):\n    return {' + ', '.join(items) + '}\n'
+    exec(compile(source, '<row builder>', 'exec'), namespace)
+    return namespace['build']
+
+
+@lru_cache(maxsize=None)
+def get_field_sources(serializer_class):
+    """ Поля ответа сериализатора: имя -> первая часть source """
+    return {
+        name: field.source.split('.')[0]
+        for name, field in serializer_class().fields.items()
+        if not field.write_only
+    }
+
+
+def flatten_select_related(select, prefix=''):
+    paths = []
+    for name, nested in select.items():
+        paths.append(prefix + name)
+        paths += flatten_select_related(nested, f'{prefix}{name}__')
+    return paths
+
+
+class SparseFieldsMixin:
+    """
+    ?fields=a,b оставляет в ответе только перечисленные поля,
+    ?exclude=a,b - все, кроме перечисленных. Вместе с полями из запроса
+    уходят ненужные select_related и prefetch_related, а only()
+    ограничивает читаемые колонки. Действует только на чтение.
+    sparse_relations: поле ответа -> связь, от которой оно зависит,
+    если она не совпадает с source поля.
+    """
+    fields_param = 'fields'
+    exclude_param = 'exclude'
+    sparse_relations = {}
+
+    def get_sparse_fields(self):
+        """ Имена полей ответа по порядку или None, если нужны все """
+        if self.request.method not in permissions.SAFE_METHODS:
+            return None
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self.parse_sparse_fields()
+        return self._sparse_fields
+
+    def parse_sparse_fields(self):
+        params = self.request.query_params
+        requested = {
+            param: [
+                name.strip() for name in params[param].split(',')
+                if name.strip()
+            ]
+            for param in (self.fields_param, self.exclude_param)
+            if params.get(param)
+        }
+        if not requested:
+            return None
+        available = get_field_sources(self.get_serializer_class())
+        for param, names in requested.items():
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                raise ValidationError({param: (
+                    f'Неизвестные поля: {", ".join(unknown)}. '
+                    f'Доступны: {", ".join(available)}.'
+                )})
+        include = requested.get(self.fields_param, available)
+        exclude = requested.get(self.exclude_param, ())
+        return tuple(
+            name for name in available
+            if name in include and name not in exclude
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            target = getattr(serializer, 'child', serializer)
+            for name in list(target.fields):
+                if name not in fields:
+                    target.fields.pop(name)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        return self.prune_queryset(super().filter_queryset(queryset))
+
+    def prune_queryset(self, queryset):
+        """ Убирает из выборки связи и колонки неиспользуемых полей """
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+        sources = get_field_sources(self.get_serializer_class())
+        needed = {
+            self.sparse_relations.get(name, sources[name]) for name in fields
+        }
+        select = queryset.query.select_related
+        if isinstance(select, dict):
+            paths = [
+                path for path in flatten_select_related(select)
+                if path.split('__')[0] in needed
+            ]
+            queryset = queryset.select_related(None)
+            if paths:
+                queryset = queryset.select_related(*paths)
+        prefetch = queryset._prefetch_related_lookups
+        if prefetch:
+            queryset = queryset.prefetch_related(None).prefetch_related(*[
+                lookup for lookup in prefetch if (
+                    lookup.prefetch_through if isinstance(lookup, Prefetch)
+                    else lookup
+                ).split('__')[0] in needed
+            ])
+        if '*' in needed:
+            return queryset
+        opts = queryset.model._meta
+        concrete = {field.name for field in opts.concrete_fields}
+        return queryset.only(opts.pk.name, *sorted(needed & concrete))
+
+
+class ValuesListMixin(SparseFieldsMixin):
+    """
+    list без сериализатора: страница читается через values_list вместе
+    с полями связанных моделей, а словари собираются заранее
+    скомпилированной функцией в порядке и формате полей сериализатора.
+    list_lookups задает путь ORM для поля ответа, list_converters -
+    преобразование значения (без него значение по list_lookups выводится
+    как есть); остальное выводится из полей сериализатора. Поля связей
+    с моделями основной БД у шардированных моделей дочитываются
+    отдельным запросом на страницу.
+    """
+    fast_list = True
+    list_lookups = {}
+    list_converters = {}
+
+    def get_list_converters(self, serializer_class):
+        return self.list_converters
+
+    def get_row_builder(self):
+        cls = type(self)
+        key = (self.get_serializer_class(), self.get_sparse_fields())
+        builders = cls.__dict__.get('_row_builders')
+        if builders is None:
+            builders = cls._row_builders = {}
+        if key not in builders:
+            builders[key] = self.make_row_builder(*key)
+        return builders[key]
+
+    def make_row_builder(self, serializer_class, fields=None):
+        keys = []
+        lookups = []
+        converters = {}
+        list_converters = self.get_list_converters(serializer_class)
+        for key, field in serializer_class().fields.items():
+            if field.write_only or fields is not None and key not in fields:
+                continue
+            keys.append(key)
+            if key in self.list_lookups:
+                lookups.append(self.list_lookups[key])
+            elif isinstance(field, serializers.SlugRelatedField):
+                lookups.append(f'{field.source}__{field.slug_field}')
+            else:
+                lookups.append(field.source.replace('.', '__'))
+            if key in list_converters:
+                converters[key] = list_converters[key]
+            elif not (key in self.list_lookups
+                      or isinstance(field, PASSTHROUGH_FIELDS)):
+                converters[key] = field.to_representation
+        return lookups, compile_row_builder(keys, converters)
+
+    def build_rows(self, rows, build):
+        return [build(row) for row in rows]
+
+    def list(self, request, *args, **kwargs):
+        if not self.fast_list:
+            return super().list(request, *args, **kwargs)
+        lookups, build = self.get_row_builder()
+        queryset = self.filter_queryset(
+            self.get_queryset()
+        ).prefetch_related(None)
+        lookups, joins = sharding.split_joins(queryset.model, lookups)
+        rows = queryset.values_list(*lookups)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.build_rows(
+                sharding.resolve_joins(page, joins), build
+            ))
+        return Response(
+            self.build_rows(sharding.resolve_joins(rows, joins), build)
+        )
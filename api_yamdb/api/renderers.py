@@ -0,0 +1,93 @@
+from rest_framework.renderers import JSONRenderer
+
+ROWS_KEY = 'results'
+
+
+def split_columnar(data):
+    """
+    Делит ответ списка на (ключи до строк, колонки, строки, ключи после).
+    Для ответов, не являющихся списком объектов, возвращает None.
+    """
+    if isinstance(data, list):
+        head, rows, tail = {}, data, {}
+    elif isinstance(data, dict) and isinstance(data.get(ROWS_KEY), list):
+        keys = list(data)
+        position = keys.index(ROWS_KEY)
+        head = {key: data[key] for key in keys[:position]}
+        rows = data[ROWS_KEY]
+        tail = {key: data[key] for key in keys[position + 1:]}
+    else:
+        return None
+    if any(not isinstance(row, dict) for row in rows[:1]):
+        return None
+    columns = list(rows[0]) if rows else []
+    return head, columns, rows, tail
+
+
+def to_columnar(data):
+    parts = split_columnar(data)
+    if parts is None:
+        return data
+    head, columns, rows, tail = parts
+    return {
+        **head,
+        'columns': columns,
+        'rows': [[row[column] for column in columns] for row in rows],
+        **tail,
+    }
+
+
+class ColumnarRenderer(JSONRenderer):
+    """
+    Списки в виде {"columns": [...], "rows": [[...], ...]}: имена полей
+    передаются один раз, а не в каждой строке. Остальные ключи ответа
+    (count, next, facets и т.д.) выводятся как есть.
+    """
+    media_type = 'application/vnd.yamdb.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(
+            to_columnar(data), accepted_media_type, renderer_context
+        )
+
+
+class StreamingColumnarRenderer(JSONRenderer):
+    """
+    Тот же формат, что у ColumnarRenderer, но render возвращает
+    генератор: строки кодируются по одной и отдаются клиенту через
+    StreamingHttpResponse, закодированное тело целиком в памяти не
+    собирается. Потоковым остается только кодирование: строки страницы
+    собираются во вьюсете до рендеринга и лежат в response.data списком,
+    пока ответ не отдан, так что память ответа ограничивает размер
+    страницы (limit), а не рендерер. Собирать строки лениво при отдаче
+    нельзя: под ASGI потоковый ответ итерируется в цикле событий, где
+    синхронные запросы к БД (промах кэша справочника, связи) запрещены.
+    """
+    media_type = 'application/vnd.yamdb.columnar-stream+json'
+    format = 'columnar-stream'
+    streaming = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        parts = split_columnar(data)
+        if parts is None:
+            yield super().render(data, accepted_media_type, renderer_context)
+            return
+        head, columns, rows, tail = parts
+        encode = self.encode_value
+        yield b'{'
+        for key, value in head.items():
+            yield encode(key) + b':' + encode(value) + b','
+        yield b'"columns":' + encode(columns) + b',"rows":['
+        for index, row in enumerate(rows):
+            encoded = encode([row[column] for column in columns])
+            yield encoded if not index else b',' + encoded
+        yield b']'
+        for key, value in tail.items():
+            yield b',' + encode(key) + b':' + encode(value)
+        yield b'}'
+
+    def encode_value(self, value):
+        if value is None:
+            return b'null'
+        return JSONRenderer.render(self, value)
@@ -1,7 +1,11 @@
-from django.shortcuts import get_object_or_404
+from urllib.parse import urlsplit
+
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from api import cache
+from api.batch import API_PREFIX, BATCH_PATH
 from reviews.models import (Category,
                             Comment,
                             Genre,
@@ -90,10 +94,72 @@ class GenreSerializer(serializers.ModelSerializer):
         }
 
 
+def catalog_representation(obj, fields):
+    """ То же, что CategorySerializer/GenreSerializer(obj).data """
+    return {name: getattr(obj, name) for name in fields}
+
+
+def category_representation(category_id):
+    category = cache.categories.get(category_id)
+    if category is None:
+        return None
+    return catalog_representation(category, CategorySerializer.Meta.fields)
+
+
+def genre_representation(genre_id):
+    genre = cache.genres.get(genre_id)
+    if genre is None:
+        return None
+    return catalog_representation(genre, GenreSerializer.Meta.fields)
+
+
+def category_slug(category_id):
+    category = cache.categories.get(category_id)
+    return None if category is None else category.slug
+
+
+def genre_slug(genre_id):
+    genre = cache.genres.get(genre_id)
+    return None if genre is None else genre.slug
+
+
+class CachedCategoryField(serializers.Field):
+    """ Категория произведения из кэша справочника, без запроса к БД"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return cache.categories.get(instance.category_id)
+
+    def to_representation(self, value):
+        return CategorySerializer(value).data
+
+
+class CachedGenreField(serializers.Field):
+    """ Жанры произведения из кэша справочника по связям GenreTitle"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        genres = (
+            cache.genres.get(link.genre_id)
+            for link in instance.genretitle_set.all()
+        )
+        # Жанр, удаленный после чтения связей, пропускается
+        return [genre for genre in genres if genre is not None]
+
+    def to_representation(self, value):
+        return GenreSerializer(value, many=True).data
+
+
 class TitleSerializer(serializers.ModelSerializer):
     """ Сериализатор для чтения произведения"""
-    category = CategorySerializer(read_only=True)
-    genre = GenreSerializer(many=True, read_only=True)
+    category = CachedCategoryField()
+    genre = CachedGenreField()
     rating = serializers.FloatField()
 
     class Meta:
@@ -109,9 +175,28 @@ class TitleSerializer(serializers.ModelSerializer):
         )
 
 
+class CachedCategorySlugField(CachedCategoryField):
+    def to_representation(self, value):
+        return value.slug
+
+
+class CachedGenreSlugField(CachedGenreField):
+    def to_representation(self, value):
+        return [genre.slug for genre in value]
+
+
+class TitleSideloadSerializer(TitleSerializer):
+    """
+    Произведение со slug категории и жанров вместо вложенных объектов,
+    сами объекты выводятся один раз в блоке included списка
+    """
+    category = CachedCategorySlugField()
+    genre = CachedGenreSlugField()
+
+
 class TitlePostPatchSerializer(serializers.ModelSerializer):
-    category = CategorySerializer(read_only=True)
-    genre = GenreSerializer(many=True, read_only=True)
+    category = CachedCategoryField()
+    genre = CachedGenreField()
 
     class Meta:
         model = Title
@@ -126,15 +211,14 @@ class TitlePostPatchSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         """ Приводим данные к нужному формату для записи """
-        category = get_object_or_404(
-            Category,
-            slug=self.initial_data['category']
+        category = cache.categories.get_by_slug_or_404(
+            self.initial_data['category']
         )
         data['category'] = category
         initial_genres = self.initial_data.getlist('genre')
         genre = []
         for initial_genre in initial_genres:
-            genre.append(get_object_or_404(Genre, slug=initial_genre))
+            genre.append(cache.genres.get_by_slug_or_404(initial_genre))
         data['genre'] = genre
         return data
 
@@ -164,15 +248,14 @@ class ReviewSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Review
-        fields = '__all__'
+        exclude = ('comment_count',)
 
     def validate(self, data):
         request = self.context['request']
         author = request.user
         title_id = self.context.get('view').kwargs.get('title_id')
         if request.method == 'POST':
-            existing_review = Review.objects.filter(
-                title=title_id,
+            existing_review = Review.objects.for_title(title_id).filter(
                 author=author).first()
             if existing_review:
                 raise serializers.ValidationError(
@@ -194,3 +277,35 @@ class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = '__all__'
+
+
+class BatchItemSerializer(serializers.Serializer):
+    """ Подзапрос пакета: метод, путь API с query string и тело JSON """
+    method = serializers.ChoiceField(
+        choices=('GET', 'POST', 'PATCH', 'DELETE'), default='GET'
+    )
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        path = urlsplit(value).path
+        if not path.startswith(API_PREFIX) or path == BATCH_PATH:
+            raise serializers.ValidationError(
+                f'Ожидается путь API, начинающийся с {API_PREFIX}, '
+                'кроме самого пакета.'
+            )
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """ Пакет подзапросов; parallel - чтения выполнять параллельно """
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+    parallel = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                'В пакете не больше '
+                f'{settings.BATCH_MAX_REQUESTS} подзапросов.'
+            )
+        return value
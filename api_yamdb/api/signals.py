@@ -0,0 +1,85 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api import cache
+from api.index import title_index
+from reviews.models import Category, Genre, GenreTitle, Title
+from reviews.signals import bulk_loaded
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_categories(sender, **kwargs):
+    cache.categories.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Genre)
+def invalidate_genres(sender, **kwargs):
+    cache.genres.invalidate()
+
+
+@receiver(post_delete, sender=Category)
+def invalidate_title_index(sender, **kwargs):
+    """ SET_NULL у произведений выполняется без сигналов Title """
+    transaction.on_commit(title_index.invalidate)
+
+
+@receiver(post_save, sender=Title)
+def index_title(sender, instance, created, **kwargs):
+    transaction.on_commit(partial(
+        title_index.title_saved,
+        instance.pk, instance.year, instance.category_id, created
+    ))
+
+
+@receiver(post_delete, sender=Title)
+def unindex_title(sender, instance, **kwargs):
+    transaction.on_commit(partial(title_index.title_deleted, instance.pk))
+
+
+@receiver(post_save, sender=GenreTitle)
+def index_genre_title(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        title_index.genres_added, instance.title_id, [instance.genre_id]
+    ))
+
+
+@receiver(post_delete, sender=GenreTitle)
+def unindex_genre_title(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        title_index.genres_removed, instance.title_id, [instance.genre_id]
+    ))
+
+
+@receiver(m2m_changed, sender=Title.genre.through)
+def reindex_title_genres(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        transaction.on_commit(title_index.invalidate)
+    elif action == 'post_add':
+        transaction.on_commit(partial(
+            title_index.genres_added, instance.pk, list(pk_set)
+        ))
+    elif action == 'post_remove':
+        transaction.on_commit(partial(
+            title_index.genres_removed, instance.pk, list(pk_set)
+        ))
+    else:
+        transaction.on_commit(partial(
+            title_index.genres_removed, instance.pk
+        ))
+
+
+@receiver(bulk_loaded)
+def invalidate_after_bulk_load(sender, models, **kwargs):
+    """ bulk_create не отправляет post_save, сбрасываем все целиком """
+    if Category in models:
+        cache.categories.invalidate()
+    if Genre in models:
+        cache.genres.invalidate()
+    if {Title, GenreTitle, Category} & set(models):
+        title_index.invalidate()
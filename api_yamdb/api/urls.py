@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
-from api.views import (CommentViewSet,
+from api.async_views import make_async
+from api.views import (BatchViewSet,
+                       CommentViewSet,
                        CategoryViewSet,
                        GenreViewSet,
+                       ReviewFeedViewSet,
+                       ReviewImportViewSet,
                        ReviewViewSet,
                        SignUpViewSet,
                        TitleViewSet,
@@ -28,6 +33,10 @@ router_v1.register(
     prefix='auth/token',
     viewset=TokenViewSet,
     basename='token')
+router_v1.register(
+    prefix='batch',
+    viewset=BatchViewSet,
+    basename='batch')
 router_v1.register(
     prefix='categories',
     viewset=CategoryViewSet,
@@ -36,6 +45,14 @@ router_v1.register(
     prefix='genres',
     viewset=GenreViewSet,
     basename='genres')
+router_v1.register(
+    prefix='reviews',
+    viewset=ReviewFeedViewSet,
+    basename='reviews-feed')
+router_v1.register(
+    prefix='reviews/import',
+    viewset=ReviewImportViewSet,
+    basename='reviews-import')
 router_v1.register(
     prefix='titles',
     viewset=TitleViewSet,
@@ -50,6 +67,10 @@ router_v1.register(
     basename='comments')
 
 
+urls_v1 = router_v1.urls
+if settings.ASYNC_READ_VIEWS:
+    urls_v1 = make_async(urls_v1)
+
 urlpatterns = [
-    path('v1/', include(router_v1.urls)),
+    path('v1/', include(urls_v1)),
 ]
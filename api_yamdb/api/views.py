@@ -1,4 +1,5 @@
-from django.db.models import Avg
+from functools import partial
+
 from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
@@ -11,23 +12,46 @@ from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from api.mixins import CreateListDeleteViewSet
+from api import cache
+from api.index import bits_from_ids, title_index
+from api.mixins import (
+    CreateListDeleteViewSet, ReplicaReadMixin, RequestScopeMixin,
+    SingleWriterMixin, SparseFieldsMixin, StreamingRenderMixin,
+    ValuesListMixin
+)
 from api.permissions import (
     IsAdminOnlyPermission,
     IsAdminOrReadOnlyPermission,
     IsAuthorModeratorAdminOrReadOnlyPermission
 )
-from api.filters import TitleFilter
-from api.serializers import (RoleSerializer, UserSerializer,
+from api.batch import run_batch
+from api.filters import StrictOrderingFilter, TitleFilter
+from api.serializers import (BatchSerializer, RoleSerializer, UserSerializer,
                              RegistrationSerializer, UserTokenSerializer,
                              CategorySerializer, CommentSerializer,
                              GenreSerializer, ReviewSerializer,
                              TitlePostPatchSerializer, TitleSerializer,
+                             TitleSideloadSerializer, catalog_representation,
+                             category_representation, category_slug,
+                             genre_representation, genre_slug,
                              )
-from reviews.models import Category, Comment, Genre, Review, Title, User
+from reviews.comment_buffer import comment_buffer
+from reviews.management.importing import ReviewImporter
+from reviews.models import (
+    Category, Comment, Genre, GenreTitle, Review, Title, User
+)
 
+TRUE_VALUES = ('1', 'true', 'True')
+# Сколько ошибок импорта возвращать в ответе
+MAX_REPORTED_ERRORS = 100
 
-class UserViewSet(viewsets.ModelViewSet):
+
+class UserViewSet(
+    ReplicaReadMixin,
+    StreamingRenderMixin,
+    SparseFieldsMixin,
+    viewsets.ModelViewSet
+):
     """
     Работает над всеми операциями с пользователями от лица админа.
     Позволяет обычному пользователю редактировать свой профиль.
@@ -113,7 +137,12 @@ class TokenViewSet(viewsets.ModelViewSet):
         )
 
 
-class CategoryViewSet(CreateListDeleteViewSet):
+class CategoryViewSet(
+    ReplicaReadMixin,
+    StreamingRenderMixin,
+    SparseFieldsMixin,
+    CreateListDeleteViewSet
+):
     """ Вьюсет категоргии произведения """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -124,7 +153,12 @@ class CategoryViewSet(CreateListDeleteViewSet):
     permission_classes = [IsAdminOrReadOnlyPermission, ]
 
 
-class GenreViewSet(CreateListDeleteViewSet):
+class GenreViewSet(
+    ReplicaReadMixin,
+    StreamingRenderMixin,
+    SparseFieldsMixin,
+    CreateListDeleteViewSet
+):
     """ Вьюсет жанра произведения """
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
@@ -134,23 +168,134 @@ class GenreViewSet(CreateListDeleteViewSet):
     permission_classes = [IsAdminOrReadOnlyPermission, ]
 
 
-class TitleViewSet(viewsets.ModelViewSet):
+class TitleViewSet(
+    RequestScopeMixin,
+    ReplicaReadMixin,
+    StreamingRenderMixin,
+    ValuesListMixin,
+    viewsets.ModelViewSet
+):
     """ Вьюсет произведения """
-    queryset = Title.objects.annotate(rating=Avg('reviews__score'))
+    queryset = Title.objects.prefetch_related('genretitle_set')
     permission_classes = [IsAdminOrReadOnlyPermission, ]
     pagination_class = LimitOffsetPagination
-    filter_backends = (rest_framework.DjangoFilterBackend,)
+    filter_backends = (rest_framework.DjangoFilterBackend,
+                       StrictOrderingFilter)
     filterset_class = TitleFilter
+    ordering_fields = ('name', 'year', 'rating', 'review_count')
+    # Жанры страницы дочитываются в build_rows, на их месте пока id
+    list_lookups = {'genre': 'id', 'category': 'category_id'}
+    list_converters = {'category': category_representation}
+    sparse_relations = {'genre': 'genretitle_set'}
 
     def get_serializer_class(self):
         if self.request.method == 'PUT':
             raise MethodNotAllowed(self.request.method)
         if self.request.method in ['POST', 'PATCH']:
             return TitlePostPatchSerializer
+        if self.is_sideloaded():
+            return TitleSideloadSerializer
         return TitleSerializer
 
+    def is_sideloaded(self):
+        return (
+            self.action == 'list'
+            and self.request.query_params.get('sideload') in TRUE_VALUES
+        )
+
+    def get_list_converters(self, serializer_class):
+        if serializer_class is TitleSideloadSerializer:
+            return {'category': category_slug}
+        return self.list_converters
+
+    def list(self, request, *args, **kwargs):
+        """
+        С ?facets=true к странице добавляются счетчики по фильтрам,
+        с ?sideload=true категории и жанры выводятся по slug, а сами
+        объекты - по одному разу в блоке included.
+        """
+        response = super().list(request, *args, **kwargs)
+        if self.is_sideloaded():
+            response.data['included'] = self.get_included(
+                response.data['results']
+            )
+        if request.query_params.get('facets') in TRUE_VALUES:
+            response.data['facets'] = self.get_facets()
+        return response
+
+    def get_included(self, titles):
+        """ Различные категории и жанры страницы в порядке появления """
+        categories = {}
+        genres = {}
+        for title in titles:
+            if title.get('category') is not None:
+                categories.setdefault(title['category'], None)
+            for slug in title.get('genre', ()):
+                genres.setdefault(slug, None)
+        # Объект, удаленный после чтения страницы, пропускается
+        return {
+            'categories': [
+                catalog_representation(
+                    category, CategorySerializer.Meta.fields
+                ) for category in map(cache.categories.get_by_slug, categories)
+                if category is not None
+            ],
+            'genres': [
+                catalog_representation(genre, GenreSerializer.Meta.fields)
+                for genre in map(cache.genres.get_by_slug, genres)
+                if genre is not None
+            ],
+        }
+
+    def build_rows(self, rows, build):
+        data = super().build_rows(rows, build)
+        if not data or 'genre' not in data[0]:
+            return data
+        represent = (
+            genre_slug if self.is_sideloaded() else genre_representation
+        )
+        genres = {}
+        for title_id, genre_id in GenreTitle.objects.filter(
+            title_id__in=[item['genre'] for item in data]
+        ).order_by('pk').values_list('title_id', 'genre_id'):
+            genre = represent(genre_id)
+            # Жанр, удаленный после чтения связей, пропускается
+            if genre is not None:
+                genres.setdefault(title_id, []).append(genre)
+        for item in data:
+            item['genre'] = genres.get(item['genre'], [])
+        return data
+
+    def get_facets(self):
+        """
+        Счетчики по жанрам, категориям и десятилетиям для всей
+        отфильтрованной выборки: один запрос id, остальное по индексу.
+        """
+        ids = self.filter_queryset(
+            Title.objects.all()
+        ).order_by().values_list('pk', flat=True)
+        counts = title_index.facet_counts(bits_from_ids(ids.iterator()))
+        facets = {'genre': {}, 'category': {}, 'decade': {}}
+        for genre_id, count in counts['genre'].items():
+            genre = cache.genres.get(genre_id)
+            if genre is not None:
+                facets['genre'][genre.slug] = count
+        for category_id, count in counts['category'].items():
+            category = cache.categories.get(category_id)
+            if category is not None:
+                facets['category'][category.slug] = count
+        for decade, count in counts['decade'].items():
+            facets['decade'][str(decade)] = count
+        return facets
+
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(
+    ReplicaReadMixin,
+    SingleWriterMixin,
+    StreamingRenderMixin,
+    ValuesListMixin,
+    viewsets.ModelViewSet
+):
     """Вьюсет на отзывы"""
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthorModeratorAdminOrReadOnlyPermission, ]
@@ -162,7 +307,9 @@ class ReviewViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
 
     def get_queryset(self):
-        return Review.objects.select_related('title').all()
+        return Review.objects.for_title(
+            self.kwargs.get('title_id')
+        ).select_related('title')
 
     def perform_create(self, serializer):
         title = get_object_or_404(
@@ -171,7 +318,13 @@ class ReviewViewSet(viewsets.ModelViewSet):
         serializer.save(author=self.request.user, title=title)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(
+    ReplicaReadMixin,
+    SingleWriterMixin,
+    StreamingRenderMixin,
+    ValuesListMixin,
+    viewsets.ModelViewSet
+):
     """Вьюсет на комментарии"""
     serializer_class = CommentSerializer
     permission_classes = [IsAuthorModeratorAdminOrReadOnlyPermission, ]
@@ -183,17 +336,84 @@ class CommentViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
 
     def get_review(self):
+        title_id = self.kwargs.get('title_id')
         review_id = self.kwargs.get('review_id')
-        return get_object_or_404(Review, id=review_id)
+        return cache.memoize(('review', title_id, review_id), partial(
+            get_object_or_404, Review.objects.for_title(title_id),
+            id=review_id
+        ))
 
     def get_queryset(self):
-        review = self.get_review()
-        return Comment.objects.filter(review=review).select_related('author')
+        return self.get_review().comments.select_related('author')
 
     def perform_create(self, serializer):
         review = self.get_review()
+        if settings.COMMENT_WRITE_BEHIND:
+            serializer.instance = comment_buffer.add(Comment(
+                review=review, author=self.request.user,
+                **serializer.validated_data
+            ))
+            return
         serializer.save(author=self.request.user, review=review)
 
-        return Response(
-            'Проверьте confirmation_code', status=status.HTTP_400_BAD_REQUEST
-        )
+
+class ReviewFeedViewSet(
+    ReplicaReadMixin,
+    StreamingRenderMixin,
+    mixins.ListModelMixin,
+    viewsets.GenericViewSet
+):
+    """
+    Отзывы по всем произведениям для администратора, новые первыми;
+    ?author=username - активность одного пользователя. При шардировании
+    запрос выполняется на всех шардах параллельно.
+    """
+    serializer_class = ReviewSerializer
+    permission_classes = (IsAdminOnlyPermission,)
+    pagination_class = LimitOffsetPagination
+
+    def get_queryset(self):
+        queryset = Review.objects.select_related(
+            'title', 'author'
+        ).order_by('-pub_date', '-pk')
+        username = self.request.query_params.get('author')
+        if username:
+            queryset = queryset.filter(
+                author=get_object_or_404(User, username=username)
+            )
+        return queryset.across_shards()
+
+
+class ReviewImportViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    """
+    Импорт отзывов администратором: тело запроса - JSONL, по отзыву
+    в строке. Тело читается построчно, не загружаясь в память целиком.
+    """
+    permission_classes = (IsAdminOnlyPermission,)
+
+    def create(self, request):
+        errors = []
+
+        def collect_error(line_number, line, error):
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': line_number, 'error': error})
+
+        lines = request.stream if request.stream is not None else ()
+        result = ReviewImporter(on_reject=collect_error).run(lines)
+        result['errors'] = errors
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class BatchViewSet(viewsets.ViewSet):
+    """
+    Пакет подзапросов к API за один запрос: ответы возвращаются
+    списком в порядке подзапросов. Права проверяет каждый подзапрос.
+    """
+
+    def create(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'responses': run_batch(
+            request, serializer.validated_data['requests'],
+            parallel=serializer.validated_data['parallel'],
+        )})
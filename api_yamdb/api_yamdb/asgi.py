@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_yamdb.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
 
 application = get_asgi_application()
+
+if settings.COMMENT_WRITE_BEHIND:
+    # Комментарии журналов, брошенных до перезапуска, - в БД сразу,
+    # а не с первым отложенным комментарием
+    from reviews.comment_buffer import comment_buffer
+    comment_buffer.recover()
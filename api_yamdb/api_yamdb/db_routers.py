@@ -0,0 +1,103 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from reviews import sharding
+
+# Реплика, с которой читает текущий запрос, или None. Выбирается
+# вьюсетом один раз после аутентификации, чтобы COUNT и страница
+# одного ответа читались с одной реплики с одним отставанием; вне
+# запросов все идет в основную БД.
+replica_reads = ContextVar('replica_reads', default=None)
+
+
+def get_pin_key(user):
+    return f'read_your_writes:{user.pk}'
+
+
+def pin_to_primary(user):
+    """
+    После записи чтения пользователя идут в основную БД
+    READ_YOUR_WRITES_SECONDS секунд, пока реплики догоняют.
+    """
+    if user.is_authenticated:
+        cache.set(get_pin_key(user), True, settings.READ_YOUR_WRITES_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return user.is_authenticated and cache.get(get_pin_key(user), False)
+
+
+def pick_replica():
+    """ Случайная реплика из READ_REPLICAS или None, если их нет """
+    if not settings.READ_REPLICAS:
+        return None
+    return random.choice(settings.READ_REPLICAS)
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    token = replica_reads.set(pick_replica() if enabled else None)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    """
+    Чтения запросов, которым это разрешено, уходят на реплику из
+    READ_REPLICAS, выбранную для запроса, все записи и остальные
+    чтения - в default.
+    Реплики - копии default, миграции к ним не применяются.
+    """
+
+    def db_for_read(self, model, **hints):
+        return replica_reads.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReviewShardRouter:
+    """
+    Отзывы и комментарии при включенном REVIEW_SHARDING читаются и
+    пишутся в шард произведения, который определяется по объекту-
+    подсказке. Запрос без подсказки и без явного using() - ошибка:
+    такие выборки строятся через for_title() или across_shards().
+    На шарды мигрируют только таблицы отзывов и комментариев.
+    Решения по остальным моделям передаются следующему роутеру.
+    """
+
+    def db_for_model(self, model, instance=None, **hints):
+        if not sharding.is_sharded(model):
+            return None
+        alias = instance is not None and sharding.shard_for_instance(
+            instance
+        )
+        if not alias:
+            raise sharding.ShardRoutingError(
+                f'Не удалось определить шард для {model._meta.label}.'
+            )
+        return alias
+
+    db_for_read = db_for_model
+    db_for_write = db_for_model
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in settings.REVIEW_SHARDS:
+            return None
+        return f'{app_label}.{model_name}' in sharding.SHARDED_MODELS
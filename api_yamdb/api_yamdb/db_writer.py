@@ -0,0 +1,128 @@
+"""
+Единственный писатель на процесс для SQLite. Записи выполняются
+в отдельном потоке по очереди, несколько накопившихся записей -
+в одной транзакции (group commit), поэтому потоки процесса не
+конкурируют за блокировку записи. Чтения идут параллельно: база
+переводится в режим WAL, в котором читатели не ждут писателя.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from reviews import sharding
+
+
+@receiver(connection_created)
+def enable_wal(sender, connection, **kwargs):
+    """ WAL и synchronous=NORMAL для файловых БД SQLite """
+    if (connection.vendor != 'sqlite' or not settings.SQLITE_WAL
+            or connection.is_in_memory_db()):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+
+
+def get_write_aliases():
+    """ БД, в которые могут писать задания: default и шарды отзывов """
+    return [DEFAULT_DB_ALIAS, *sharding.get_shards()]
+
+
+@contextmanager
+def atomic(aliases):
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+class WriteQueue:
+    """
+    Очередь заданий потока-писателя. Поток берет все накопившиеся
+    задания (не больше WRITE_QUEUE_BATCH) и выполняет их в одной
+    транзакции, каждое - в своей точке сохранения: ошибка задания
+    откатывает только его. Результат или исключение задания
+    возвращается вызывающему потоку после фиксации транзакции.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+        self.jobs = None
+
+    def ensure_started(self):
+        with self.lock:
+            # После fork поток родителя в процессе не существует
+            if self.pid != os.getpid() or not self.thread.is_alive():
+                self.pid = os.getpid()
+                self.jobs = queue.SimpleQueue()
+                self.thread = threading.Thread(
+                    target=self.loop, name='db-writer', daemon=True
+                )
+                self.thread.start()
+
+    def submit(self, func):
+        future = Future()
+        self.ensure_started()
+        self.jobs.put((func, future))
+        return future
+
+    def run(self, func):
+        """
+        Выполняет func() в потоке-писателе и возвращает результат.
+        Внутри транзакции вызывающего потока и в самом писателе
+        выполняет сразу: иначе они ждали бы друг друга.
+        """
+        if (not settings.WRITE_QUEUE
+                or threading.current_thread() is self.thread
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return func()
+        return self.submit(func).result()
+
+    def take_batch(self):
+        batch = [self.jobs.get()]
+        while len(batch) < settings.WRITE_QUEUE_BATCH:
+            try:
+                batch.append(self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def loop(self):
+        jobs = self.jobs
+        while True:
+            batch = self.take_batch()
+            for future, result, error in self.commit(batch):
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+            if jobs.empty():
+                connections.close_all()
+
+    def commit(self, batch):
+        """ Выполняет пачку заданий одной транзакцией """
+        aliases = get_write_aliases()
+        outcomes = []
+        try:
+            with atomic(aliases):
+                for func, future in batch:
+                    try:
+                        with atomic(aliases):
+                            outcomes.append((future, func(), None))
+                    except Exception as error:
+                        outcomes.append((future, None, error))
+        except Exception as error:
+            return [(future, None, error) for _, future in batch]
+        return outcomes
+
+
+writer = WriteQueue()
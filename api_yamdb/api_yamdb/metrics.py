@@ -0,0 +1,392 @@
+"""
+Метрики запросов в формате Prometheus: GET /metrics.
+
+MetricsMiddleware считает по маршруту (вьюсет.действие) запросы по
+методу и коду ответа, гистограммы длительности, размера ответа, числа
+и времени SQL-запросов. Счетчики без блокировок: каждый поток пишет
+в свой набор, наборы складываются при чтении. Раз в
+METRICS_FLUSH_INTERVAL секунд процесс сохраняет снимок своих метрик
+в METRICS_DIR, /metrics складывает снимки всех процессов.
+
+SQL запроса считает QueryTimer из контекста запроса (ContextVar), в
+каком бы потоке запрос ни выполнялся: в пуле async-представлений под
+ASGI или в потоках пакета /batch/. Запросы потока-писателя, общие для
+нескольких запросов, в счет не входят.
+
+/metrics - внутренний адрес для сборщика метрик: он перечисляет все
+маршруты и отвечает только адресам из METRICS_ALLOWED_IPS.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.deprecation import MiddlewareMixin
+
+REQUESTS = 'yamdb_http_requests_total'
+DURATION = 'yamdb_http_request_duration_seconds'
+RESPONSE_SIZE = 'yamdb_http_response_size_bytes'
+QUERIES = 'yamdb_db_queries_per_request'
+QUERY_TIME = 'yamdb_db_query_duration_seconds'
+
+COUNTERS = {
+    REQUESTS: 'Requests by route, method and status code',
+}
+HISTOGRAMS = {
+    DURATION: (
+        'Request latency',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ),
+    RESPONSE_SIZE: (
+        'Response body size',
+        (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+    ),
+    QUERIES: (
+        'SQL queries executed by one request',
+        (0, 1, 2, 3, 5, 10, 20, 50, 100),
+    ),
+    QUERY_TIME: (
+        'Time one request spent in SQL queries',
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    ),
+}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SNAPSHOT_SUFFIX = '.json'
+
+
+class Shard:
+    """
+    Метрики одного потока. Пишет в них только этот поток, поэтому
+    блокировки не нужны. Гистограмма - счетчики по корзинам (последняя -
+    +Inf) и сумма наблюдений.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        buckets = HISTOGRAMS[name][1]
+        entry = self.histograms.get(key)
+        if entry is None:
+            entry = self.histograms[key] = [0] * (len(buckets) + 2)
+        entry[bisect_left(buckets, value)] += 1
+        entry[-1] += value
+
+
+def merge(target, counters, histograms):
+    for key, value in counters.items():
+        target.counters[key] = target.counters.get(key, 0) + value
+    for key, entry in histograms.items():
+        current = target.histograms.get(key)
+        target.histograms[key] = list(entry) if current is None else [
+            first + second for first, second in zip(current, entry)
+        ]
+
+
+def dump(shard):
+    return json.dumps({
+        'counters': [
+            [name, labels, value]
+            for (name, labels), value in shard.counters.items()
+        ],
+        'histograms': [
+            [name, labels, entry]
+            for (name, labels), entry in shard.histograms.items()
+        ],
+    })
+
+
+def load(text):
+    data = json.loads(text)
+    return (
+        {
+            (name, tuple(map(tuple, labels))): value
+            for name, labels, value in data['counters']
+        },
+        {
+            (name, tuple(map(tuple, labels))): entry
+            for name, labels, entry in data['histograms']
+        },
+    )
+
+
+def format_labels(labels, extra=()):
+    items = [
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in (*labels, *extra)
+    ]
+    return '{' + ','.join(items) + '}' if items else ''
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_histogram(name, labels, entry):
+    buckets = HISTOGRAMS[name][1]
+    lines = []
+    total = 0
+    for bound, count in zip((*buckets, '+Inf'), entry):
+        total += count
+        lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])}'
+                     f' {total}')
+    lines.append(f'{name}_sum{format_labels(labels)} '
+                 f'{format_number(entry[-1])}')
+    lines.append(f'{name}_count{format_labels(labels)} {total}')
+    return lines
+
+
+def render(shard):
+    """ Текстовый формат Prometheus """
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [
+            f'{name}{format_labels(labels)} {format_number(value)}'
+            for (metric, labels), value in sorted(shard.counters.items())
+            if metric == name
+        ]
+    for name, (help_text, _) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (metric, labels), entry in sorted(shard.histograms.items()):
+            if metric == name:
+                lines += render_histogram(name, labels, entry)
+    return '\n'.join(lines) + '\n'
+
+
+class ShardOwner:
+    """
+    Хранится только в threading.local потока: когда поток завершается,
+    владелец удаляется, и набор потока переносится в retired.
+    """
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class Registry:
+    """
+    Метрики процесса: наборы живых потоков и retired - сумма наборов
+    завершившихся, чтобы серверы с потоком на соединение не копили
+    наборы. Снимки процессов - в METRICS_DIR.
+    """
+
+    def __init__(self):
+        # Для регистрации и переноса наборов; reentrant - перенос
+        # может случиться при сборке мусора в потоке, держащем lock
+        self.lock = threading.RLock()
+        self.local = threading.local()
+        self.shards = []
+        self.retired = Shard()
+        self.pid = None
+        self.flushed_at = 0
+
+    def get_shard(self):
+        pid = os.getpid()
+        owner = getattr(self.local, 'owner', None)
+        if owner is not None and self.pid == pid:
+            return owner.shard
+        with self.lock:
+            if self.pid != pid:
+                # После fork метрики родителя - не метрики процесса
+                self.pid = pid
+                self.shards = []
+                self.retired = Shard()
+                atexit.register(self.flush)
+            shard = Shard()
+            self.shards.append(shard)
+        owner = ShardOwner(shard)
+        weakref.finalize(owner, self.retire, pid, shard)
+        self.local.owner = owner
+        return shard
+
+    def retire(self, pid, shard):
+        """ Набор завершившегося потока - в общую сумму """
+        with self.lock:
+            if self.pid != pid:
+                return
+            merge(self.retired, shard.counters, shard.histograms)
+            self.shards.remove(shard)
+
+    def snapshot(self):
+        """ Сумма наборов потоков процесса """
+        total = Shard()
+        if self.pid != os.getpid():
+            return total
+        with self.lock:
+            shards = list(self.shards)
+            merge(total, self.retired.counters, self.retired.histograms)
+        for shard in shards:
+            # copy() словаря не прерывается другими потоками
+            merge(total, shard.counters.copy(), {
+                key: list(entry)
+                for key, entry in shard.histograms.copy().items()
+            })
+        return total
+
+    def get_directory(self):
+        if settings.METRICS_DIR is None:
+            return None
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory
+
+    def flush(self):
+        """ Сохраняет снимок процесса: запись во временный файл и rename """
+        directory = self.get_directory()
+        if directory is None or self.pid != os.getpid():
+            return
+        snapshot = dump(self.snapshot())
+        with tempfile.NamedTemporaryFile(
+            'w', dir=directory, suffix='.tmp', delete=False
+        ) as temporary:
+            temporary.write(snapshot)
+        os.replace(temporary.name, directory / f'{self.pid}{SNAPSHOT_SUFFIX}')
+
+    def maybe_flush(self):
+        now = time.monotonic()
+        if now - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flushed_at = now
+            self.flush()
+
+    def collect(self):
+        """ Метрики процесса и снимки остальных процессов из METRICS_DIR """
+        total = self.snapshot()
+        directory = self.get_directory()
+        if directory is None:
+            return total
+        own = f'{os.getpid()}{SNAPSHOT_SUFFIX}'
+        for path in directory.glob(f'*{SNAPSHOT_SUFFIX}'):
+            if path.name == own:
+                continue
+            try:
+                merge(total, *load(path.read_text()))
+            except (OSError, ValueError, KeyError):
+                continue
+        return total
+
+
+registry = Registry()
+
+
+# QueryTimer текущего запроса; вне запросов - None
+query_timer = ContextVar('query_timer', default=None)
+
+
+class QueryTimer:
+    """ Число и время SQL-запросов; пишут потоки одного запроса """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.duration = 0
+
+    def add(self, duration):
+        with self.lock:
+            self.count += 1
+            self.duration += duration
+
+
+def time_query(execute, sql, params, many, context):
+    """ execute_wrapper всех соединений: счет идет в QueryTimer контекста """
+    timer = query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.add(time.perf_counter() - started)
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+# Соединения потоков пулов открываются уже после загрузки middleware
+connection_created.connect(install_query_timer)
+
+
+def get_route(request):
+    """ Вьюсет.действие, имя представления или unmatched """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    viewset = getattr(match.func, 'cls', None)
+    if viewset is None:
+        return match.view_name or match._func_path
+    method = request.method.lower()
+    actions = getattr(match.func, 'actions', None) or {}
+    return f'{viewset.__name__}.{actions.get(method, method)}'
+
+
+def count_size(content, labels):
+    size = 0
+    for chunk in content:
+        size += len(chunk)
+        yield chunk
+    registry.get_shard().observe(RESPONSE_SIZE, labels, size)
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """ Метрики запроса; должен стоять первым в MIDDLEWARE """
+
+    def process_request(self, request):
+        request._metrics_started = time.perf_counter()
+        request._metrics_timer = QueryTimer()
+        query_timer.set(request._metrics_timer)
+        # Соединения, открытые до загрузки этого модуля
+        for alias in connections:
+            install_query_timer(connections[alias])
+
+    def process_response(self, request, response):
+        timer = getattr(request, '_metrics_timer', None)
+        if timer is None:
+            return response
+        # Под WSGI контекст потока общий для его запросов
+        query_timer.set(None)
+        route = (('route', get_route(request)),)
+        shard = registry.get_shard()
+        shard.inc(REQUESTS, (
+            *route, ('method', request.method),
+            ('status', str(response.status_code)),
+        ))
+        shard.observe(
+            DURATION, route, time.perf_counter() - request._metrics_started
+        )
+        shard.observe(QUERIES, route, timer.count)
+        shard.observe(QUERY_TIME, route, timer.duration)
+        if response.streaming:
+            response.streaming_content = count_size(
+                response.streaming_content, route
+            )
+        else:
+            shard.observe(RESPONSE_SIZE, route, len(response.content))
+        registry.maybe_flush()
+        return response
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render(registry.collect()), content_type=CONTENT_TYPE
+    )
@@ -30,6 +30,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api_yamdb.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,9 +68,103 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Сколько секунд ждать блокировку записи другого процесса
+        'OPTIONS': {'timeout': 20},
+        # Тестовая БД - файл: WAL и блокировки записи как в работе
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    # Реплики только для чтения: локально - копии db.sqlite3,
+    # которые обновляет manage.py syncreplicas; в тестах - зеркала default
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica1.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+    'replica2': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica2.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+    # Шарды отзывов и комментариев: отдельные БД, в которые мигрируют
+    # только их таблицы (manage.py migrate --database shardN). Тестовые
+    # шарды - файлы, чтобы их видели рабочие процессы loadcsv --workers
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.shard1.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_db.shard1.sqlite3'},
+    },
+    'shard2': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.shard2.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_db.shard2.sqlite3'},
+    },
 }
 
+# Общий для процессов сервера кэш: версии снимков справочников и
+# индекса произведений, закрепление чтений за default после записи.
+# У LocMemCache каждый процесс свой и не видит записи других
+SHARED_CACHE_DIR = BASE_DIR / 'cache'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': SHARED_CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+}
+
+DATABASE_ROUTERS = [
+    'api_yamdb.db_routers.ReviewShardRouter',
+    'api_yamdb.db_routers.ReadReplicaRouter',
+]
+
+# Отзывы и комментарии распределяются по REVIEW_SHARDS по хешу
+# title_id; пока REVIEW_SHARDING выключен, все хранится в default.
+# Порядок шардов задает и шард произведения, и диапазон id шарда.
+REVIEW_SHARDS = ['shard1', 'shard2']
+REVIEW_SHARDING = False
+
+# SQLite: журнал WAL, чтобы чтения не ждали записи, и единственный
+# поток-писатель на процесс для записей отзывов и комментариев;
+# WRITE_QUEUE_BATCH - сколько записей фиксируется одной транзакцией
+SQLITE_WAL = True
+WRITE_QUEUE = True
+WRITE_QUEUE_BATCH = 64
+
+# Отложенная запись комментариев: ответ - после записи в журнал на
+# диске, в БД - пачками раз в COMMENT_FLUSH_INTERVAL секунд или по
+# COMMENT_FLUSH_ROWS штук. Только SQLite: id резервируются заранее.
+COMMENT_WRITE_BEHIND = False
+COMMENT_JOURNAL_DIR = BASE_DIR / 'journal'
+COMMENT_FLUSH_INTERVAL = 0.05
+COMMENT_FLUSH_ROWS = 200
+
+# Реплики, на которые уходят чтения вьюсетов; пустой список - все в default
+READ_REPLICAS = []
+
+# Сколько секунд после записи чтения пользователя идут в default
+READ_YOUR_WRITES_SECONDS = 5
+
+# Под ASGI (asgi.py включает их через окружение) чтения произведений,
+# отзывов и комментариев выполняются async-представлениями в пуле из
+# ASYNC_READ_THREADS потоков
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
+ASYNC_READ_THREADS = 16
+
+# Пакетные запросы /api/v1/batch/: сколько подзапросов в пакете и во
+# скольких потоках выполнять чтения пакета с parallel
+BATCH_MAX_REQUESTS = 20
+BATCH_THREADS = 8
+
+# Метрики /metrics: снимки процессов сохраняются в METRICS_DIR раз в
+# METRICS_FLUSH_INTERVAL секунд и складываются при чтении, в том числе
+# снимки завершившихся процессов - каталог очищают перед запуском
+# сервера. None - только метрики текущего процесса
+METRICS_DIR = BASE_DIR / 'metrics'
+METRICS_FLUSH_INTERVAL = 5
+# /metrics - только для сборщика метрик: адреса, которым он отвечает.
+# За прокси REMOTE_ADDR - адрес прокси, закройте /metrics и на нем
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
 
 # Password validation
 
@@ -116,6 +211,12 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.renderers.ColumnarRenderer',
+        'api.renderers.StreamingColumnarRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 10
 }
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_yamdb.settings')
 
 application = get_wsgi_application()
+
+if settings.COMMENT_WRITE_BEHIND:
+    # Комментарии журналов, брошенных до перезапуска, - в БД сразу,
+    # а не с первым отложенным комментарием
+    from reviews.comment_buffer import comment_buffer
+    comment_buffer.recover()
@@ -0,0 +1,290 @@
+"""
+Отложенная запись комментариев (write-behind) под всплески нагрузки.
+
+Комментарий получает id из заранее зарезервированного блока,
+дописывается в журнал процесса на диске и возвращается клиенту после
+fsync журнала. fsync групповой: один поток сбрасывает на диск записи
+всех, кто успел дописать, пока шел предыдущий fsync. В БД комментарии
+попадают пачками через поток-писатель раз в COMMENT_FLUSH_INTERVAL
+секунд или по COMMENT_FLUSH_ROWS штук, число комментариев отзывов
+пересчитывается раз на пачку.
+Журнал процесса заблокирован flock, пока процесс жив; журналы
+завершившихся процессов переигрываются при запуске сервера (wsgi.py,
+asgi.py), при запуске буфера и командой replaycomments. Вставка с
+заранее выданными id повторяема.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+from functools import partial
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api_yamdb.db_writer import writer
+from reviews.management.loading import insert_objects
+from reviews.models import Comment, Review
+
+logger = logging.getLogger(__name__)
+
+# Сколько id комментариев резервируется за раз
+ID_BLOCK = 100
+JOURNAL_SUFFIX = '.jsonl'
+
+
+def reserve_ids(alias, count):
+    """
+    Резервирует count id комментариев в БД alias, сдвигая счетчик
+    AUTOINCREMENT SQLite: обычные вставки получат id больше.
+    """
+    connection = connections[alias]
+    table = Comment._meta.db_table
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence '
+            'WHERE name = %s), 0), COALESCE((SELECT MAX(id) FROM {}), 0))'
+            .format(connection.ops.quote_name(table)), [table]
+        )
+        last = cursor.fetchone()[0]
+        cursor.execute(
+            'UPDATE sqlite_sequence SET seq = %s WHERE name = %s',
+            [last + count, table]
+        )
+        if not cursor.rowcount:
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                [table, last + count]
+            )
+    return range(last + 1, last + count + 1)
+
+
+def write_records(records):
+    """
+    Вставляет комментарии из журнала; уже записанные id и комментарии
+    к удаленным отзывам пропускаются. Пересчитывает число комментариев
+    затронутых отзывов.
+    """
+    groups = {}
+    for record in records:
+        comment = Comment(
+            pk=record['id'],
+            review_id=record['review_id'],
+            author_id=record['author_id'],
+            text=record['text'],
+            pub_date=parse_datetime(record['pub_date']),
+        )
+        groups.setdefault(
+            router.db_for_write(Comment, instance=comment), []
+        ).append(comment)
+    for alias, comments in groups.items():
+        reviews = Review.objects.db_manager(alias).filter(
+            pk__in={comment.review_id for comment in comments}
+        )
+        existing = set(reviews.values_list('pk', flat=True))
+        insert_objects(Comment, [
+            comment for comment in comments if comment.review_id in existing
+        ], ignore_conflicts=True)
+        reviews.refresh_comment_stats()
+
+
+def read_journal(journal):
+    """ Записи журнала; недописанная при сбое строка пропускается """
+    records = []
+    for line in journal:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def lock_orphan(path):
+    """
+    Открывает журнал, если его не держит живой процесс. Владелец
+    удаляет журнал до снятия блокировки, поэтому после блокировки
+    проверяется, что файл все еще лежит по этому пути.
+    """
+    try:
+        journal = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if os.stat(path).st_ino == os.fstat(journal.fileno()).st_ino:
+            return journal
+    except (BlockingIOError, FileNotFoundError):
+        pass
+    journal.close()
+    return None
+
+
+def close_journal(journal, path):
+    os.remove(path)
+    journal.close()
+
+
+class CommentBuffer:
+    """ Журнал и очередь отложенных комментариев процесса """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Порядок блокировок: flush_lock, sync_lock, lock
+        self.flush_lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pid = None
+
+    def ensure_started(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.ids = {}
+            self.pending = []
+            self.flushing = []
+            # Номер последней записи в журнал и последней сброшенной
+            self.written = 0
+            self.synced = 0
+            Path(settings.COMMENT_JOURNAL_DIR).mkdir(
+                parents=True, exist_ok=True
+            )
+            self.journal, self.journal_path = self.open_journal()
+        self.recover()
+        threading.Thread(
+            target=self.loop, name='comment-flusher', daemon=True
+        ).start()
+
+    def open_journal(self):
+        """
+        Новый журнал процесса. Блокировка берется до того, как файл
+        получает имя журнала: recover не примет его за брошенный.
+        """
+        directory = Path(settings.COMMENT_JOURNAL_DIR)
+        name = f'{os.getpid()}-{uuid.uuid4().hex}'
+        temporary = directory / f'{name}.tmp'
+        journal = open(temporary, 'ab')
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        path = directory / f'{name}{JOURNAL_SUFFIX}'
+        os.replace(temporary, path)
+        return journal, path
+
+    def next_id(self, alias):
+        pk = next(self.ids.get(alias, iter(())), None)
+        if pk is None:
+            self.ids[alias] = iter(
+                writer.run(partial(reserve_ids, alias, ID_BLOCK))
+            )
+            pk = next(self.ids[alias])
+        return pk
+
+    def add(self, comment):
+        """ Записывает комментарий в журнал; возвращает его с id и датой """
+        self.ensure_started()
+        alias = router.db_for_write(Comment, instance=comment)
+        with self.lock:
+            comment.pk = self.next_id(alias)
+            comment.pub_date = timezone.now()
+            record = {
+                'id': comment.pk,
+                'review_id': comment.review_id,
+                'author_id': comment.author_id,
+                'text': comment.text,
+                'pub_date': comment.pub_date.isoformat(),
+            }
+            self.journal.write(
+                json.dumps(record, ensure_ascii=False).encode() + b'\n'
+            )
+            self.journal.flush()
+            self.written += 1
+            position = self.written
+            self.pending.append(record)
+            full = len(self.pending) >= settings.COMMENT_FLUSH_ROWS
+        self.sync(position)
+        if full:
+            self.wake.set()
+        return comment
+
+    def sync(self, position):
+        """
+        Ждет, пока записи журнала до position не окажутся на диске.
+        Первый в очереди на sync_lock делает fsync за всех, кто успел
+        дописать к этому моменту, остальным fsync уже не нужен.
+        """
+        with self.sync_lock:
+            if self.synced >= position:
+                return
+            with self.lock:
+                journal, written = self.journal, self.written
+            os.fsync(journal.fileno())
+            self.synced = written
+
+    def loop(self):
+        while True:
+            self.wake.wait(settings.COMMENT_FLUSH_INTERVAL)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать комментарии журнала')
+
+    def flush(self):
+        """
+        Записывает накопленные комментарии одной пачкой. Журнал
+        подменяется новым, а старые удаляются только после записи.
+        """
+        with self.flush_lock:
+            with self.sync_lock:
+                with self.lock:
+                    if self.pid != os.getpid() or not self.pending:
+                        return 0
+                    records, self.pending = self.pending, []
+                    journal = self.journal
+                    self.flushing.append((self.journal, self.journal_path))
+                    self.journal, self.journal_path = self.open_journal()
+                    flushed = list(self.flushing)
+                    written = self.written
+                # Записи, которые ждут sync в старом журнале, сбрасываются
+                # здесь: дальше fsync делается только для нового
+                os.fsync(journal.fileno())
+                self.synced = written
+            try:
+                writer.run(partial(write_records, records))
+            except Exception:
+                with self.lock:
+                    self.pending[:0] = records
+                raise
+            with self.lock:
+                for item in flushed:
+                    self.flushing.remove(item)
+                    close_journal(*item)
+            return len(records)
+
+    def recover(self):
+        """
+        Переигрывает журналы, которые не заблокированы живыми
+        процессами. Возвращает число прочитанных записей.
+        """
+        directory = Path(settings.COMMENT_JOURNAL_DIR)
+        if not directory.is_dir():
+            return 0
+        recovered = 0
+        for path in sorted(directory.glob(f'*{JOURNAL_SUFFIX}')):
+            journal = lock_orphan(path)
+            if journal is None:
+                continue
+            with journal:
+                records = read_journal(journal)
+                if records:
+                    writer.run(partial(write_records, records))
+                os.remove(path)
+            recovered += len(records)
+        return recovered
+
+
+comment_buffer = CommentBuffer()
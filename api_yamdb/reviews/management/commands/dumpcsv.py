@@ -0,0 +1,164 @@
+import csv
+import gzip
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+from api_yamdb.settings import BASE_DIR
+from reviews import sharding
+from reviews.management.loading import TEST_DATA, get_model
+
+CSV = 'csv'
+JSONL = 'jsonl'
+DEFAULT_CHUNK_SIZE = 2000
+
+# Пароли, коды подтверждения и служебные флаги не выгружаются
+USER_COLUMNS = (
+    'id', 'username', 'email', 'role', 'bio', 'first_name', 'last_name'
+)
+# Производные поля пересчитываются при загрузке
+DERIVED_COLUMNS = ('rating', 'review_count', 'comment_count')
+
+
+def get_columns(table_name):
+    """ Колонки выгрузки: (имя в файле, атрибут модели) """
+    model, _ = get_model(table_name)
+    if table_name == 'users':
+        return [(name, name) for name in USER_COLUMNS]
+    return [
+        (field.name, field.attname) for field in model._meta.concrete_fields
+        if field.name not in DERIVED_COLUMNS
+    ]
+
+
+def get_filename(table_name, output_format, compress):
+    name = os.path.splitext(TEST_DATA[table_name])[0] + '.' + output_format
+    return name + '.gz' if compress else name
+
+
+def open_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', newline='', encoding='utf-8')
+    return open(path, 'w', newline='', encoding='utf-8')
+
+
+def format_csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def iter_rows(model, attnames, chunk_size):
+    """
+    Строки таблицы по возрастанию pk. Шарды читаются по очереди: их
+    диапазоны id идут в порядке REVIEW_SHARDS.
+    """
+    aliases = [None]
+    if sharding.is_sharded(model):
+        aliases = sharding.get_shards()
+    for alias in aliases:
+        yield from model.objects.db_manager(alias).order_by(
+            'pk'
+        ).values_list(*attnames).iterator(chunk_size=chunk_size)
+
+
+def dump_table(task):
+    """
+    Потоково выгружает одну таблицу: строки читаются из БД пачками
+    через iterator(chunk_size) и сразу пишутся в файл.
+    Возвращает (таблица, строк, секунд).
+    """
+    table_name, out_dir, output_format, compress, chunk_size = task
+    model, _ = get_model(table_name)
+    columns = get_columns(table_name)
+    names = [name for name, _ in columns]
+    rows = iter_rows(
+        model, [attname for _, attname in columns], chunk_size
+    )
+    path = os.path.join(
+        out_dir, get_filename(table_name, output_format, compress)
+    )
+    started = time.monotonic()
+    total = 0
+    with open_output(path, compress) as output:
+        if output_format == CSV:
+            writer = csv.writer(output)
+            writer.writerow(names)
+            for row in rows:
+                writer.writerow([format_csv_value(value) for value in row])
+                total += 1
+        else:
+            for row in rows:
+                output.write(json.dumps(
+                    dict(zip(names, row)),
+                    cls=DjangoJSONEncoder, ensure_ascii=False
+                ) + '\n')
+                total += 1
+    return table_name, total, time.monotonic() - started
+
+
+def dump_table_in_worker(task):
+    try:
+        return dump_table(task)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Dump catalog tables to .csv or .jsonl files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('out_dir', type=str)
+        parser.add_argument(
+            '--format', choices=(CSV, JSONL), default=CSV,
+            help='Формат файлов; csv повторно загружается через loadcsv'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help='Сжимать файлы gzip'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='Сколько строк читать из БД за раз'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов для параллельной выгрузки таблиц'
+        )
+
+    def handle(self, *args, **options):
+        out_dir = os.path.join(BASE_DIR, options['out_dir'])
+        os.makedirs(out_dir, exist_ok=True)
+        tasks = [
+            (table_name, out_dir, options['format'], options['gzip'],
+             options['chunk_size'])
+            for table_name in TEST_DATA
+        ]
+        if options['workers'] > 1:
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                raise CommandError('--workers требует запуска процессов fork')
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('fork')
+            ) as pool:
+                results = pool.map(dump_table_in_worker, tasks)
+                for result in results:
+                    self.report(*result)
+        else:
+            for task in tasks:
+                self.report(*dump_table(task))
+
+    def report(self, table_name, total, elapsed):
+        _, label = get_model(table_name)
+        self.stdout.write(
+            f'{label}: {total} строк за {elapsed:.1f} с '
+            f'({total / max(elapsed, 1e-6):.0f} строк/с)'
+        )
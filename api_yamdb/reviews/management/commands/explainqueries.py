@@ -0,0 +1,195 @@
+import re
+from contextlib import ExitStack
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from reviews import sharding
+from reviews.models import ADMIN, Category, Genre, Review, Title, User
+
+API = '/api/v1'
+TITLE_ORDERING = ('name', 'year', 'rating', 'review_count')
+# Просмотр таблицы SQLite целиком: без индекса или по порядку индекса
+# со чтением строк. Просмотр покрывающего индекса (COUNT(*), выборка
+# id) читает только индекс и полным не считается
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: USING INDEX \w+)?$')
+TABLE_ALIAS = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+TEMP_SORT = 'USE TEMP B-TREE'
+LIMITED = re.compile(r'\bLIMIT \d+(?: OFFSET (\d+))?$')
+# Глубокое смещение проходит таблицу до нужной страницы строка за
+# строкой, поэтому LIMIT освобождает от проверки только первые страницы
+MAX_LIMIT_OFFSET = 100
+
+
+def get_admin():
+    """ Администратор для запросов; без него - несохраненный """
+    admin = User.objects.filter(role=ADMIN).order_by('pk').first()
+    return admin or User(username='explain', role=ADMIN, is_superuser=True)
+
+
+def get_title_endpoints():
+    title = Title.objects.order_by('-review_count').first()
+    if title is None:
+        return []
+    url = f'{API}/titles/'
+    endpoints = [url, f'{url}{title.pk}/', f'{url}?facets=true',
+                 f'{url}?sideload=true', f'{url}?name={quote(title.name)}']
+    endpoints += [f'{url}?ordering={prefix}{field}'
+                  for field in TITLE_ORDERING for prefix in ('', '-')]
+    if title.year is not None:
+        endpoints.append(f'{url}?year={title.year}')
+    genre = Genre.objects.order_by('pk').first()
+    category = Category.objects.order_by('pk').first()
+    if genre is not None:
+        endpoints.append(f'{url}?genre={genre.slug}')
+    if category is not None:
+        endpoints.append(f'{url}?category={category.slug}')
+    return endpoints + get_review_endpoints(title)
+
+
+def get_review_endpoints(title):
+    url = f'{API}/titles/{title.pk}/reviews/'
+    review = Review.objects.for_title(title.pk).order_by(
+        '-comment_count'
+    ).first()
+    if review is None:
+        return [url]
+    comments = f'{url}{review.pk}/comments/'
+    endpoints = [url, f'{url}{review.pk}/', comments]
+    comment = review.comments.order_by('pk').first()
+    if comment is not None:
+        endpoints.append(f'{comments}{comment.pk}/')
+    return endpoints
+
+
+def get_endpoints(admin):
+    """ GET-адреса эндпоинтов чтения на примерах объектов из БД """
+    endpoints = [
+        f'{API}/categories/', f'{API}/genres/', f'{API}/users/',
+        f'{API}/reviews/',
+    ]
+    if admin.pk is not None:
+        endpoints += [
+            f'{API}/users/me/', f'{API}/users/{admin.username}/',
+            f'{API}/reviews/?author={admin.username}',
+        ]
+    return endpoints + get_title_endpoints()
+
+
+def get_read_aliases():
+    """ БД, которые могут обслуживать запросы: default, реплики, шарды """
+    return [
+        DEFAULT_DB_ALIAS, *settings.READ_REPLICAS, *sharding.get_shards()
+    ]
+
+
+def capture_queries(client, url):
+    """
+    Код ответа и различные SELECT запроса: (алиас БД, SQL). Первый
+    запрос прогревает кэши процесса (справочники, индекс произведений),
+    учитывается повторный.
+    """
+    client.get(url)
+    with ExitStack() as stack:
+        contexts = {
+            alias: stack.enter_context(
+                CaptureQueriesContext(connections[alias])
+            )
+            for alias in get_read_aliases()
+        }
+        status = client.get(url).status_code
+    queries = []
+    for alias, context in contexts.items():
+        for query in context.captured_queries:
+            item = (alias, query['sql'])
+            if query['sql'].startswith('SELECT') and item not in queries:
+                queries.append(item)
+    return status, queries
+
+
+def explain(alias, sql):
+    """ Шаги плана запроса SQLite """
+    with connections[alias].cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[3] for row in cursor.fetchall()]
+
+
+def find_full_scans(sql, details):
+    """
+    Таблицы, которые план запроса просматривает целиком. Просмотр
+    под LIMIT без сортировки во временном дереве и без OFFSET больше
+    MAX_LIMIT_OFFSET останавливается на странице и не считается полным.
+    """
+    limited = LIMITED.search(sql)
+    if (
+        limited and int(limited[1] or 0) <= MAX_LIMIT_OFFSET
+        and not any(detail.startswith(TEMP_SORT) for detail in details)
+    ):
+        return []
+    tables = dict((name, table) for table, name in TABLE_ALIAS.findall(sql))
+    return [
+        tables.get(match[1], match[1])
+        for match in map(FULL_SCAN.match, details) if match
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Run EXPLAIN QUERY PLAN for the queries of every read endpoint '
+        'and fail on full scans of large tables'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='С какого числа строк таблица считается большой'
+        )
+
+    def handle(self, *args, **options):
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError('Планы запросов разбираются только для SQLite')
+        self.min_rows = options['min_rows']
+        self.verbosity = options['verbosity']
+        self.sizes = {}
+        client = APIClient()
+        admin = get_admin()
+        client.force_authenticate(admin)
+        problems = 0
+        for url in get_endpoints(admin):
+            status, queries = capture_queries(client, url)
+            self.stdout.write(f'GET {url}: {status}, запросов {len(queries)}')
+            for alias, sql in queries:
+                problems += self.report(alias, sql)
+        if problems:
+            raise CommandError(f'Полных просмотров больших таблиц: {problems}')
+        self.stdout.write('Полных просмотров больших таблиц нет')
+
+    def report(self, alias, sql):
+        details = explain(alias, sql)
+        if self.verbosity > 1:
+            self.stdout.write(f'  {alias}: {sql}')
+            for detail in details:
+                self.stdout.write(f'    {detail}')
+        problems = 0
+        for table in find_full_scans(sql, details):
+            rows = self.count_rows(alias, table)
+            if rows >= self.min_rows:
+                self.stdout.write(
+                    f'  {alias}: полный просмотр {table} ({rows} строк): {sql}'
+                )
+                problems += 1
+        return problems
+
+    def count_rows(self, alias, table):
+        if (alias, table) not in self.sizes:
+            connection = connections[alias]
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM {}'.format(
+                    connection.ops.quote_name(table)
+                ))
+                self.sizes[alias, table] = cursor.fetchone()[0]
+        return self.sizes[alias, table]
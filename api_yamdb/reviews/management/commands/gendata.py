@@ -0,0 +1,326 @@
+import csv
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api_yamdb.settings import BASE_DIR
+from reviews.management.loading import (
+    TEST_DATA, assign_shard_id, get_attnames, get_model, insert_objects
+)
+from reviews.signals import bulk_loaded
+
+SCALES = {
+    'small': {'users': 200, 'titles': 500, 'reviews': 5_000},
+    'medium': {'users': 5_000, 'titles': 20_000, 'reviews': 200_000},
+    'large': {'users': 50_000, 'titles': 100_000, 'reviews': 2_000_000},
+    'production': {
+        'users': 1_000_000, 'titles': 200_000, 'reviews': 50_000_000
+    },
+}
+
+# Колонки совпадают с файлами static/data, чтобы их читал loadcsv
+COLUMNS = {
+    'users': (
+        'id', 'username', 'email', 'role', 'bio', 'first_name', 'last_name'
+    ),
+    'category': ('id', 'name', 'slug'),
+    'genre': ('id', 'name', 'slug'),
+    'titles': ('id', 'name', 'year', 'description', 'category'),
+    'genre_title': ('id', 'title_id', 'genre_id'),
+    'review': ('id', 'title_id', 'text', 'author', 'score', 'pub_date'),
+    'comments': ('id', 'review_id', 'text', 'author', 'pub_date'),
+}
+
+CATEGORIES = (
+    'Фильмы', 'Книги', 'Музыка', 'Сериалы', 'Игры', 'Спектакли',
+    'Комиксы', 'Подкасты',
+)
+GENRES = (
+    'Драма', 'Комедия', 'Вестерн', 'Фэнтези', 'Фантастика', 'Детектив',
+    'Триллер', 'Сказка', 'Гонзо', 'Ужасы', 'Роман', 'Рок', 'Артхаус',
+    'Классика', 'Шансон', 'Джаз', 'Поп', 'Документальное', 'Мелодрама',
+    'Боевик', 'Приключения', 'Мюзикл', 'Нуар', 'Аниме', 'Биография',
+)
+WORDS = (
+    'тайна', 'последний', 'город', 'ночь', 'дорога', 'север', 'сердце',
+    'звезда', 'остров', 'память', 'тень', 'огонь', 'весна', 'река',
+    'сон', 'ветер', 'дом', 'время', 'голос', 'море', 'лес', 'небо',
+)
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Юлия')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов')
+REVIEW_TEXTS = (
+    'Сильная вещь, пересматривал дважды.', 'Середина, ничего нового.',
+    'Скучно и затянуто.', 'Лучшее, что я видел в этом году!',
+    'Хорошо, но финал слабый.', 'Не понравилось совсем.',
+)
+COMMENT_TEXTS = (
+    'Согласен!', 'Совсем не так.', 'Спорно, но интересно.',
+    'А мне понравилось.', 'Спасибо за отзыв.',
+)
+START_DATE = datetime(2015, 1, 1, tzinfo=timezone.utc)
+DATE_SPAN_SECONDS = 8 * 365 * 24 * 3600
+REPORT_EVERY = 100_000
+
+
+class CsvSink:
+    """
+    Пишет строки таблицы в csv-файл с именем из TEST_DATA. add
+    возвращает id строки в файле.
+    """
+
+    def __init__(self, out_dir, table_name):
+        self.table_name = table_name
+        self.count = 0
+        self._file = open(
+            os.path.join(out_dir, TEST_DATA[table_name]),
+            'w', newline='', encoding='utf-8'
+        )
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS[table_name])
+
+    def add(self, row):
+        self._writer.writerow([
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in row
+        ])
+        self.count += 1
+        return row[0]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._file.close()
+
+
+class DbSink:
+    """
+    Вставляет строки пачками через insert_objects, поэтому pub_date
+    сохраняется сгенерированный, а не текущий. Все пачки пишутся в одной
+    транзакции. add возвращает id строки в БД: при шардировании id
+    отзывов и комментариев переносятся в диапазоны их шардов.
+    """
+
+    def __init__(self, table_name, batch_size):
+        self.table_name = table_name
+        self.count = 0
+        self.model, _ = get_model(table_name)
+        self.batch_size = batch_size
+        self.attnames = list(
+            get_attnames(self.model, COLUMNS[table_name]).values()
+        )
+        self._batch = []
+
+    def add(self, row):
+        values = dict(zip(self.attnames, row))
+        assign_shard_id(self.model, values)
+        obj = self.model(**values)
+        self._batch.append(obj)
+        self.count += 1
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+        return obj.pk
+
+    def flush(self):
+        insert_objects(self.model, self._batch)
+        self._batch = []
+
+    def close(self):
+        self.flush()
+
+
+class Generator:
+    """
+    Детерминированный генератор каталога: при одном seed и тех же
+    размерах получаются одни и те же строки. Популярность произведений
+    распределена по Ципфу, у одного автора не больше одного отзыва на
+    произведение.
+    """
+
+    def __init__(self, seed, users, titles, reviews, comments_per_review,
+                 zipf_s, today=None):
+        self.rng = random.Random(seed)
+        self.users = users
+        self.titles = titles
+        self.reviews = reviews
+        self.comments_per_review = comments_per_review
+        self.zipf_s = zipf_s
+        self.max_year = (today or datetime.now(timezone.utc)).year
+
+    def random_date(self, after=None):
+        start = after or START_DATE
+        span = DATE_SPAN_SECONDS if after is None else 30 * 24 * 3600
+        return start + timedelta(seconds=self.rng.randrange(span))
+
+    def gen_users(self, sink):
+        for pk in range(1, self.users + 1):
+            roll = self.rng.random()
+            role = 'admin' if roll < 0.001 else (
+                'moderator' if roll < 0.01 else 'user'
+            )
+            sink.add((
+                pk, f'user{pk}', f'user{pk}@yamdb.fake', role, '',
+                self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES),
+            ))
+
+    def gen_catalog(self, category_sink, genre_sink):
+        for pk, name in enumerate(CATEGORIES, 1):
+            category_sink.add((pk, name, f'category-{pk}'))
+        for pk, name in enumerate(GENRES, 1):
+            genre_sink.add((pk, name, f'genre-{pk}'))
+
+    def gen_titles(self, title_sink, genre_title_sink):
+        link_id = 0
+        for pk in range(1, self.titles + 1):
+            name = ' '.join(self.rng.sample(WORDS, 2)).capitalize()
+            title_sink.add((
+                pk, f'{name} {pk}', self.rng.randint(1900, self.max_year),
+                '', self.rng.randint(1, len(CATEGORIES)),
+            ))
+            for genre_id in sorted(self.rng.sample(
+                range(1, len(GENRES) + 1), self.rng.randint(1, 3)
+            )):
+                link_id += 1
+                genre_title_sink.add((link_id, pk, genre_id))
+
+    def review_counts(self):
+        """
+        Число отзывов на каждое произведение по закону Ципфа.
+        Ранги перемешаны, чтобы популярные произведения не шли по id
+        подряд. На произведение не больше отзывов, чем пользователей,
+        излишек делится между менее популярными.
+        """
+        weights = [1 / rank ** self.zipf_s
+                   for rank in range(1, self.titles + 1)]
+        left_weight = sum(weights)
+        left = self.reviews
+        title_ids = list(range(1, self.titles + 1))
+        self.rng.shuffle(title_ids)
+        counts = {}
+        for title_id, weight in zip(title_ids, weights):
+            count = min(self.users, left, round(left * weight / left_weight))
+            counts[title_id] = count
+            left -= count
+            left_weight -= weight
+        return counts
+
+    def comment_count(self):
+        """
+        Число комментариев отзыва: геометрическое распределение на
+        0, 1, 2... со средним comments_per_review (q = m / (1 + m)).
+        """
+        if not self.comments_per_review:
+            return 0
+        q = self.comments_per_review / (1 + self.comments_per_review)
+        return int(math.log(1 - self.rng.random()) / math.log(q))
+
+    def gen_reviews(self, review_sink, comment_sink, report):
+        counts = self.review_counts()
+        review_id = comment_id = 0
+        for title_id in range(1, self.titles + 1):
+            quality = self.rng.uniform(3, 9)
+            for author in self.rng.sample(
+                range(1, self.users + 1), counts[title_id]
+            ):
+                review_id += 1
+                pub_date = self.random_date()
+                score = min(10, max(1, round(self.rng.gauss(quality, 1.5))))
+                stored_id = review_sink.add((
+                    review_id, title_id, self.rng.choice(REVIEW_TEXTS),
+                    author, score, pub_date,
+                ))
+                for _ in range(self.comment_count()):
+                    comment_id += 1
+                    comment_sink.add((
+                        comment_id, stored_id,
+                        self.rng.choice(COMMENT_TEXTS),
+                        self.rng.randint(1, self.users),
+                        self.random_date(after=pub_date),
+                    ))
+                if review_id % REPORT_EVERY == 0:
+                    report(review_id, comment_id)
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible synthetic catalog for scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', choices=SCALES, default='small',
+            help='Готовый набор размеров; отдельные параметры его уточняют'
+        )
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--titles', type=int)
+        parser.add_argument('--reviews', type=int)
+        parser.add_argument(
+            '--comments-per-review', type=float, default=0.5,
+            help='Среднее число комментариев на отзыв'
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа популярности произведений'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--output', type=str, default=None,
+            help='Каталог для csv в формате loadcsv; без него запись в БД'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        sizes = dict(SCALES[options['scale']])
+        for name in sizes:
+            if options[name] is not None:
+                sizes[name] = options[name]
+        if min(sizes.values()) < 1:
+            raise CommandError('Размеры должны быть положительными')
+        generator = Generator(
+            options['seed'], sizes['users'], sizes['titles'],
+            sizes['reviews'], options['comments_per_review'], options['zipf']
+        )
+        if options['output']:
+            out_dir = os.path.join(BASE_DIR, options['output'])
+            os.makedirs(out_dir, exist_ok=True)
+            sinks = {table: CsvSink(out_dir, table) for table in TEST_DATA}
+        else:
+            sinks = {
+                table: DbSink(table, options['batch_size'])
+                for table in TEST_DATA
+            }
+        started = time.monotonic()
+
+        def report(reviews, comments):
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'\rотзывов {reviews}, комментариев {comments} '
+                f'({(reviews + comments) / elapsed:.0f} строк/с)', ending=''
+            )
+            self.stdout.flush()
+
+        with transaction.atomic():
+            generator.gen_users(sinks['users'])
+            generator.gen_catalog(sinks['category'], sinks['genre'])
+            sinks['users'].flush()
+            sinks['category'].flush()
+            sinks['genre'].flush()
+            generator.gen_titles(sinks['titles'], sinks['genre_title'])
+            sinks['titles'].flush()
+            sinks['genre_title'].flush()
+            generator.gen_reviews(sinks['review'], sinks['comments'], report)
+            for sink in sinks.values():
+                sink.close()
+        if not options['output']:
+            bulk_loaded.send(sender=self.__class__, models=[
+                get_model(table)[0] for table in TEST_DATA
+            ])
+        self.stdout.write('')
+        for table, sink in sinks.items():
+            self.stdout.write(f'  {table}: {sink.count}')
+        self.stdout.write(
+            f'Готово за {time.monotonic() - started:.1f} с'
+        )
@@ -0,0 +1,74 @@
+import gzip
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api_yamdb.settings import BASE_DIR
+from reviews.management.importing import ReviewImporter
+from reviews.management.loading import DEFAULT_BATCH_SIZE
+
+REJECTED_SUFFIX = '.rejected.jsonl'
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+class Command(BaseCommand):
+    help = 'Import reviews from a .jsonl file (one review per line)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', type=str,
+            help='Файл .jsonl или .jsonl.gz; "-" - читать stdin'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Сколько строк обрабатывать и вставлять за раз'
+        )
+        parser.add_argument(
+            '--rejects', type=str, default=None,
+            help='Файл отклоненных строк, по умолчанию '
+                 f'<path>{REJECTED_SUFFIX}'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path != '-':
+            path = os.path.join(BASE_DIR, path)
+            if not os.path.exists(path):
+                raise CommandError(f'Файл {path} не найден')
+        rejects_path = options['rejects'] or (
+            (path if path != '-' else 'stdin') + REJECTED_SUFFIX
+        )
+        rejects_file = None
+
+        def write_reject(line_number, line, error):
+            nonlocal rejects_file
+            if rejects_file is None:
+                rejects_file = open(rejects_path, 'w', encoding='utf-8')
+            rejects_file.write(json.dumps(
+                {'line': line_number, 'error': error, 'record': line},
+                ensure_ascii=False
+            ) + '\n')
+
+        importer = ReviewImporter(options['batch_size'], write_reject)
+        try:
+            with open_input(path) as lines:
+                result = importer.run(lines)
+        finally:
+            if rejects_file is not None:
+                rejects_file.close()
+        self.stdout.write(
+            f'Отзывов загружено: {result["imported"]}, '
+            f'повторов пропущено: {result["duplicates"]}, '
+            f'отклонено: {result["rejected"]}'
+        )
+        if rejects_file is not None:
+            self.stdout.write(f'Отклоненные строки: {rejects_path}')
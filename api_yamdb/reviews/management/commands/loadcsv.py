@@ -1,76 +1,262 @@
-import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
 
 from api_yamdb.settings import BASE_DIR
-from reviews.models import (
-    User, Category, Genre, GenreTitle, Title, Review, Comment
+from reviews.management.loading import (
+    DEFAULT_BATCH_SIZE, REJECTED_SUFFIX, TEST_DATA, ForeignKeyValidator,
+    RejectWriter, batches, dependency_graph, file_checksum, get_model,
+    insert_objects, load_range, merge_rejects, read_rows, split_ranges,
+    upsert_batch
 )
+from reviews.models import LoadManifest
+from reviews.signals import bulk_loaded
 
-TEST_DATA = {
-    'users': 'users.csv',
-    'category': 'category.csv',
-    'genre': 'genre.csv',
-    'titles': 'titles.csv',
-    'genre_title': 'genre_title.csv',
-    'review': 'review.csv',
-    'comments': 'comments.csv',
-}
+DEFAULT_SPLIT_SIZE_MB = 64
 
 
 class Command(BaseCommand):
     help = 'Load test data from .csv file'
 
-    def load_csv(self, filename, table_name):
-        if table_name == 'users':
-            model = User
-            label = "Пользователь"
-        elif table_name == 'category':
-            model = Category
-            label = "Категория"
-        elif table_name == 'genre':
-            model = Genre
-            label = "Жанр"
-        elif table_name == 'titles':
-            model = Title
-            label = "Произведение"
-        elif table_name == 'genre_title':
-            model = GenreTitle
-            label = "Жанр-Произведение"
-        elif table_name == 'review':
-            model = Review
-            label = "Отзыв"
-        elif table_name == 'comments':
-            model = Comment
-            label = "Комментарий"
-        else:
-            raise KeyError(f'Неизвестное имя таблицы {table_name}')
-        with open(filename, 'r', newline='') as csvfile:
-            data_fields = next(csvfile).replace(
-                '\r', '').replace('\n', '').replace(
-                    '^category$', 'category_id').replace(
-                        '^author$', 'author_id').replace(
-                            '^title$', 'title_id'
-            ).split(',')
-            reader = csv.reader(csvfile, delimiter=',')
-            for row in reader:
-                data_obj = dict(zip(data_fields, row))
-                model.objects.create(**data_obj)
-                print(f'Объект {label} = {data_obj} успешно создан!')
+    def load_csv(self, rows, table_name):
+        model, label = get_model(table_name)
+        total = 0
+        for data_obj in rows:
+            model.objects.create(**data_obj)
+            total += 1
+            print(f'Объект {label} = {data_obj} успешно создан!')
+        return total
+
+    def bulk_load_csv(self, rows, table_name, batch_size):
+        """
+        Загружает таблицу пачками через insert_objects в одной транзакции:
+        без pre_save, поэтому pub_date берется из файла.
+        В памяти одновременно держится не больше одной пачки.
+        Вместо вывода каждой строки печатает строку прогресса.
+        Возвращает число загруженных строк.
+        """
+        model, label = get_model(table_name)
+        started = time.monotonic()
+        total = 0
+        with transaction.atomic():
+            for batch in batches(rows, batch_size):
+                insert_objects(model, [model(**values) for values in batch])
+                total += len(batch)
+                self.write_progress(label, total, started)
+        self.write_progress(label, total, started, ending='\n')
+        return total
+
+    def upsert_csv(self, rows, table_name, batch_size):
+        """
+        Инкрементальная загрузка: строки сверяются с БД по первичному
+        ключу, вставляются только новые и обновляются только изменившиеся.
+        Возвращает (добавлено и обновлено, всего строк).
+        """
+        model, label = get_model(table_name)
+        created = updated = total = 0
+        for batch in batches(rows, batch_size):
+            batch_created, batch_updated = upsert_batch(model, batch)
+            created += batch_created
+            updated += batch_updated
+            total += len(batch)
+        self.stdout.write(
+            f'{label}: новых {created}, обновлено {updated}, '
+            f'без изменений {total - created - updated}'
+        )
+        return created + updated, total
+
+    def write_progress(self, label, total, started, ending=''):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'\r{label}: {total} строк за {elapsed:.1f} с '
+            f'({total / elapsed:.0f} строк/с)',
+            ending=ending
+        )
+        self.stdout.flush()
 
     def add_arguments(self, parser):
         parser.add_argument('csv_dir', nargs='+', type=str)
+        parser.add_argument(
+            '--bulk', action='store_true',
+            help='Загружать пачками в одной транзакции'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Размер пачки для --bulk'
+        )
+        parser.add_argument(
+            '--rejects-dir', type=str, default=None,
+            help='Куда писать отклоненные строки '
+                 f'(<таблица>{REJECTED_SUFFIX}), по умолчанию в каталог csv'
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Пропускать файлы с прежней контрольной суммой, остальные '
+                 'строки добавлять или обновлять по первичному ключу'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число рабочих процессов; больше 1 - независимые таблицы '
+                 'и части больших файлов грузятся параллельно (как --bulk)'
+        )
+        parser.add_argument(
+            '--split-size', type=float, default=DEFAULT_SPLIT_SIZE_MB,
+            help='Размер части файла в Мб для параллельного разбора'
+        )
+
+    def get_rejects_path(self, data_dir, table_name, options, part=None):
+        name = table_name if part is None else f'{table_name}.part{part}'
+        return os.path.join(
+            options['rejects_dir'] or data_dir, name + REJECTED_SUFFIX
+        )
+
+    def load_table(self, csv_dir, table_name, validator, options):
+        """ Загружает одну таблицу, возвращает (загружено, отклонено) """
+        model, label = get_model(table_name)
+        data_dir = os.path.join(BASE_DIR, csv_dir)
+        path = os.path.join(data_dir, TEST_DATA[table_name])
+        if options['incremental']:
+            checksum = file_checksum(path)
+            if LoadManifest.objects.filter(
+                path=os.path.abspath(path), checksum=checksum
+            ).exists():
+                self.stdout.write(f'{label}: файл не изменился, пропущен')
+                return 0, 0
+        rejects = RejectWriter(
+            self.get_rejects_path(data_dir, table_name, options)
+        )
+        with open(path, 'r', newline='', encoding='utf-8') as csvfile:
+            rows = read_rows(csvfile, model, validator, rejects)
+            try:
+                if options['incremental']:
+                    with transaction.atomic():
+                        loaded, total = self.upsert_csv(
+                            rows, table_name, options['batch_size']
+                        )
+                        LoadManifest.objects.update_or_create(
+                            path=os.path.abspath(path),
+                            defaults={'checksum': checksum, 'rows': total},
+                        )
+                elif options['bulk']:
+                    loaded = self.bulk_load_csv(
+                        rows, table_name, options['batch_size']
+                    )
+                else:
+                    loaded = self.load_csv(rows, table_name)
+            finally:
+                rejects.close()
+        validator.forget(model)
+        return loaded, rejects.count
+
+    def plan_table(self, csv_dir, table_name, options):
+        """ Задачи load_range для всех частей файла таблицы """
+        data_dir = os.path.join(BASE_DIR, csv_dir)
+        path = os.path.join(data_dir, TEST_DATA[table_name])
+        fieldnames, ranges = split_ranges(
+            path, int(options['split_size'] * 1024 * 1024)
+        )
+        return [
+            (table_name, path, fieldnames, start, end, options['batch_size'],
+             self.get_rejects_path(data_dir, table_name, options, part))
+            for part, (start, end) in enumerate(ranges)
+        ]
+
+    def load_parallel(self, csv_dir, options):
+        """
+        Загружает таблицы каталога в пуле процессов. Таблица ставится в
+        очередь, когда загружены все таблицы, на которые она ссылается;
+        большой файл делится на части, которые разбираются параллельно.
+        """
+        pending = dependency_graph(list(TEST_DATA))
+        done = set()
+        running = {}
+        tables = {}
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('--workers требует запуска процессов fork')
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=context
+        ) as pool:
+            while pending or running:
+                for table_name in [
+                    table for table, deps in pending.items() if deps <= done
+                ]:
+                    del pending[table_name]
+                    tasks = self.plan_table(csv_dir, table_name, options)
+                    tables[table_name] = {
+                        'started': time.monotonic(), 'left': len(tasks),
+                        'loaded': 0, 'rejected': 0,
+                        'parts': [task[-1] for task in tasks],
+                    }
+                    for task in tasks:
+                        running[pool.submit(load_range, task)] = table_name
+                    if not tasks:
+                        done.add(table_name)
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    table_name = running.pop(future)
+                    state = tables[table_name]
+                    loaded, rejected = future.result()
+                    state['loaded'] += loaded
+                    state['rejected'] += rejected
+                    state['left'] -= 1
+                    if not state['left']:
+                        self.finish_table(csv_dir, table_name, state, options)
+                        done.add(table_name)
+        return {
+            table: (state['loaded'], state['rejected'])
+            for table, state in tables.items()
+        }
+
+    def finish_table(self, csv_dir, table_name, state, options):
+        _, label = get_model(table_name)
+        if len(state['parts']) > 1:
+            merge_rejects(state['parts'], self.get_rejects_path(
+                os.path.join(BASE_DIR, csv_dir), table_name, options
+            ))
+        elapsed = max(time.monotonic() - state['started'], 1e-6)
+        self.stdout.write(
+            f'{label}: {state["loaded"]} строк за {elapsed:.1f} с '
+            f'({state["loaded"] / elapsed:.0f} строк/с, '
+            f'частей: {len(state["parts"])})'
+        )
 
     def handle(self, *args, **options):
         csv_dirs = options['csv_dir']
+        parallel = options['workers'] > 1
+        if parallel and options['incremental']:
+            raise CommandError('--incremental не совместим с --workers')
+        totals = {}
+        validator = ForeignKeyValidator()
         try:
             for csv_dir in csv_dirs:
-                for test_data_table in TEST_DATA:
-                    test_data_file = TEST_DATA[test_data_table]
-                    csv_path = (str(BASE_DIR)
-                                + '/' + csv_dir
-                                + '/' + test_data_file)
-                    self.load_csv(csv_path, test_data_table)
+                if parallel:
+                    results = self.load_parallel(csv_dir, options)
+                else:
+                    results = {
+                        table: self.load_table(
+                            csv_dir, table, validator, options
+                        ) for table in TEST_DATA
+                    }
+                for table, (loaded, rejected) in results.items():
+                    total = totals.get(table, (0, 0))
+                    totals[table] = (total[0] + loaded, total[1] + rejected)
         except CommandError:
             raise CommandError('Ошибка при загрузке данных'
                                f'из файлов csv в каталоге {csv_dir}!')
+        if options['bulk'] or options['incremental'] or parallel:
+            bulk_loaded.send(sender=self.__class__, models=[
+                get_model(table)[0]
+                for table, (loaded, _) in totals.items() if loaded
+            ])
+        self.stdout.write('Итого загружено строк:')
+        for table, (loaded, rejected) in totals.items():
+            line = f'  {table}: {loaded}'
+            if rejected:
+                line += f', отклонено {rejected}'
+            self.stdout.write(line)
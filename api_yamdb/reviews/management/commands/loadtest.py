@@ -0,0 +1,174 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+)
+
+from reviews.management.load import (
+    Report, percentile, run_process, run_users
+)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    """ Сервер приложения в потоке этого процесса: его адрес и сервер """
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+    server.set_app(get_internal_wsgi_application())
+    # Ответы 4xx/5xx и так попадают в отчет; импорт wsgi-модуля
+    # заново настраивает логирование, поэтому уровень задается после
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the API with closed-loop virtual users and report '
+        'throughput, latency percentiles and errors over time'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного проекта; без него сервер '
+                 'запускается в этом процессе'
+        )
+        parser.add_argument(
+            '--users', type=int, default=10,
+            help='Число виртуальных пользователей'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=0,
+            help='Распределить пользователей по процессам (fork); '
+                 '0 - потоки этого процесса'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность, секунд'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Период отчета, секунд'
+        )
+        parser.add_argument(
+            '--think', type=float, default=0,
+            help='Средняя пауза пользователя между запросами, секунд'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def start_workers(self, url, deadline, options):
+        """ Очередь результатов и потоки или процессы пользователей """
+        run_id = uuid.uuid4().hex[:8]
+        users = [
+            (f'load{run_id}u{index}', options['seed'] + index)
+            for index in range(options['users'])
+        ]
+        arguments = (deadline, options['think'])
+        if not options['processes']:
+            results = queue.Queue()
+            worker = threading.Thread(
+                target=run_users, args=(url, results, *arguments, users),
+                daemon=True
+            )
+            worker.start()
+            return results, [worker]
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [
+            context.Process(target=run_process, args=(
+                url, results, *arguments,
+                users[index::options['processes']]
+            ), daemon=True)
+            for index in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        return results, workers
+
+    def write_window(self, elapsed, window, interval):
+        if not window:
+            self.stdout.write(f'{elapsed:>7.1f}s  запросов нет')
+            return
+        latencies = [latency * 1000 for latency, _ in window]
+        errors = sum(failed for _, failed in window)
+        self.stdout.write(
+            f'{elapsed:>7.1f}s {len(window) / interval:>9.1f} req/s  '
+            f'p50 {percentile(latencies, 0.5):>8.1f}  '
+            f'p95 {percentile(latencies, 0.95):>8.1f}  '
+            f'p99 {percentile(latencies, 0.99):>8.1f} мс  '
+            f'ошибок {errors} ({100 * errors / len(window):.1f}%)'
+        )
+
+    def write_summary(self, report, elapsed):
+        self.stdout.write(
+            f'\nВсего {report.total} запросов за {elapsed:.1f} с: '
+            f'{report.total / elapsed:.1f} req/s'
+        )
+        self.stdout.write(
+            f'{"действие":<14} {"запросов":>9} {"ошибок":>7} '
+            f'{"p50":>8} {"p95":>8} {"p99":>8}'
+        )
+        for action, latencies in sorted(report.latencies.items()):
+            latencies = [latency * 1000 for latency in latencies]
+            self.stdout.write(
+                f'{action:<14} {len(latencies):>9} '
+                f'{report.count_errors(action):>7} '
+                f'{percentile(latencies, 0.5):>8.1f} '
+                f'{percentile(latencies, 0.95):>8.1f} '
+                f'{percentile(latencies, 0.99):>8.1f}'
+            )
+        for (action, status), count in sorted(report.errors.items()):
+            self.stdout.write(f'  {action}: код {status or "-"} x{count}')
+
+    def collect(self, results, workers, started, interval):
+        """ Читает результаты, пока работают пользователи """
+        report = Report()
+        next_report = started + interval
+        while True:
+            alive = any(worker.is_alive() for worker in workers)
+            try:
+                report.add(results.get(timeout=0.1))
+            except queue.Empty:
+                if not alive:
+                    break
+            if time.time() >= next_report:
+                self.write_window(
+                    next_report - started, report.take_window(), interval
+                )
+                next_report += interval
+        return report
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['processes'] < 0:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        server = None
+        url = options['url']
+        if url is None:
+            url, server = start_server()
+        self.stdout.write(
+            f'{options["users"]} пользователей, {url}, '
+            f'{options["duration"]:.0f} с'
+        )
+        started = time.time()
+        try:
+            results, workers = self.start_workers(
+                url, started + options['duration'], options
+            )
+            report = self.collect(
+                results, workers, started, options['interval']
+            )
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+        self.write_summary(report, time.time() - started)
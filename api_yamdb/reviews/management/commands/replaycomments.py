@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from reviews.comment_buffer import comment_buffer
+
+
+class Command(BaseCommand):
+    help = 'Write comments from journals left by stopped processes'
+
+    def handle(self, *args, **options):
+        recovered = comment_buffer.recover()
+        self.stdout.write(f'Комментариев из журналов: {recovered}')
@@ -0,0 +1,36 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the default SQLite database to the read replica files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Алиасы реплик, по умолчанию все из READ_REPLICAS'
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.READ_REPLICAS
+        if not aliases:
+            raise CommandError('Реплики не указаны и READ_REPLICAS пуст')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Копирование поддерживается только для SQLite')
+        primary.ensure_connection()
+        for alias in aliases:
+            if alias not in settings.DATABASES or alias == DEFAULT_DB_ALIAS:
+                raise CommandError(f'Неизвестная реплика {alias}')
+            connections[alias].close()
+            target = sqlite3.connect(str(settings.DATABASES[alias]['NAME']))
+            try:
+                # Резервное копирование SQLite целиком переносит схему
+                # и данные, не блокируя основную БД на все время копии
+                primary.connection.backup(target, pages=1024)
+            finally:
+                target.close()
+            self.stdout.write(f'{alias}: скопировано')
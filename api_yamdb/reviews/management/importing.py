@@ -0,0 +1,171 @@
+import json
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from reviews.management.loading import (
+    DEFAULT_BATCH_SIZE, IdSet, batches, insert_objects
+)
+from reviews.models import Review, Title, User
+
+REVIEW_TEXT_MAX_LENGTH = Review._meta.get_field('text').max_length
+STATS_BATCH_SIZE = 500
+
+
+def clean_review(record):
+    """
+    Проверяет запись JSONL отзыва:
+    {"title_id": 1, "author": "username", "text": "...", "score": 7,
+     "pub_date": "2021-01-01T00:00:00Z"}, pub_date необязателен.
+    Возвращает кортеж значений или бросает ValueError.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('ожидается объект JSON')
+    title_id = record.get('title_id', record.get('title'))
+    if not isinstance(title_id, int) or isinstance(title_id, bool):
+        raise ValueError('title_id должен быть целым числом')
+    author = record.get('author')
+    if not isinstance(author, str) or not author:
+        raise ValueError('не указан author')
+    text = record.get('text')
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError('не указан text')
+    if len(text) > REVIEW_TEXT_MAX_LENGTH:
+        raise ValueError(
+            f'text длиннее {REVIEW_TEXT_MAX_LENGTH} символов'
+        )
+    score = record.get('score')
+    if (not isinstance(score, int) or isinstance(score, bool)
+            or not 1 <= score <= 10):
+        raise ValueError('score должен быть целым числом от 1 до 10')
+    pub_date = record.get('pub_date')
+    if pub_date is not None:
+        pub_date = parse_datetime(str(pub_date))
+        if pub_date is None:
+            raise ValueError('pub_date не является датой ISO 8601')
+        if timezone.is_naive(pub_date):
+            pub_date = timezone.make_aware(pub_date, timezone.utc)
+    return title_id, author, text, score, pub_date
+
+
+class ReviewImporter:
+    """
+    Потоковый импорт отзывов из JSONL. Строки разбираются по одной,
+    пачки по batch_size записей: авторы и произведения пачки ищутся
+    двумя запросами, повторы пары (произведение, автор) - и внутри
+    файла, и уже сохраненные - отбрасываются до вставки.
+    Рейтинги затронутых произведений пересчитываются один раз в конце.
+    on_reject(номер строки, строка, ошибка) получает отклоненные строки.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, on_reject=None):
+        self.batch_size = batch_size
+        self.on_reject = on_reject
+        self.user_ids = {}
+        self.title_ids = IdSet()
+        self.seen = set()
+        self.affected = set()
+        self.imported = self.duplicates = self.rejected = 0
+
+    def reject(self, line_number, line, error):
+        self.rejected += 1
+        if self.on_reject is not None:
+            self.on_reject(line_number, line, error)
+
+    def parse(self, lines):
+        for line_number, line in enumerate(lines, 1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                values = clean_review(json.loads(line))
+            except ValueError as error:
+                self.reject(line_number, line, str(error))
+                continue
+            yield line_number, line, values
+
+    def run(self, lines):
+        """ Импортирует строки, возвращает итоговые счетчики """
+        try:
+            for batch in batches(self.parse(lines), self.batch_size):
+                self.import_batch(batch)
+        finally:
+            self.refresh_stats()
+        return self.result()
+
+    def result(self):
+        return {
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+        }
+
+    def resolve(self, batch):
+        """ Дозапрашивает id неизвестных авторов и произведений пачки """
+        usernames = {
+            values[1] for _, _, values in batch
+        } - self.user_ids.keys()
+        if usernames:
+            self.user_ids.update(User.objects.filter(
+                username__in=usernames
+            ).values_list('username', 'pk'))
+        title_ids = {
+            values[0] for _, _, values in batch
+            if values[0] not in self.title_ids
+        }
+        if title_ids:
+            for pk in Title.objects.filter(
+                pk__in=title_ids
+            ).values_list('pk', flat=True):
+                self.title_ids.add(pk)
+
+    def drop_existing(self, pairs):
+        """ Запоминает пары пачки, уже сохраненные в БД """
+        existing = Review.objects.for_titles(
+            {title_id for title_id, _ in pairs}
+        ).filter(
+            author_id__in={author_id for _, author_id in pairs},
+        ).values_list('title_id', 'author_id')
+        self.seen.update(pair for pair in existing if pair in pairs)
+
+    def import_batch(self, batch):
+        self.resolve(batch)
+        rows = []
+        for line_number, line, values in batch:
+            title_id, username, text, score, pub_date = values
+            author_id = self.user_ids.get(username)
+            if author_id is None:
+                self.reject(line_number, line, f'нет пользователя {username}')
+            elif title_id not in self.title_ids:
+                self.reject(line_number, line, f'нет произведения {title_id}')
+            else:
+                rows.append(((title_id, author_id), text, score, pub_date))
+        pairs = {pair for pair, *_ in rows} - self.seen
+        if pairs:
+            self.drop_existing(pairs)
+        now = timezone.now()
+        reviews = []
+        for pair, text, score, pub_date in rows:
+            if pair in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(pair)
+            reviews.append(Review(
+                title_id=pair[0], author_id=pair[1], text=text, score=score,
+                pub_date=pub_date or now,
+            ))
+        with transaction.atomic():
+            insert_objects(Review, reviews)
+        self.imported += len(reviews)
+        self.affected.update(review.title_id for review in reviews)
+
+    def refresh_stats(self):
+        affected = sorted(self.affected)
+        for start in range(0, len(affected), STATS_BATCH_SIZE):
+            Title.objects.filter(
+                pk__in=affected[start:start + STATS_BATCH_SIZE]
+            ).refresh_review_stats()
+        self.affected.clear()
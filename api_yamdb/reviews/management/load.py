@@ -0,0 +1,251 @@
+"""
+Нагрузка замкнутым циклом: виртуальный пользователь отправляет
+следующий запрос только после ответа на предыдущий (и паузы think),
+поэтому одновременных запросов не больше, чем пользователей.
+
+Пользователь регистрируется, получает токен и дальше выбирает действия
+MIX по их весам: листает произведения, читает отзывы и комментарии,
+пишет отзывы и комментарии, изредка регистрируется заново. Чтения
+анонимные (роли user список произведений не отдается), записи - с
+токеном.
+
+Код подтверждения уходит письмом, поэтому берется из БД проекта: при
+нагрузке по адресу это должен быть этот же проект. Если auth/token
+токен не выдал, ошибка засчитывается действию token, а токен
+выпускается напрямую, чтобы сценарий продолжался.
+"""
+import json
+import random
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.db import connections
+from rest_framework_simplejwt.tokens import AccessToken
+
+from reviews.models import User
+
+API = '/api/v1'
+MIX = (
+    ('browse', 40),
+    ('read_reviews', 30),
+    ('read_comments', 10),
+    ('post_review', 8),
+    ('post_comment', 10),
+    ('signup', 2),
+)
+PAGE_SIZE = 10
+TIMEOUT = 30
+REVIEW_TEXTS = (
+    'Пересмотрю еще раз.', 'Неплохо, но затянуто.', 'Лучшее за год!',
+    'Не мое.', 'Финал все испортил.',
+)
+COMMENT_TEXTS = ('Согласен!', 'Спорно.', 'Спасибо за отзыв.')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class VirtualUser:
+    """
+    Пользователь сценария. Результат каждого запроса кладется в results:
+    (время окончания, действие, длительность, код ответа), код 0 - ответа
+    не было.
+    """
+
+    def __init__(self, url, results, name, seed):
+        self.url = url.rstrip('/') + API
+        self.results = results
+        self.name = name
+        self.random = random.Random(seed)
+        self.token = None
+        self.signups = 0
+        self.title_count = 0
+        self.titles = []
+        self.reviews = {}
+        self.reviewed = set()
+
+    def request(self, action, method, path, data=None, auth=False):
+        """ Данные ответа 2xx или None """
+        headers = {'Accept': 'application/json'}
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        if auth and self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        started = time.perf_counter()
+        try:
+            with urlopen(
+                Request(self.url + path, body, headers, method=method),
+                timeout=TIMEOUT
+            ) as response:
+                status, content = response.status, response.read()
+        except HTTPError as error:
+            status, content = error.code, error.read()
+        except (URLError, OSError):
+            status, content = 0, b''
+        self.results.put(
+            (time.time(), action, time.perf_counter() - started, status)
+        )
+        if not 200 <= status < 300 or not content:
+            return None
+        try:
+            return json.loads(content)
+        except ValueError:
+            return None
+
+    def browse(self):
+        offset = self.random.randrange(
+            max(self.title_count - PAGE_SIZE, 0) + 1
+        )
+        data = self.request(
+            'browse', 'GET', f'/titles/?limit={PAGE_SIZE}&offset={offset}'
+        )
+        if data:
+            self.title_count = data['count']
+            self.titles = [title['id'] for title in data['results']]
+
+    def pick_review(self):
+        known = [
+            (title_id, review_id)
+            for title_id, review_ids in self.reviews.items()
+            for review_id in review_ids
+        ]
+        return self.random.choice(known) if known else None
+
+    def read_reviews(self):
+        if not self.titles:
+            return self.browse()
+        title_id = self.random.choice(self.titles)
+        data = self.request(
+            'read_reviews', 'GET',
+            f'/titles/{title_id}/reviews/?limit={PAGE_SIZE}'
+        )
+        if data:
+            self.reviews[title_id] = [
+                review['id'] for review in data['results']
+            ]
+
+    def read_comments(self):
+        picked = self.pick_review()
+        if picked is None:
+            return self.read_reviews()
+        self.request(
+            'read_comments', 'GET',
+            '/titles/{}/reviews/{}/comments/?limit={}'.format(
+                *picked, PAGE_SIZE
+            )
+        )
+
+    def post_review(self):
+        # Второй отзыв на произведение API отклоняет
+        titles = [
+            title_id for title_id in self.titles
+            if title_id not in self.reviewed
+        ]
+        if not titles:
+            return self.browse()
+        title_id = self.random.choice(titles)
+        self.reviewed.add(title_id)
+        self.request('post_review', 'POST', f'/titles/{title_id}/reviews/', {
+            'text': self.random.choice(REVIEW_TEXTS),
+            'score': self.random.randint(1, 10),
+        }, auth=True)
+
+    def post_comment(self):
+        picked = self.pick_review()
+        if picked is None:
+            return self.read_reviews()
+        self.request(
+            'post_comment', 'POST',
+            '/titles/{}/reviews/{}/comments/'.format(*picked),
+            {'text': self.random.choice(COMMENT_TEXTS)}, auth=True
+        )
+
+    def signup(self):
+        """ Регистрация новой учетной записи и получение ее токена """
+        self.signups += 1
+        username = f'{self.name}_{self.signups}'
+        self.request('signup', 'POST', '/auth/signup/', {
+            'username': username, 'email': f'{username}@load.test',
+        })
+        self.reviewed = set()
+        user = User.objects.filter(username=username).first()
+        data = None
+        if user is not None:
+            data = self.request('token', 'POST', '/auth/token/', {
+                'username': username,
+                'confirmation_code': str(user.confirmation_code),
+            })
+        if data and 'token' in data:
+            self.token = data['token']
+        else:
+            self.token = str(AccessToken.for_user(user)) if user else None
+
+    def run(self, deadline, think):
+        self.signup()
+        actions, weights = zip(*MIX)
+        while time.time() < deadline:
+            getattr(self, self.random.choices(actions, weights)[0])()
+            if think:
+                time.sleep(self.random.expovariate(1 / think))
+
+
+def run_users(url, results, deadline, think, users):
+    """ Пользователи users [(имя, seed)] - по потоку на каждого """
+
+    def run(name, seed):
+        try:
+            VirtualUser(url, results, name, seed).run(deadline, think)
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=run, args=user, daemon=True)
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_process(url, results, deadline, think, users):
+    """ Рабочий процесс: соединения родителя после fork не используются """
+    for alias in connections:
+        connections[alias].close()
+    run_users(url, results, deadline, think, users)
+
+
+class Report:
+    """ Результаты запросов: окно последнего интервала и итог по действиям """
+
+    def __init__(self):
+        self.window = []
+        self.latencies = {}
+        self.errors = {}
+        self.total = 0
+
+    def add(self, record):
+        _, action, latency, status = record
+        failed = not 200 <= status < 400
+        self.window.append((latency, failed))
+        self.latencies.setdefault(action, []).append(latency)
+        if failed:
+            key = (action, status)
+            self.errors[key] = self.errors.get(key, 0) + 1
+        self.total += 1
+
+    def take_window(self):
+        window, self.window = self.window, []
+        return window
+
+    def count_errors(self, action):
+        return sum(
+            count for (name, _), count in self.errors.items()
+            if name == action
+        )
@@ -0,0 +1,515 @@
+import csv
+import hashlib
+import os
+import time
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import OperationalError, connections, router, transaction
+from django.utils import timezone
+
+from reviews import sharding
+from reviews.models import (
+    User, Category, Genre, GenreTitle, Title, Review, Comment
+)
+
+TEST_DATA = {
+    'users': 'users.csv',
+    'category': 'category.csv',
+    'genre': 'genre.csv',
+    'titles': 'titles.csv',
+    'genre_title': 'genre_title.csv',
+    'review': 'review.csv',
+    'comments': 'comments.csv',
+}
+
+TABLES = {
+    'users': (User, 'Пользователь'),
+    'category': (Category, 'Категория'),
+    'genre': (Genre, 'Жанр'),
+    'titles': (Title, 'Произведение'),
+    'genre_title': (GenreTitle, 'Жанр-Произведение'),
+    'review': (Review, 'Отзыв'),
+    'comments': (Comment, 'Комментарий'),
+}
+
+DEFAULT_BATCH_SIZE = 1000
+REJECTED_SUFFIX = '.rejected.csv'
+LOCK_RETRIES = 50
+LOCK_RETRY_DELAY = 0.1
+
+
+def get_model(table_name):
+    if table_name not in TABLES:
+        raise KeyError(f'Неизвестное имя таблицы {table_name}')
+    return TABLES[table_name]
+
+
+def get_attnames(model, header):
+    """
+    Сопоставляет заголовки csv с атрибутами модели:
+    для внешних ключей 'category' и 'category_id' дают 'category_id'.
+    """
+    attnames = {}
+    for column in header:
+        name = column.strip()
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            field = None
+        attnames[column] = field.attname if field else name
+    return attnames
+
+
+def get_nullable(model):
+    return {
+        field.attname for field in model._meta.concrete_fields if field.null
+    }
+
+
+def get_foreign_keys(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if field.is_relation and field.many_to_one
+    ]
+
+
+def dependency_graph(tables):
+    """
+    Граф зависимостей таблиц по внешним ключам моделей:
+    для каждой таблицы - множество таблиц, которые надо загрузить раньше.
+    """
+    table_by_model = {get_model(table)[0]: table for table in tables}
+    graph = {}
+    for table in tables:
+        model, _ = get_model(table)
+        graph[table] = {
+            table_by_model[field.related_model]
+            for field in get_foreign_keys(model)
+            if field.related_model in table_by_model
+            and field.related_model is not model
+        }
+    return graph
+
+
+class IdSet:
+    """ Множество целых id в виде битовой карты: 50 млн id ~ 6 Мб """
+
+    def __init__(self, ids=()):
+        self._bits = bytearray()
+        for pk in ids:
+            self.add(pk)
+
+    def add(self, pk):
+        byte = pk >> 3
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte - len(self._bits) + 1))
+        self._bits[byte] |= 1 << (pk & 7)
+
+    def __contains__(self, pk):
+        byte = pk >> 3
+        return (
+            pk >= 0 and byte < len(self._bits)
+            and bool(self._bits[byte] & (1 << (pk & 7)))
+        )
+
+    def resolve(self, pk):
+        """ id в БД по id из файла: тот же id или None, если его нет """
+        return pk if pk in self else None
+
+
+class ShardedIdSet:
+    """
+    id шардированной модели: по IdSet номеров в диапазоне каждого шарда.
+    id из файла меньше ID_SPAN - номер в диапазоне шарда, сам шард
+    находится по тому, в каком шарде есть строка с таким номером.
+    """
+
+    def __init__(self, model):
+        self._ids = {}
+        for alias in sharding.get_shards():
+            start = sharding.id_range_start(alias)
+            pks = model.objects.using(alias).values_list(
+                'pk', flat=True
+            ).order_by()
+            self._ids[alias] = IdSet(pk - start for pk in pks.iterator())
+
+    def resolve(self, pk):
+        """
+        id в БД по id из файла или None, если строки нет. Номер,
+        который есть в нескольких шардах, неоднозначен - тоже None.
+        """
+        if pk >= sharding.ID_SPAN:
+            alias = sharding.shard_for_id(pk)
+            if alias is None:
+                return None
+            start = sharding.id_range_start(alias)
+            return pk if pk - start in self._ids[alias] else None
+        found = [
+            sharding.id_range_start(alias) + pk
+            for alias, ids in self._ids.items() if pk in ids
+        ]
+        return found[0] if len(found) == 1 else None
+
+
+class ForeignKeyValidator:
+    """
+    Проверяет внешние ключи строк по множествам id связанных таблиц.
+    Множество строится один раз, при первом обращении к таблице;
+    таблицы грузятся в порядке зависимостей, поэтому к этому моменту
+    связанная таблица уже загружена. Ключ на шардированную модель
+    заменяется ее id в БД (ShardedIdSet.resolve).
+    """
+
+    def __init__(self):
+        self._ids = {}
+
+    def ids_for(self, model):
+        if model not in self._ids:
+            if sharding.is_sharded(model):
+                self._ids[model] = ShardedIdSet(model)
+            else:
+                pks = model.objects.values_list('pk', flat=True).order_by()
+                self._ids[model] = IdSet(pks.iterator())
+        return self._ids[model]
+
+    def forget(self, model):
+        """ Таблица дозагружена, множество надо перестроить """
+        self._ids.pop(model, None)
+
+    def check(self, foreign_keys, values):
+        for field in foreign_keys:
+            value = values.get(field.attname)
+            if value is None:
+                if field.null:
+                    continue
+                return f'не указан {field.name}'
+            try:
+                pk = int(value)
+            except (TypeError, ValueError):
+                return f'{field.name}={value!r} не является числом'
+            resolved = self.ids_for(field.related_model).resolve(pk)
+            if resolved is None:
+                return (f'{field.name}={pk} отсутствует в таблице '
+                        f'{field.related_model._meta.db_table}')
+            values[field.attname] = resolved
+        return None
+
+
+def assign_shard_id(model, values):
+    """
+    При шардировании переносит id строки отзыва или комментария в
+    диапазон ее шарда: id из файла меньше ID_SPAN считается номером в
+    диапазоне. Внешние ключи values уже проверены. Возвращает ошибку
+    или None.
+    """
+    if not sharding.is_sharded(model):
+        return None
+    if model is Review:
+        alias = sharding.shard_for_title(values['title_id'])
+    else:
+        alias = sharding.shard_for_id(values['review_id'])
+    pk_name = model._meta.pk.attname
+    if values.get(pk_name) is None:
+        return None
+    try:
+        pk = int(values[pk_name])
+    except (TypeError, ValueError):
+        return f'{pk_name}={values[pk_name]!r} не является числом'
+    if pk < sharding.ID_SPAN:
+        pk += sharding.id_range_start(alias)
+    elif sharding.shard_for_id(pk) != alias:
+        return f'{pk_name}={pk} вне диапазона id шарда {alias}'
+    values[pk_name] = pk
+    return None
+
+
+class RejectWriter:
+    """ Пишет отклоненные строки в отдельный csv с колонкой error """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, header, row, error):
+        if self._writer is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(list(header) + ['error'])
+        self._writer.writerow(
+            [row.get(column) for column in header] + [error]
+        )
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def merge_rejects(parts, path):
+    """ Склеивает файлы отклоненных строк частей таблицы в один """
+    written = False
+    for part in parts:
+        if not os.path.exists(part):
+            continue
+        with open(part, newline='', encoding='utf-8') as part_file, open(
+            path, 'a' if written else 'w', newline='', encoding='utf-8'
+        ) as target:
+            reader = csv.reader(part_file)
+            header = next(reader)
+            writer = csv.writer(target)
+            if not written:
+                writer.writerow(header)
+            writer.writerows(reader)
+        written = True
+        os.remove(part)
+
+
+def read_rows(lines, model, validator, rejects, fieldnames=None):
+    """
+    Генератор строк csv в виде словарей атрибутов модели.
+    lines читается построчно; строки с неверными внешними ключами
+    уходят в rejects и дальше не передаются.
+    """
+    nullable = get_nullable(model)
+    foreign_keys = get_foreign_keys(model)
+    reader = csv.DictReader(lines, fieldnames=fieldnames)
+    attnames = get_attnames(model, reader.fieldnames)
+    for row in reader:
+        if None in row:
+            extra = row.pop(None)
+            rejects.write(reader.fieldnames, row, f'лишние значения {extra}')
+            continue
+        values = {}
+        for column, value in row.items():
+            attname = attnames[column]
+            if value == '' and attname in nullable:
+                value = None
+            values[attname] = value
+        error = validator.check(foreign_keys, values) or assign_shard_id(
+            model, values
+        )
+        if error:
+            rejects.write(reader.fieldnames, row, error)
+            continue
+        yield values
+
+
+def batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as csvfile:
+        for chunk in iter(lambda: csvfile.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch_existing(model, pks):
+    """ {id: объект} для id, которые уже есть в БД; шарды - по id """
+    sharded = sharding.is_sharded(model)
+    pks_by_db = {}
+    for pk in pks:
+        pks_by_db.setdefault(
+            sharding.shard_for_id(pk) if sharded else None, []
+        ).append(pk)
+    existing = {}
+    for alias, group in pks_by_db.items():
+        existing.update(model.objects.db_manager(alias).in_bulk(group))
+    return existing
+
+
+def upsert_batch(model, batch):
+    """
+    Добавляет новые и обновляет изменившиеся строки пачки по первичному
+    ключу: запрос существующих строк, insert_objects и bulk_update.
+    Новые строки вставляются без pre_save, чтобы auto_now_add не заменил
+    дату из файла и при следующей сверке строка не считалась измененной.
+    Строки шардированной модели читаются и обновляются в их шардах.
+    Возвращает (создано, обновлено).
+    """
+    pk_name = model._meta.pk.attname
+    fields = {
+        field.attname: field for field in model._meta.concrete_fields
+    }
+    rows = {}
+    for values in batch:
+        if values.get(pk_name) is None:
+            raise ValueError(
+                f'Для инкрементальной загрузки нужна колонка {pk_name}'
+            )
+        row = {
+            attname: fields[attname].to_python(value)
+            for attname, value in values.items() if attname in fields
+        }
+        rows[row[pk_name]] = row
+    existing = fetch_existing(model, rows)
+    to_create = []
+    to_update = []
+    changed_fields = set()
+    for pk, row in rows.items():
+        obj = existing.get(pk)
+        if obj is None:
+            to_create.append(model(**row))
+            continue
+        changed = {
+            attname for attname, value in row.items()
+            if getattr(obj, attname) != value
+        }
+        if changed:
+            for attname in changed:
+                setattr(obj, attname, row[attname])
+            changed_fields |= changed
+            to_update.append(obj)
+    insert_objects(model, to_create)
+    update_fields = [
+        fields[attname].name for attname in sorted(changed_fields)
+    ]
+    # Строка обновляется в той БД, из которой прочитана
+    groups = {}
+    for obj in to_update:
+        groups.setdefault(obj._state.db, []).append(obj)
+    for alias, group in groups.items():
+        model.objects.using(alias).bulk_update(group, update_fields)
+    return len(to_create), len(to_update)
+
+
+def split_ranges(path, split_size):
+    """
+    Делит файл на диапазоны байт примерно по split_size, не разрывая
+    записи: граница ставится только после перевода строки при четном
+    числе кавычек, то есть не внутри многострочного значения в кавычках.
+    Возвращает заголовок файла и список диапазонов (начало, конец).
+    """
+    ranges = []
+    with open(path, 'rb') as csvfile:
+        header = csvfile.readline().decode('utf-8')
+        start = position = csvfile.tell()
+        target = start + split_size
+        quotes = 0
+        for line in csvfile:
+            quotes += line.count(b'"')
+            position += len(line)
+            if position >= target and quotes % 2 == 0:
+                ranges.append((start, position))
+                start = position
+                target = position + split_size
+        if position > start:
+            ranges.append((start, position))
+    fieldnames = next(csv.reader([header]))
+    return fieldnames, ranges
+
+
+def iter_range_lines(path, start, end):
+    with open(path, 'rb') as csvfile:
+        csvfile.seek(start)
+        position = start
+        while position < end:
+            line = csvfile.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode('utf-8')
+
+
+def insert_batch(model, batch):
+    """
+    Вставляет пачку в собственной транзакции через insert_objects, с
+    датами из файла. Параллельные процессы пишут в одну SQLite по
+    очереди, поэтому при блокировке ждем.
+    """
+    for attempt in range(LOCK_RETRIES):
+        try:
+            with transaction.atomic():
+                insert_objects(model, [model(**values) for values in batch])
+            return
+        except OperationalError as error:
+            if 'locked' not in str(error) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(LOCK_RETRY_DELAY)
+
+
+def fill_missing_dates(model, objs):
+    """ Пустые поля auto_now и auto_now_add - текущим временем """
+    now = timezone.now()
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now', False) or getattr(
+            field, 'auto_now_add', False
+        ):
+            for obj in objs:
+                if getattr(obj, field.attname) is None:
+                    setattr(obj, field.attname, now)
+
+
+def insert_objects(model, objs, ignore_conflicts=False):
+    """
+    Вставляет объекты одним INSERT через executemany, без save() и
+    pre_save(): auto_now_add не перезаписывает переданные даты, сигналы
+    не отправляются; пустые даты заполняются текущим временем. Пустой
+    первичный ключ назначает БД. БД объекта выбирает роутер, при
+    шардировании - по INSERT на шард.
+    ignore_conflicts - строки с уже занятым ключом пропускаются.
+    """
+    if not objs:
+        return
+    fill_missing_dates(model, objs)
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not (field.primary_key and objs[0].pk is None)
+    ]
+    groups = {}
+    for obj in objs:
+        groups.setdefault(
+            router.db_for_write(model, instance=obj), []
+        ).append(obj)
+    for alias, group in groups.items():
+        connection = connections[alias]
+        ops = connection.ops
+        sql = '{} {} ({}) VALUES ({}) {}'.format(
+            ops.insert_statement(ignore_conflicts=ignore_conflicts),
+            ops.quote_name(model._meta.db_table),
+            ', '.join(ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+            ops.ignore_conflicts_suffix_sql(ignore_conflicts=ignore_conflicts),
+        ).rstrip()
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(
+                    getattr(obj, field.attname), connection
+                ) for field in fields]
+                for obj in group
+            ])
+
+
+def load_range(task):
+    """
+    Загружает диапазон байт одного файла в рабочем процессе.
+    У процесса свои соединения с БД и свои множества id для проверки
+    внешних ключей. Возвращает (загружено, отклонено).
+    """
+    table_name, path, fieldnames, start, end, batch_size, rejects_path = task
+    model, _ = get_model(table_name)
+    rejects = RejectWriter(rejects_path)
+    rows = read_rows(
+        iter_range_lines(path, start, end),
+        model, ForeignKeyValidator(), rejects, fieldnames=fieldnames
+    )
+    loaded = 0
+    try:
+        for batch in batches(rows, batch_size):
+            insert_batch(model, batch)
+            loaded += len(batch)
+    finally:
+        rejects.close()
+        connections.close_all()
+    return loaded, rejects.count
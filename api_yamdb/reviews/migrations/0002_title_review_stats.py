@@ -0,0 +1,49 @@
+# Generated by Django 3.2 on 2026-10-19 09:16
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+import reviews.models
+
+
+def fill_review_stats(apps, schema_editor):
+    Title = apps.get_model('reviews', 'Title')
+    Review = apps.get_model('reviews', 'Review')
+    alias = schema_editor.connection.alias
+    stats = Review.objects.using(alias).order_by().values(
+        'title_id'
+    ).annotate(avg_score=Avg('score'), count=Count('pk'))
+    for row in stats.iterator():
+        Title.objects.using(alias).filter(pk=row['title_id']).update(
+            rating=row['avg_score'], review_count=row['count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='title',
+            name='rating',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='title',
+            name='review_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Число отзывов'),
+        ),
+        migrations.AlterField(
+            model_name='title',
+            name='name',
+            field=models.CharField(db_index=True, max_length=256),
+        ),
+        migrations.AlterField(
+            model_name='title',
+            name='year',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True, validators=[reviews.models.year_validator]),
+        ),
+        migrations.RunPython(fill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2 on 2026-10-19 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0002_title_review_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoadManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=512, unique=True, verbose_name='Путь к файлу')),
+                ('checksum', models.CharField(max_length=64, verbose_name='SHA-256 содержимого')),
+                ('rows', models.PositiveIntegerField(default=0, verbose_name='Строк в файле')),
+                ('loaded_at', models.DateTimeField(auto_now=True, verbose_name='Время загрузки')),
+            ],
+            options={
+                'verbose_name': 'Загруженный файл',
+                'verbose_name_plural': 'Загруженные файлы',
+            },
+        ),
+    ]
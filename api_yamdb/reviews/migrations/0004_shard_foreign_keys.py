@@ -0,0 +1,62 @@
+# Generated by Django 3.2 on 2026-10-19 09:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from reviews.sharding import ID_SPAN
+
+
+def offset_shard_ids(apps, schema_editor):
+    """ id отзывов и комментариев каждого шарда - в своем диапазоне """
+    connection = schema_editor.connection
+    if (connection.vendor != 'sqlite'
+            or connection.alias not in settings.REVIEW_SHARDS):
+        return
+    start = (settings.REVIEW_SHARDS.index(connection.alias) + 1) * ID_SPAN
+    with connection.cursor() as cursor:
+        for model_name in ('review', 'comment'):
+            table = apps.get_model('reviews', model_name)._meta.db_table
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = MAX(seq, %s) '
+                'WHERE name = %s', [start - 1, table]
+            )
+            if not cursor.rowcount:
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                    [table, start - 1]
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0003_loadmanifest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, help_text='Автор', on_delete=django.db.models.deletion.CASCADE, related_name='comments', to=settings.AUTH_USER_MODEL, verbose_name='Автор комментария'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='review',
+            field=models.ForeignKey(db_constraint=False, help_text='Выбор отзыва', on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='reviews.review', verbose_name='Отзыв на произведение'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, help_text='Выберите автора этого отзыва.', on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to=settings.AUTH_USER_MODEL, verbose_name='Автор отзыва'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='title',
+            field=models.ForeignKey(db_constraint=False, help_text='Выберите произведение, к которому относится этот отзыв.', on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='reviews.title', verbose_name='Название произведения'),
+        ),
+        migrations.RunPython(
+            offset_shard_ids, migrations.RunPython.noop,
+            hints={'model_name': 'review'},
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2 on 2026-10-19 09:57
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_comment_counts(apps, schema_editor):
+    Review = apps.get_model('reviews', 'Review')
+    Comment = apps.get_model('reviews', 'Comment')
+    alias = schema_editor.connection.alias
+    counts = Comment.objects.using(alias).order_by().values(
+        'review_id'
+    ).annotate(count=Count('pk'))
+    for row in counts.iterator():
+        Review.objects.using(alias).filter(pk=row['review_id']).update(
+            comment_count=row['count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0004_shard_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(
+            fill_comment_counts, migrations.RunPython.noop,
+            hints={'model_name': 'review'},
+        ),
+    ]
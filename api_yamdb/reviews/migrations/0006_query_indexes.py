@@ -0,0 +1,69 @@
+# Generated by Django 3.2 on 2026-10-19 10:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+import django.db.models.deletion
+
+
+def drop_duplicate_genres(apps, schema_editor):
+    GenreTitle = apps.get_model('reviews', 'GenreTitle')
+    links = GenreTitle.objects.using(schema_editor.connection.alias)
+    first = links.order_by().values('genre_id', 'title_id').annotate(
+        first=Min('pk')
+    ).values('first')
+    links.exclude(pk__in=first).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0005_review_comment_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='review',
+            field=models.ForeignKey(db_constraint=False, db_index=False, help_text='Выбор отзыва', on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='reviews.review', verbose_name='Отзыв на произведение'),
+        ),
+        migrations.AlterField(
+            model_name='genretitle',
+            name='genre',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='reviews.genre'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, db_index=False, help_text='Выберите автора этого отзыва.', on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to=settings.AUTH_USER_MODEL, verbose_name='Автор отзыва'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='title',
+            field=models.ForeignKey(db_constraint=False, db_index=False, help_text='Выберите произведение, к которому относится этот отзыв.', on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='reviews.title', verbose_name='Название произведения'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['review', 'pub_date'], name='comment_review_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['title', 'pub_date'], name='review_title_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['author', 'pub_date'], name='review_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['pub_date'], name='review_date_idx'),
+        ),
+        migrations.RunPython(
+            drop_duplicate_genres, migrations.RunPython.noop,
+            hints={'model_name': 'genretitle'},
+        ),
+        migrations.AddConstraint(
+            model_name='genretitle',
+            constraint=models.UniqueConstraint(fields=('genre', 'title'), name='unique genre title'),
+        ),
+    ]
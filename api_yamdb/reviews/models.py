@@ -6,8 +6,14 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Avg, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from reviews.sharding import (
+    CommentQuerySet, ShardedQuerySet, fan_out, get_shards, group_by_shard
+)
+
 USER = 'user'
 MODERATOR = 'moderator'
 ADMIN = 'admin'
@@ -109,15 +115,74 @@ class Genre(models.Model):
         return self.name
 
 
+class TitleQuerySet(models.QuerySet):
+
+    def refresh_review_stats(self, batch_size=500):
+        """
+        Пересчитывает сохраненные рейтинг и число отзывов произведений
+        выборки пачками по batch_size. Без шардирования пачка обновляется
+        одним UPDATE с подзапросами: параллельные записи отзывов не
+        затирают друг друга устаревшими значениями. Шарды - отдельные БД:
+        агрегаты собираются по запросу на шард параллельно и пишутся
+        bulk_update.
+        """
+        title_ids = list(self.values_list('pk', flat=True))
+        refresh = (
+            self._refresh_sharded_stats if get_shards()
+            else self._refresh_stats
+        )
+        for start in range(0, len(title_ids), batch_size):
+            refresh(title_ids[start:start + batch_size])
+
+    def _refresh_stats(self, batch):
+        reviews = Review.objects.filter(
+            title_id=OuterRef('pk')
+        ).order_by().values('title_id')
+        self.model.objects.filter(pk__in=batch).update(
+            rating=Subquery(
+                reviews.annotate(avg_score=Avg('score')).values('avg_score')
+            ),
+            review_count=Coalesce(Subquery(
+                reviews.annotate(count=Count('pk')).values('count')
+            ), 0),
+        )
+
+    def _refresh_sharded_stats(self, batch):
+        groups = group_by_shard(batch)
+
+        def aggregate(alias):
+            return list(Review.objects.db_manager(alias).filter(
+                title_id__in=groups[alias]
+            ).order_by().values('title_id').annotate(
+                avg_score=Avg('score'), count=Count('pk')
+            ))
+
+        stats = {
+            row['title_id']: row
+            for rows in fan_out(aggregate, list(groups)) for row in rows
+        }
+        titles = []
+        for pk in batch:
+            row = stats.get(pk, {})
+            titles.append(Title(
+                pk=pk,
+                rating=row.get('avg_score'),
+                review_count=row.get('count', 0),
+            ))
+        self.model.objects.bulk_update(titles, ['rating', 'review_count'])
+
+
 class Title(models.Model):
     """ Модель произведения"""
     name = models.CharField(
-        max_length=256
+        max_length=256,
+        db_index=True
     )
     year = models.PositiveSmallIntegerField(
         validators=[year_validator],
         null=True,
-        blank=True
+        blank=True,
+        db_index=True
     )
     description = models.TextField()
     category = models.ForeignKey(
@@ -132,25 +197,81 @@ class Title(models.Model):
         related_name='genre_titles',
         through='GenreTitle'
     )
+    rating = models.FloatField(
+        'Средняя оценка',
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+    review_count = models.PositiveIntegerField(
+        'Число отзывов',
+        default=0,
+        editable=False,
+        db_index=True,
+    )
+
+    objects = TitleQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
 
 class GenreTitle(models.Model):
-    genre = models.ForeignKey(Genre, on_delete=models.CASCADE)
+    # Отдельный индекс по genre не нужен: его заменяет уникальный
+    # индекс (genre, title)
+    genre = models.ForeignKey(
+        Genre, on_delete=models.CASCADE, db_index=False
+    )
     title = models.ForeignKey(Title, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('genre', 'title'),
+                name='unique genre title'
+            )
+        ]
+
     def __str__(self):
         return f'{self.genre} {self.title}'
 
 
+class ReviewQuerySet(ShardedQuerySet):
+
+    def refresh_comment_stats(self, batch_size=500):
+        """
+        Пересчитывает сохраненное число комментариев отзывов выборки:
+        UPDATE с подзапросом на пачку, в БД выборки - отзыв и его
+        комментарии всегда в одной БД.
+        """
+        review_ids = list(self.values_list('pk', flat=True))
+        reviews = self.model.objects.db_manager(self._db)
+        comments = Comment.objects.filter(
+            review_id=OuterRef('pk')
+        ).order_by().values('review_id').annotate(count=Count('pk'))
+        for start in range(0, len(review_ids), batch_size):
+            reviews.filter(
+                pk__in=review_ids[start:start + batch_size]
+            ).update(comment_count=Coalesce(
+                Subquery(comments.values('count')), 0
+            ))
+
+
 class Review(models.Model):
     """Модель отзыва на произведение"""
+    # Внешние ключи отзывов и комментариев без ограничений в БД: при
+    # шардировании они хранятся отдельно от произведений и пользователей.
+    # Схема одна для всех установок, поэтому ограничений нет и без
+    # шардирования: ключи проверяют сериализаторы, загрузчики CSV
+    # (ForeignKeyValidator), импорт отзывов и буфер комментариев.
+    # Одиночные индексы ключей заменяют составные индексы из Meta
     title = models.ForeignKey(
         Title,
         on_delete=models.CASCADE,
         related_name='reviews',
+        db_constraint=False,
+        db_index=False,
         verbose_name='Название произведения',
         help_text='Выберите произведение, к которому относится этот отзыв.'
     )
@@ -158,6 +279,8 @@ class Review(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='reviews',
+        db_constraint=False,
+        db_index=False,
         verbose_name='Автор отзыва',
         help_text='Выберите автора этого отзыва.'
     )
@@ -183,6 +306,13 @@ class Review(models.Model):
         verbose_name='Дата размещения',
         help_text='Дата и время размещения этого отзыва.'
     )
+    comment_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False,
+    )
+
+    objects = ReviewQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Отзыв на произведение'
@@ -194,6 +324,17 @@ class Review(models.Model):
                 name='unique review'
             )
         ]
+        # Отзывы произведения и автора в порядке публикации, лента
+        # всех отзывов - по дате
+        indexes = [
+            models.Index(
+                fields=('title', 'pub_date'), name='review_title_date_idx'
+            ),
+            models.Index(
+                fields=('author', 'pub_date'), name='review_author_date_idx'
+            ),
+            models.Index(fields=('pub_date',), name='review_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'Отзыв {self.author} на {self.title}'
@@ -205,6 +346,8 @@ class Comment(models.Model):
         Review,
         on_delete=models.CASCADE,
         related_name='comments',
+        db_constraint=False,
+        db_index=False,
         verbose_name='Отзыв на произведение',
         help_text='Выбор отзыва',
     )
@@ -219,6 +362,7 @@ class Comment(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='comments',
+        db_constraint=False,
         verbose_name='Автор комментария',
         help_text='Автор',
     )
@@ -228,10 +372,45 @@ class Comment(models.Model):
         help_text='Дата и время размещения этого комментария.'
     )
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ('pub_date',)
         verbose_name = 'Комментарий к отзыву'
         verbose_name_plural = 'Комментарии к отзыву'
+        indexes = [
+            models.Index(
+                fields=('review', 'pub_date'), name='comment_review_date_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text
+
+
+class LoadManifest(models.Model):
+    """Контрольные суммы файлов, загруженных loadcsv --incremental"""
+    path = models.CharField(
+        'Путь к файлу',
+        max_length=512,
+        unique=True,
+    )
+    checksum = models.CharField(
+        'SHA-256 содержимого',
+        max_length=64,
+    )
+    rows = models.PositiveIntegerField(
+        'Строк в файле',
+        default=0,
+    )
+    loaded_at = models.DateTimeField(
+        'Время загрузки',
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = 'Загруженный файл'
+        verbose_name_plural = 'Загруженные файлы'
+
+    def __str__(self) -> str:
+        return self.path
@@ -0,0 +1,317 @@
+"""
+Шардирование отзывов и комментариев по хешу title_id.
+
+Когда REVIEW_SHARDING включен, отзывы произведения и комментарии к ним
+хранятся в одной из БД REVIEW_SHARDS, остальные модели - в default.
+Запросы в рамках произведения (for_title) идут в один шард, запросы по
+всем произведениям (across_shards) расходятся по шардам параллельно,
+а результаты сливаются.
+"""
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from functools import cmp_to_key
+from itertools import islice
+from zlib import crc32
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, models
+
+SHARDED_MODELS = ('reviews.review', 'reviews.comment')
+# Ширина диапазона id шарда: id отзывов и комментариев шарда с индексом
+# i начинаются с (i + 1) * ID_SPAN и не пересекаются между шардами
+ID_SPAN = 10 ** 12
+
+
+class ShardRoutingError(Exception):
+    """ Для запроса к шардированной модели не удалось выбрать шард """
+
+
+def get_shards():
+    """ Алиасы шардов или пустой список, если шардирование выключено """
+    return list(settings.REVIEW_SHARDS) if settings.REVIEW_SHARDING else []
+
+
+def is_sharded(model):
+    return bool(get_shards()) and model._meta.label_lower in SHARDED_MODELS
+
+
+def shard_for_title(title_id):
+    shards = get_shards()
+    if not shards or title_id is None:
+        return None
+    return shards[crc32(str(int(title_id)).encode()) % len(shards)]
+
+
+def shard_for_id(pk):
+    """ Шард по id отзыва или комментария из его диапазона """
+    shards = get_shards()
+    index = pk // ID_SPAN - 1 if pk is not None else -1
+    return shards[index] if 0 <= index < len(shards) else None
+
+
+def id_range_start(alias):
+    """ Первый id отзывов и комментариев шарда """
+    return (settings.REVIEW_SHARDS.index(alias) + 1) * ID_SPAN
+
+
+def shard_for_instance(instance):
+    """ Шард, в котором хранится объект или его отзывы """
+    label = instance._meta.label_lower
+    if label == 'reviews.title':
+        return shard_for_title(instance.pk)
+    if label == 'reviews.review':
+        return shard_for_title(instance.title_id)
+    if label == 'reviews.comment':
+        if instance._state.db in get_shards():
+            return instance._state.db
+        review = instance._state.fields_cache.get('review')
+        if review is not None:
+            return shard_for_instance(review)
+        return shard_for_id(instance.review_id)
+    return None
+
+
+def apply_id_range(connection):
+    """
+    Поднимает счетчики id отзывов и комментариев шарда до начала его
+    диапазона. Только SQLite: пересоздание таблицы миграцией сбрасывает
+    счетчик, поэтому вызывается после каждой миграции.
+    """
+    if (connection.vendor != 'sqlite'
+            or connection.alias not in settings.REVIEW_SHARDS):
+        return
+    start = id_range_start(connection.alias)
+    with connection.cursor() as cursor:
+        for label in SHARDED_MODELS:
+            table = apps.get_model(label)._meta.db_table
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = MAX(seq, %s) '
+                'WHERE name = %s', [start - 1, table]
+            )
+            if not cursor.rowcount:
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                    [table, start - 1]
+                )
+
+
+def group_by_shard(title_ids):
+    """ {шард: id произведений}; без шардирования - {None: все id} """
+    groups = {}
+    for title_id in title_ids:
+        groups.setdefault(shard_for_title(title_id), []).append(title_id)
+    return groups
+
+
+def fan_out(func, aliases):
+    """
+    Вызывает func(alias) для каждого алиаса в своем потоке и возвращает
+    результаты в порядке алиасов. Соединения потоков закрываются.
+    """
+    if len(aliases) < 2:
+        return [func(alias) for alias in aliases]
+
+    def run(alias):
+        try:
+            return func(alias)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(aliases)) as pool:
+        return list(pool.map(run, aliases))
+
+
+def crosses_shard(model, path):
+    """ Ведет ли путь через связь с моделью, которой нет на шарде """
+    field = model._meta.get_field(path.split('__')[0])
+    return field.is_relation and not is_sharded(field.related_model)
+
+
+def split_joins(model, lookups):
+    """
+    Пути values_list через связь с моделью основной БД заменяются
+    внешним ключом: JOIN с ее таблицей на шарде невозможен. Возвращает
+    (пути, дочитываемые связи) для resolve_joins.
+    """
+    if not is_sharded(model):
+        return lookups, []
+    local = []
+    joins = []
+    for index, lookup in enumerate(lookups):
+        name, _, rest = lookup.partition('__')
+        if rest and crosses_shard(model, name):
+            field = model._meta.get_field(name)
+            local.append(field.attname)
+            joins.append((index, field.related_model, rest))
+        else:
+            local.append(lookup)
+    return local, joins
+
+
+def resolve_joins(rows, joins):
+    """ Подставляет значения связей из split_joins: запрос на связь """
+    if not joins:
+        return rows
+    rows = [list(row) for row in rows]
+    for index, model, lookup in joins:
+        values = dict(model._default_manager.filter(
+            pk__in={row[index] for row in rows} - {None}
+        ).values_list('pk', lookup))
+        for row in rows:
+            row[index] = values.get(row[index])
+    return rows
+
+
+def ordering_key(ordering):
+    """ Ключ сортировки объектов по полям order_by (с '-' - по убыванию) """
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def compare(first, second):
+        for name, descending in fields:
+            a, b = getattr(first, name), getattr(second, name)
+            if a != b:
+                return ((a < b) - (a > b)) if descending else (
+                    (a > b) - (a < b)
+                )
+        return 0
+
+    return cmp_to_key(compare)
+
+
+class FanOutQuery:
+    """
+    Выборка по всем шардам: запрос выполняется на каждом шарде в своем
+    потоке, объекты сливаются в порядке order_by выборки. Поддерживает
+    то, что нужно пагинации: filter, order_by, count, exists, срезы и
+    итерацию, а также delete.
+    """
+
+    def __init__(self, queryset, shards):
+        self.queryset = queryset
+        self.shards = shards
+        self.model = queryset.model
+
+    def _clone(self, queryset):
+        return FanOutQuery(queryset, self.shards)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(self.queryset.filter(*args, **kwargs))
+
+    def exclude(self, *args, **kwargs):
+        return self._clone(self.queryset.exclude(*args, **kwargs))
+
+    def order_by(self, *fields):
+        return self._clone(self.queryset.order_by(*fields))
+
+    def values_list(self, *fields, **kwargs):
+        return self._clone(self.queryset.values_list(*fields, **kwargs))
+
+    def map(self, func):
+        return fan_out(
+            lambda alias: func(self.queryset.using(alias)), self.shards
+        )
+
+    def count(self):
+        return sum(self.map(lambda queryset: queryset.count()))
+
+    def exists(self):
+        return any(self.map(lambda queryset: queryset.exists()))
+
+    def delete(self):
+        """
+        Удаляет последовательно в текущем потоке: обработчики сигналов
+        удаления пишут в основную БД, возможно, внутри транзакции.
+        """
+        deleted = 0
+        for alias in self.shards:
+            deleted += self.queryset.using(alias).delete()[0]
+        return deleted
+
+    def get_ordering(self):
+        query = self.queryset.query
+        if query.order_by:
+            return query.order_by
+        return self.model._meta.ordering if query.default_ordering else ()
+
+    def merge(self, results):
+        ordering = self.get_ordering()
+        if not ordering or self.queryset._fields is not None:
+            return (item for result in results for item in result)
+        return heapq.merge(*results, key=ordering_key(ordering))
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self[key:key + 1])[0]
+        if key.step is not None:
+            raise TypeError('Шаг среза не поддерживается.')
+        start, stop = key.start or 0, key.stop
+        results = self.map(lambda queryset: list(
+            queryset if stop is None else queryset[:stop]
+        ))
+        return list(islice(self.merge(results), start, stop))
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+class ShardedQuerySet(models.QuerySet):
+    """ Выборка шардированной модели; title_lookup - путь к id произведения """
+    title_lookup = 'title_id'
+
+    def for_title(self, title_id):
+        """ Объекты одного произведения: запрос идет в его шард """
+        queryset = self.filter(**{self.title_lookup: title_id})
+        alias = shard_for_title(title_id)
+        return queryset if alias is None else queryset.using(alias)
+
+    def for_titles(self, title_ids):
+        """ Объекты нескольких произведений: только их шарды """
+        title_ids = set(title_ids)
+        queryset = self.filter(**{f'{self.title_lookup}__in': title_ids})
+        if not is_sharded(self.model):
+            return queryset
+        return FanOutQuery(queryset, sorted(group_by_shard(title_ids)))
+
+    def across_shards(self):
+        """ Выборка по всем произведениям, при шардировании - FanOutQuery """
+        if not is_sharded(self.model):
+            return self
+        return FanOutQuery(self, get_shards())
+
+    def create(self, **kwargs):
+        """ Шард нового объекта роутер выбирает по самому объекту """
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """ При шардировании - по bulk_create на шард объектов """
+        if self._db is not None or not is_sharded(self.model):
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        groups = {}
+        for obj in objs:
+            groups.setdefault(shard_for_instance(obj), []).append(obj)
+        for alias, group in groups.items():
+            super(ShardedQuerySet, self.using(alias)).bulk_create(
+                group, *args, **kwargs
+            )
+        return objs
+
+    def select_related(self, *fields):
+        """
+        При шардировании связи с моделями основной БД не присоединяются
+        JOIN, а догружаются prefetch_related отдельным запросом.
+        """
+        if fields == (None,) or not is_sharded(self.model):
+            return super().select_related(*fields)
+        local = [path for path in fields
+                 if not crosses_shard(self.model, path)]
+        remote = [path for path in fields if path not in local]
+        queryset = super().select_related(*local) if local else self._chain()
+        return queryset.prefetch_related(*remote) if remote else queryset
+
+
+class CommentQuerySet(ShardedQuerySet):
+    title_lookup = 'review__title_id'
@@ -0,0 +1,62 @@
+from django.db import connections
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_delete
+)
+from django.dispatch import Signal, receiver
+
+from reviews import sharding
+from reviews.models import Comment, Review, Title, User
+
+# Отправляется после массовой загрузки в обход save(): models - список
+# моделей, в которые были записаны строки.
+bulk_loaded = Signal()
+
+
+@receiver([post_save, post_delete], sender=Review)
+def refresh_title_review_stats(sender, instance, **kwargs):
+    """ Сохраненные рейтинг и число отзывов следуют за отзывами """
+    Title.objects.filter(pk=instance.title_id).refresh_review_stats()
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def refresh_review_comment_count(sender, instance, **kwargs):
+    """ Сохраненное число комментариев следует за комментариями """
+    if kwargs.get('created') is False:
+        return
+    Review.objects.using(instance._state.db).filter(
+        pk=instance.review_id
+    ).refresh_comment_stats()
+
+
+@receiver(bulk_loaded)
+def refresh_loaded_review_stats(sender, models, **kwargs):
+    if Review in models:
+        Title.objects.all().refresh_review_stats()
+    if Comment in models:
+        for alias in sharding.get_shards() or [None]:
+            Review.objects.db_manager(alias).all().refresh_comment_stats()
+
+
+@receiver(pre_delete, sender=Title)
+def delete_sharded_title_reviews(sender, instance, **kwargs):
+    """
+    Каскадное удаление не видит строк в шардах: отзывы произведения
+    вместе с комментариями удаляются из его шарда отдельно.
+    """
+    if sharding.is_sharded(Review):
+        Review.objects.for_title(instance.pk).delete()
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_user_activity(sender, instance, **kwargs):
+    if sharding.is_sharded(Review):
+        Review.objects.across_shards().filter(author_id=instance.pk).delete()
+        Comment.objects.across_shards().filter(
+            author_id=instance.pk
+        ).delete()
+
+
+@receiver(post_migrate)
+def apply_shard_id_ranges(sender, using, **kwargs):
+    if sender.name == 'reviews':
+        sharding.apply_id_range(connections[using])
@@ -0,0 +1,341 @@
+"""
+Бенчмарк всех эндпоинтов api/urls.py на сгенерированных данных.
+
+    python benchmarks/endpoints.py [--scale small] [--repeat 30]
+        [--baseline benchmarks/baselines/small.json] [--threshold 0.5]
+        [--min-delta 2] [--output results.json] [--save-baseline]
+
+Данные генерируются gendata во временной тестовой БД. Каждый сценарий
+(список, объект, создание, фильтр, поиск, дальняя страница) выполняется
+через тестовый клиент --repeat раз после прогрева; записываются
+p50/p95/p99 времени ответа, число SQL-запросов на запрос и пик памяти
+(tracemalloc, отдельным проходом). Результаты сохраняются в JSON и
+сравниваются с базовыми: рост медианы больше чем на --threshold (и не
+меньше --min-delta мс, чтобы не ловить шум быстрых ответов) или рост
+числа запросов считается регрессией, и скрипт завершается с кодом 1.
+p95/p99 при паре десятков повторов слишком шумные для сравнения и
+только записываются. Базовые результаты имеют смысл только для той
+же машины: перед изменением сохраните свои (--save-baseline).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack
+from io import StringIO
+from itertools import count
+from pathlib import Path
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'api_yamdb')
+)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_yamdb.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import DEFAULT_DB_ALIAS, connections  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext, setup_databases, setup_test_environment,
+    teardown_databases
+)
+from django.core.management import call_command  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from reviews import sharding  # noqa: E402
+from reviews.models import (  # noqa: E402
+    ADMIN, Category, Genre, Review, Title, User
+)
+
+BASELINES = Path(__file__).resolve().parent / 'baselines'
+API = '/api/v1'
+
+
+class Scenario:
+    """
+    Запрос сценария: method и функция номера повтора -> (url, данные).
+    Ожидаемый код ответа проверяется на каждом повторе.
+    """
+
+    def __init__(self, name, method, build, status=200, **options):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.status = status
+        self.options = options or {'format': 'json'}
+
+    def send(self, client, iteration):
+        url, data = self.build(iteration)
+        response = getattr(client, self.method)(url, data, **self.options)
+        assert response.status_code == self.status, (
+            self.name, url, response.status_code, response.content[:200]
+        )
+        return response
+
+
+def get(name, url):
+    return Scenario(name, 'get', lambda iteration: (url, None))
+
+
+def get_samples():
+    """ Объекты для адресов: самое популярное произведение и т.д. """
+    title = Title.objects.order_by('-review_count').first()
+    review = Review.objects.for_title(title.pk).order_by(
+        '-comment_count'
+    ).first()
+    return {
+        'title': title,
+        'review': review,
+        'comment': review.comments.order_by('pk').first(),
+        'category': Category.objects.order_by('pk').first(),
+        'genre': Genre.objects.order_by('pk').first(),
+        'user': User.objects.exclude(role=ADMIN).order_by('pk').first(),
+        'titles': Title.objects.count(),
+        'reviews': Review.objects.count(),
+        'users': User.objects.count(),
+    }
+
+
+def get_read_scenarios(samples):
+    title = samples['title']
+    titles = f'{API}/titles/'
+    reviews = f'{titles}{title.pk}/reviews/'
+    comments = f'{reviews}{samples["review"].pk}/comments/'
+
+    def last_page(total):
+        return f'limit=10&offset={max(total - 10, 0)}'
+
+    return [
+        get('titles.list', titles),
+        get('titles.detail', f'{titles}{title.pk}/'),
+        get('titles.filter.genre', f'{titles}?genre={samples["genre"].slug}'),
+        get('titles.filter.category',
+            f'{titles}?category={samples["category"].slug}'),
+        get('titles.filter.year', f'{titles}?year_min=2000&year_max=2010'),
+        get('titles.ordering', f'{titles}?ordering=-rating'),
+        get('titles.facets', f'{titles}?facets=true'),
+        get('titles.sideload', f'{titles}?sideload=true'),
+        get('titles.deep_page', f'{titles}?{last_page(samples["titles"])}'),
+        get('categories.list', f'{API}/categories/'),
+        get('categories.search', f'{API}/categories/?search=и'),
+        get('genres.list', f'{API}/genres/'),
+        get('genres.search', f'{API}/genres/?search=а'),
+        get('reviews.list', reviews),
+        get('reviews.detail', f'{reviews}{samples["review"].pk}/'),
+        get('reviews.search', f'{reviews}?search=финал'),
+        get('reviews.deep_page',
+            f'{reviews}?{last_page(title.review_count)}'),
+        get('reviews.feed', f'{API}/reviews/'),
+        get('reviews.feed.author',
+            f'{API}/reviews/?author={samples["user"].username}'),
+        get('reviews.feed.deep_page',
+            f'{API}/reviews/?{last_page(samples["reviews"])}'),
+        get('comments.list', comments),
+        get('comments.detail', f'{comments}{samples["comment"].pk}/'),
+        get('users.list', f'{API}/users/'),
+        get('users.search', f'{API}/users/?search=user1'),
+        get('users.detail', f'{API}/users/{samples["user"].username}/'),
+        get('users.me', f'{API}/users/me/'),
+        get('users.deep_page', f'{API}/users/?{last_page(samples["users"])}'),
+    ]
+
+
+def get_import(title_ids, lines=10):
+    """ JSONL импорта: lines отзывов bench_importer, свои на каждый повтор """
+    author = User.objects.get_or_create(
+        username='bench_importer', email='bench_importer@yamdb.fake'
+    )[0].username
+
+    def build(iteration):
+        start = iteration * lines
+        body = '\n'.join(json.dumps({
+            'title_id': title_ids[(start + number) % len(title_ids)],
+            'author': author, 'text': 'bench', 'score': 5,
+        }) for number in range(lines))
+        return f'{API}/reviews/import/', body
+
+    return build
+
+
+def get_write_scenarios(samples):
+    title = samples['title']
+    comments = (
+        f'{API}/titles/{title.pk}/reviews/{samples["review"].pk}/comments/'
+    )
+    # Отзыв администратора - по одному на произведение
+    all_ids = list(Title.objects.order_by('pk').values_list('pk', flat=True))
+    title_ids = iter(all_ids)
+    batch = [f'{API}/titles/{title.pk}/', f'{API}/categories/',
+             f'{API}/genres/', f'{API}/titles/{title.pk}/reviews/']
+    return [
+        Scenario('categories.create', 'post', lambda i: (
+            f'{API}/categories/', {'name': f'Bench {i}', 'slug': f'bc-{i}'}
+        ), status=201),
+        Scenario('genres.create', 'post', lambda i: (
+            f'{API}/genres/', {'name': f'Bench {i}', 'slug': f'bg-{i}'}
+        ), status=201),
+        # TitleSerializer читает жанры через initial_data.getlist
+        Scenario('titles.create', 'post', lambda i: (f'{API}/titles/', {
+            'name': f'Bench {i}', 'year': 2000, 'description': 'bench',
+            'category': samples['category'].slug,
+            'genre': [samples['genre'].slug],
+        }), status=201, format='multipart'),
+        Scenario('reviews.import', 'post', get_import(all_ids),
+                 content_type='application/x-ndjson'),
+        Scenario('reviews.create', 'post', lambda i: (
+            f'{API}/titles/{next(title_ids)}/reviews/',
+            {'text': 'bench', 'score': 7},
+        ), status=201),
+        Scenario('comments.create', 'post', lambda i: (
+            comments, {'text': f'bench {i}'}
+        ), status=201),
+        Scenario('users.create', 'post', lambda i: (f'{API}/users/', {
+            'username': f'bench_user_{i}', 'email': f'bench{i}@yamdb.fake',
+        }), status=201),
+        Scenario('auth.signup', 'post', lambda i: (f'{API}/auth/signup/', {
+            'username': f'bench_signup_{i}',
+            'email': f'signup{i}@yamdb.fake',
+        })),
+        Scenario('batch', 'post', lambda i: (f'{API}/batch/', {
+            'requests': [{'path': path} for path in batch],
+            'parallel': True,
+        })),
+    ]
+
+
+def get_aliases():
+    # Пакет и поток записи комментариев работают в своих потоках и
+    # соединениях: их запросы здесь не видны
+    return [DEFAULT_DB_ALIAS, *sharding.get_shards()]
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def measure(client, scenario, iterations, repeat):
+    """ Время и число запросов повторов, затем пик памяти одного """
+    scenario.send(client, next(iterations))
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        with ExitStack() as stack:
+            contexts = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in get_aliases()
+            ]
+            started = time.perf_counter()
+            scenario.send(client, next(iterations))
+            timings.append(time.perf_counter() - started)
+        queries.append(sum(len(context) for context in contexts))
+    tracemalloc.start()
+    try:
+        scenario.send(client, next(iterations))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'queries': statistics.median(queries),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, threshold, min_delta):
+    """ Регрессии относительно базовых результатов: список строк """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        slower = current['p50_ms'] - base['p50_ms']
+        if slower > max(base['p50_ms'] * threshold, min_delta):
+            regressions.append(
+                f'{name}: p50 {base["p50_ms"]} -> {current["p50_ms"]} мс'
+            )
+        if current['queries'] > base['queries']:
+            regressions.append(
+                f'{name}: запросов {base["queries"]} -> {current["queries"]}'
+            )
+    return regressions
+
+
+def run(args):
+    call_command('gendata', f'--scale={args.scale}', stdout=StringIO())
+    admin = User.objects.create(
+        username='bench_admin', email='bench_admin@yamdb.fake', role=ADMIN
+    )
+    client = APIClient()
+    client.force_authenticate(admin)
+    samples = get_samples()
+    results = {}
+    print(f'{"scenario":<26} {"p50":>9} {"p95":>9} {"p99":>9} '
+          f'{"queries":>8} {"peak KiB":>9}')
+    for scenario in (
+        get_read_scenarios(samples) + get_write_scenarios(samples)
+    ):
+        result = measure(client, scenario, count(), args.repeat)
+        results[scenario.name] = result
+        print(f'{scenario.name:<26} {result["p50_ms"]:>9} '
+              f'{result["p95_ms"]:>9} {result["p99_ms"]:>9} '
+              f'{result["queries"]:>8} {result["peak_kib"]:>9}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', default='small',
+                        choices=('small', 'medium', 'large'))
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--min-delta', type=float, default=2.0)
+    parser.add_argument('--baseline', type=Path)
+    parser.add_argument('--output', type=Path)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+    baseline_path = args.baseline or BASELINES / f'{args.scale}.json'
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        results = run(args)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+    report = {
+        'scale': args.scale,
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'results': results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + '\n')
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2) + '\n')
+        print(f'Базовые результаты сохранены в {baseline_path}')
+        return
+    if not baseline_path.exists():
+        print(f'Нет базовых результатов {baseline_path}')
+        return
+    baseline = json.loads(baseline_path.read_text())['results']
+    regressions = compare(
+        results, baseline, args.threshold, args.min_delta
+    )
+    for regression in regressions:
+        print(f'РЕГРЕССИЯ {regression}')
+    if regressions:
+        sys.exit(1)
+    print('Регрессий нет')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Сравнение list вьюсетов через values_list и через сериализаторы.
+
+    python benchmarks/list_fast_path.py [--scale small] [--limit 100 1000]
+
+Данные генерируются gendata во временной тестовой БД, каждый запрос
+повторяется --repeat раз, выводится медиана времени ответа.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from io import StringIO
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'api_yamdb')
+)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_yamdb.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db.models import Count  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases, setup_test_environment, teardown_databases
+)
+
+from api.views import CommentViewSet, ReviewViewSet, TitleViewSet  # noqa
+from reviews.models import Review, Title  # noqa: E402
+
+VIEWSETS = (TitleViewSet, ReviewViewSet, CommentViewSet)
+
+
+def measure(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, (url, response.status_code)
+    return statistics.median(timings), response.content
+
+
+def set_fast_list(enabled):
+    for viewset in VIEWSETS:
+        viewset.fast_list = enabled
+
+
+def get_urls(limits):
+    title_id = Title.objects.order_by('-review_count').first().pk
+    busiest = Review.objects.annotate(
+        comment_count=Count('comments')
+    ).order_by('-comment_count').first()
+    urls = []
+    for limit in limits:
+        urls += [
+            f'/api/v1/titles/?limit={limit}',
+            f'/api/v1/titles/{title_id}/reviews/?limit={limit}',
+            f'/api/v1/titles/{busiest.title_id}/reviews/{busiest.pk}/'
+            f'comments/?limit={limit}',
+        ]
+    return urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', default='small')
+    parser.add_argument('--limit', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        call_command(
+            'gendata', f'--scale={args.scale}', '--comments-per-review=2',
+            stdout=StringIO()
+        )
+        client = Client()
+        print(f'{"url":<60} {"serializer":>11} {"values":>9} {"speedup":>8}')
+        for url in get_urls(args.limit):
+            set_fast_list(False)
+            slow, slow_content = measure(client, url, args.repeat)
+            set_fast_list(True)
+            fast, fast_content = measure(client, url, args.repeat)
+            assert fast_content == slow_content, url
+            print(f'{url:<60} {slow * 1000:>9.1f}ms {fast * 1000:>7.1f}ms '
+                  f'{slow / fast:>7.1f}x')
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Пропускная способность чтения под WSGI и ASGI при большом числе
+одновременных медленных клиентов.
+
+    python benchmarks/wsgi_asgi.py [--scale small] [--concurrency 200]
+
+Данные генерируются gendata во временной тестовой БД. Обработчики
+вызываются в процессе без сети, клиенты работают по замкнутому циклу:
+следующий запрос - после ответа на предыдущий; учитываются ответы,
+полученные за --duration секунд. Медленный клиент читает
+ответ --client-delay секунд:
+- wsgi: --threads рабочих потоков, как gthread у gunicorn; поток занят,
+  пока клиент читает ответ;
+- asgi-sync: ASGI с синхронными вьюсетами (общий поток Django 3.2);
+- asgi: ASGI с async-представлениями чтения (ASYNC_READ_VIEWS), ответ
+  медленному клиенту отдает цикл событий.
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import statistics
+import sys
+import threading
+import time
+from io import StringIO
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'api_yamdb')
+)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_yamdb.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases, setup_test_environment, teardown_databases
+)
+from django.urls import clear_url_caches  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from reviews.models import ADMIN, Review, Title, User  # noqa: E402
+
+
+def use_async_views(enabled):
+    import api.urls
+    import api_yamdb.urls
+    settings.ASYNC_READ_VIEWS = enabled
+    importlib.reload(api.urls)
+    importlib.reload(api_yamdb.urls)
+    clear_url_caches()
+
+
+def get_urls():
+    title_id = Title.objects.order_by('-review_count').first().pk
+    review = Review.objects.order_by('-comment_count').first()
+    return [
+        '/api/v1/titles/?limit=20',
+        f'/api/v1/titles/{title_id}/',
+        f'/api/v1/titles/{title_id}/reviews/?limit=20',
+        f'/api/v1/titles/{review.title_id}/reviews/{review.pk}/'
+        'comments/?limit=20',
+    ]
+
+
+def run_wsgi(urls, token, args):
+    handler = WSGIHandler()
+    factory = RequestFactory()
+    workers = threading.Semaphore(args.threads)
+    deadline = time.perf_counter() + args.duration
+    latencies = []
+    errors = []
+
+    def start_response(status, headers, exc_info=None):
+        if not status.startswith('200'):
+            errors.append(status)
+
+    def client(offset):
+        index = offset
+        while time.perf_counter() < deadline:
+            path, _, query = urls[index % len(urls)].partition('?')
+            index += 1
+            started = time.perf_counter()
+            with workers:
+                response = handler(factory._base_environ(
+                    PATH_INFO=path, QUERY_STRING=query,
+                    HTTP_AUTHORIZATION=f'Bearer {token}',
+                ), start_response)
+                b''.join(response)
+                response.close()
+                time.sleep(args.client_delay)
+            finished = time.perf_counter()
+            if finished <= deadline:
+                latencies.append(finished - started)
+
+    clients = [
+        threading.Thread(target=client, args=(offset,))
+        for offset in range(args.concurrency)
+    ]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return latencies, errors
+
+
+def run_asgi(urls, token, args):
+    handler = ASGIHandler()
+    latencies = []
+    errors = []
+
+    async def request(url):
+        path, _, query = url.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'root_path': '',
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Bearer {token}'.encode()),
+            ],
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if (message['type'] == 'http.response.start'
+                    and message['status'] != 200):
+                errors.append(message['status'])
+            if (message['type'] == 'http.response.body'
+                    and not message.get('more_body')):
+                await asyncio.sleep(args.client_delay)
+
+        await handler(scope, receive, send)
+
+    async def client(offset, deadline):
+        index = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await request(urls[index % len(urls)])
+            index += 1
+            finished = time.perf_counter()
+            if finished <= deadline:
+                latencies.append(finished - started)
+
+    async def main():
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*(
+            client(offset, deadline) for offset in range(args.concurrency)
+        ))
+
+    asyncio.run(main())
+    return latencies, errors
+
+
+def report(mode, latencies, errors, duration):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+    print(f'{mode:<10} {len(latencies) / duration:>8.1f} '
+          f'{statistics.median(latencies or [0]) * 1000:>8.1f}ms '
+          f'{p95 * 1000:>8.1f}ms {len(errors):>7}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', default='small')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--client-delay', type=float, default=0.5)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        call_command('gendata', f'--scale={args.scale}', stdout=StringIO())
+        admin = User.objects.create(
+            username='bench', email='bench@yamdb.fake', role=ADMIN
+        )
+        token = AccessToken.for_user(admin)
+        urls = get_urls()
+        settings.ASYNC_READ_THREADS = args.threads
+        print(f'{"mode":<10} {"req/s":>8} {"p50":>10} {"p95":>10} '
+              f'{"errors":>7}')
+        use_async_views(False)
+        report('wsgi', *run_wsgi(urls, token, args), args.duration)
+        report('asgi-sync', *run_asgi(urls, token, args), args.duration)
+        use_async_views(True)
+        report('asgi', *run_asgi(urls, token, args), args.duration)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 import os
 import sys
 
+import pytest
+from django.test import override_settings
 from django.utils.version import get_version
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -33,3 +35,14 @@ assert get_version() < '4.0.0', 'Пожалуйста, используйте в
 pytest_plugins = [
     'tests.fixtures.fixture_user',
 ]
+
+
+@pytest.fixture(autouse=True, scope='session')
+def shared_cache(tmp_path_factory):
+    """ Общий кэш процессов - свой для каждого запуска тестов """
+    directory = tmp_path_factory.mktemp('cache')
+    with override_settings(SHARED_CACHE_DIR=directory, CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': directory,
+    }}):
+        yield
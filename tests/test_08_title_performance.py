@@ -0,0 +1,276 @@
+from http import HTTPStatus
+
+import pytest
+
+from api import cache
+from api.index import iter_bits, title_index
+from reviews.models import Category, Genre, Title
+from reviews.signals import bulk_loaded
+from tests.utils import create_titles, run_in_process
+
+
+def delete_category(slug):
+    Category.objects.filter(slug=slug).delete()
+
+
+def create_title(year):
+    Title.objects.create(name='Из другого процесса', year=year)
+
+
+def bulk_create_title(year):
+    """ Как loadcsv --bulk и gendata: без post_save, с bulk_loaded """
+    Title.objects.bulk_create([Title(name='Пакетная загрузка', year=year)])
+    bulk_loaded.send(sender=None, models=[Title])
+
+
+@pytest.mark.django_db(transaction=True)
+class Test08TitlePerformance:
+
+    TITLES_URL = '/api/v1/titles/'
+
+    def test_01_catalog_lookups_are_cached(self, admin_client, client,
+                                           django_assert_num_queries):
+        titles, categories, genres = create_titles(admin_client)
+        client.get(self.TITLES_URL)
+        with django_assert_num_queries(3):
+            response = client.get(self.TITLES_URL)
+        assert response.status_code == HTTPStatus.OK
+        first = response.json()['results'][0]
+        assert first['category'] == categories[0], (
+            'Категория произведения из кэша должна совпадать с данными '
+            'справочника.'
+        )
+
+    def test_02_catalog_cache_invalidated_on_write(self, admin_client,
+                                                   client):
+        titles, categories, genres = create_titles(admin_client)
+        client.get(self.TITLES_URL)
+        admin_client.delete(f'/api/v1/categories/{categories[0]["slug"]}/')
+        response = client.get(
+            f'{self.TITLES_URL}?category={categories[0]["slug"]}'
+        )
+        assert response.json()['count'] == 0, (
+            'После удаления категории кэш справочника должен сбрасываться.'
+        )
+        response = client.get(f'{self.TITLES_URL}{titles[0]["id"]}/')
+        assert response.json()['category'] is None
+
+    def test_03_title_multi_genre_filter(self, admin_client, client):
+        titles, categories, genres = create_titles(admin_client)
+        horror, comedy, drama = (genre['slug'] for genre in genres)
+        cases = (
+            (f'genre={horror},{drama}', {titles[0]['id'], titles[1]['id']}),
+            (f'genre={horror},{comedy}&genre_mode=and', {titles[0]['id']}),
+            (f'genre={horror},{drama}&genre_mode=and', set()),
+            (f'genre={drama}&category={categories[1]["slug"]}',
+             {titles[1]['id']}),
+            ('year_min=1985&year_max=1990', {titles[1]['id']}),
+            ('year=1984', {titles[0]['id']}),
+        )
+        for query, expected in cases:
+            response = client.get(f'{self.TITLES_URL}?{query}')
+            assert response.status_code == HTTPStatus.OK
+            found = {title['id'] for title in response.json()['results']}
+            assert found == expected, (
+                f'Проверьте фильтрацию произведений по запросу `{query}`.'
+            )
+
+    def test_04_title_index_follows_genre_changes(self, admin_client,
+                                                  client):
+        titles, categories, genres = create_titles(admin_client)
+        client.get(f'{self.TITLES_URL}?genre={genres[2]["slug"]}')
+        response = admin_client.patch(
+            f'{self.TITLES_URL}{titles[0]["id"]}/',
+            data={'genre': [genres[2]['slug']],
+                  'category': categories[0]['slug']}
+        )
+        assert response.status_code == HTTPStatus.OK
+        response = client.get(f'{self.TITLES_URL}?genre={genres[2]["slug"]}')
+        found = {title['id'] for title in response.json()['results']}
+        assert found == {titles[0]['id'], titles[1]['id']}
+        response = client.get(f'{self.TITLES_URL}?genre={genres[0]["slug"]}')
+        assert response.json()['count'] == 0
+
+    def test_05_title_facets(self, admin_client, client,
+                             django_assert_max_num_queries):
+        titles, categories, genres = create_titles(admin_client)
+        client.get(f'{self.TITLES_URL}?facets=true')
+        with django_assert_max_num_queries(4):
+            response = client.get(f'{self.TITLES_URL}?facets=true')
+        facets = response.json().get('facets')
+        assert facets == {
+            'genre': {'horror': 1, 'comedy': 1, 'drama': 1},
+            'category': {'films': 1, 'books': 1},
+            'decade': {'1980': 2},
+        }, 'Проверьте счетчики `facets` для списка произведений.'
+        response = client.get(
+            f'{self.TITLES_URL}?facets=true&genre={genres[2]["slug"]}'
+        )
+        assert response.json()['facets'] == {
+            'genre': {'drama': 1},
+            'category': {'books': 1},
+            'decade': {'1980': 1},
+        }
+        response = client.get(self.TITLES_URL)
+        assert 'facets' not in response.json()
+
+    def test_06_title_ordering(self, admin_client, client, user_client):
+        titles, categories, genres = create_titles(admin_client)
+        user_client.post(
+            f'{self.TITLES_URL}{titles[1]["id"]}/reviews/',
+            data={'text': 'review', 'score': 7}
+        )
+        cases = (
+            ('name', [titles[1]['id'], titles[0]['id']]),
+            ('-year', [titles[1]['id'], titles[0]['id']]),
+            ('year', [titles[0]['id'], titles[1]['id']]),
+            ('-rating', [titles[1]['id'], titles[0]['id']]),
+            ('review_count', [titles[0]['id'], titles[1]['id']]),
+        )
+        for ordering, expected in cases:
+            response = client.get(f'{self.TITLES_URL}?ordering={ordering}')
+            assert response.status_code == HTTPStatus.OK
+            found = [title['id'] for title in response.json()['results']]
+            assert found == expected, (
+                f'Проверьте сортировку произведений `?ordering={ordering}`.'
+            )
+        response = client.get(f'{self.TITLES_URL}{titles[1]["id"]}/')
+        assert response.json()['rating'] == 7
+        for ordering in ('description', 'name,year', '-rating,-id'):
+            response = client.get(f'{self.TITLES_URL}?ordering={ordering}')
+            assert response.status_code == HTTPStatus.BAD_REQUEST, (
+                'Неподдерживаемая сортировка должна отклоняться со '
+                'статусом 400.'
+            )
+
+    def test_07_title_sideload(self, admin_client, client):
+        titles, categories, genres = create_titles(admin_client)
+        admin_client.post(self.TITLES_URL, data={
+            'name': 'Чужой', 'year': 1979, 'genre': [genres[0]['slug']],
+            'category': categories[0]['slug'], 'description': 'In space',
+        })
+        response = client.get(f'{self.TITLES_URL}?sideload=true')
+        assert response.status_code == HTTPStatus.OK
+        data = response.json()
+        first = next(
+            title for title in data['results']
+            if title['id'] == titles[0]['id']
+        )
+        assert first['category'] == categories[0]['slug']
+        assert first['genre'] == [genres[0]['slug'], genres[1]['slug']], (
+            'С ?sideload=true жанры произведения выводятся списком slug.'
+        )
+        assert sorted(
+            data['included']['categories'], key=lambda item: item['slug']
+        ) == sorted(categories, key=lambda item: item['slug'])
+        assert sorted(
+            data['included']['genres'], key=lambda item: item['slug']
+        ) == sorted(genres, key=lambda item: item['slug']), (
+            'Каждая категория и жанр страницы должны попадать в included '
+            'ровно один раз.'
+        )
+        response = client.get(f'{self.TITLES_URL}{titles[0]["id"]}/'
+                              '?sideload=true')
+        assert response.json()['category'] == categories[0]
+
+    def test_08_catalog_cache_invalidated_by_other_process(self,
+                                                          admin_client):
+        titles, categories, genres = create_titles(admin_client)
+        slug = categories[0]['slug']
+        assert cache.categories.get_by_slug(slug) is not None
+        run_in_process(delete_category, slug)
+        assert cache.categories.get_by_slug(slug) is None, (
+            'Удаление категории в другом процессе должно сбрасывать кэш '
+            'справочника.'
+        )
+        response = admin_client.post(self.TITLES_URL, data={
+            'name': 'Чужой', 'year': 1979, 'genre': [genres[0]['slug']],
+            'category': slug, 'description': 'In space',
+        })
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+    def test_09_title_index_follows_other_processes(self, admin_client):
+        create_titles(admin_client)
+        assert set(iter_bits(title_index.match(year=2000))) == set()
+        for write in (create_title, bulk_create_title):
+            run_in_process(write, 2000)
+            expected = set(
+                Title.objects.filter(year=2000).values_list('id', flat=True)
+            )
+            assert set(iter_bits(title_index.match(year=2000))) == (
+                expected
+            ), (
+                'Индекс произведений должен видеть записи других '
+                f'процессов: {write.__name__}.'
+            )
+
+    def test_10_catalog_version_read_once_per_request(self, admin_client,
+                                                      client, monkeypatch):
+        create_titles(admin_client)
+        reads = []
+        get_version = cache.get_version
+
+        def counting_get_version(key):
+            reads.append(key)
+            return get_version(key)
+
+        monkeypatch.setattr(cache, 'get_version', counting_get_version)
+        for url in (f'{self.TITLES_URL}?limit=100',
+                    f'{self.TITLES_URL}?limit=100&facets=true'):
+            reads.clear()
+            assert client.get(url).status_code == HTTPStatus.OK
+            assert sorted(reads) == sorted({
+                cache.categories.version_key, cache.genres.version_key
+            }), 'Версия справочника должна читаться один раз на запрос.'
+
+    def test_11_genre_deleted_during_request(self, admin_client, client,
+                                             monkeypatch):
+        titles, categories, genres = create_titles(admin_client)
+        deleted = Genre.objects.get(slug=genres[0]['slug']).pk
+        get = cache.genres.get
+        monkeypatch.setattr(
+            cache.genres, 'get',
+            lambda pk: None if pk == deleted else get(pk)
+        )
+        for url in (self.TITLES_URL, f'{self.TITLES_URL}{titles[0]["id"]}/'):
+            response = client.get(url)
+            assert response.status_code == HTTPStatus.OK, (
+                'Жанр, удаленный после чтения связей, не должен '
+                'приводить к ошибке.'
+            )
+            data = response.json()
+            title = next(
+                title for title in data.get('results', [data])
+                if title['id'] == titles[0]['id']
+            )
+            assert title['genre'] == [genres[1]]
+
+    def test_12_sideload_skips_deleted_catalog(self, admin_client, client,
+                                               monkeypatch):
+        titles, categories, genres = create_titles(admin_client)
+        deleted = Genre.objects.get(slug=genres[0]['slug']).pk
+        get = cache.genres.get
+        get_by_slug = cache.categories.get_by_slug
+        monkeypatch.setattr(
+            cache.genres, 'get',
+            lambda pk: None if pk == deleted else get(pk)
+        )
+        monkeypatch.setattr(
+            cache.categories, 'get_by_slug',
+            lambda slug: (
+                None if slug == categories[0]['slug'] else get_by_slug(slug)
+            )
+        )
+        response = client.get(f'{self.TITLES_URL}?sideload=true')
+        assert response.status_code == HTTPStatus.OK, (
+            'Категория или жанр, удаленные во время запроса, не должны '
+            'приводить к ошибке.'
+        )
+        data = response.json()
+        first = next(
+            title for title in data['results']
+            if title['id'] == titles[0]['id']
+        )
+        assert first['genre'] == [genres[1]['slug']]
+        assert data['included']['categories'] == [categories[1]]
+        assert genres[0] not in data['included']['genres']
@@ -0,0 +1,254 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from reviews.management.loading import (
+    TEST_DATA, dependency_graph, iter_range_lines, split_ranges
+)
+from reviews.models import (
+    Category, Comment, Genre, GenreTitle, Review, Title, User
+)
+from tests.conftest import MANAGE_PATH
+
+DATA_DIR = 'static/data'
+# pub_date первого отзыва в static/data/review.csv
+PUB_DATE = datetime(2019, 9, 24, 21, 8, 21, 567000, tzinfo=timezone.utc)
+
+
+@pytest.mark.django_db(transaction=True)
+class Test09LoadCsv:
+
+    def test_01_bulk_load(self, client):
+        out = StringIO()
+        call_command('loadcsv', DATA_DIR, '--bulk', '--batch-size=10',
+                     stdout=out)
+        assert Title.objects.count() == 32
+        assert GenreTitle.objects.count() == 42
+        assert Review.objects.count() == 72
+        assert Comment.objects.count() == 3
+        assert 'review: 72' in out.getvalue(), (
+            'Проверьте, что loadcsv --bulk выводит итог по каждой таблице.'
+        )
+        assert Review.objects.get(pk=1).pub_date == PUB_DATE, (
+            'loadcsv --bulk должен сохранять даты из файла.'
+        )
+        title = Title.objects.get(pk=1)
+        assert title.category_id == 1
+        assert title.review_count == Review.objects.filter(title=1).count()
+        response = client.get('/api/v1/titles/?genre=drama&category=movie')
+        assert response.json()['count'] == Title.objects.filter(
+            genre__slug='drama', category__slug='movie'
+        ).count() > 0, (
+            'После массовой загрузки индекс и кэш справочников должны '
+            'сбрасываться.'
+        )
+
+    def test_02_bad_foreign_keys_are_rejected(self, tmp_path):
+        data_dir = tmp_path / 'data'
+        shutil.copytree(os.path.join(MANAGE_PATH, DATA_DIR), data_dir)
+        with open(data_dir / 'review.csv', 'a', newline='') as review_file:
+            review_file.write('\n')
+            csv.writer(review_file).writerow(
+                [9001, 9999, 'bad title', 100, 5, '2020-01-01T00:00:00Z']
+            )
+        with open(data_dir / 'genre_title.csv', 'a',
+                  newline='') as genre_title_file:
+            genre_title_file.write('\n')
+            csv.writer(genre_title_file).writerow([9001, 1, 999])
+        out = StringIO()
+        call_command('loadcsv', str(data_dir), '--bulk', stdout=out)
+        assert Review.objects.count() == 72
+        assert GenreTitle.objects.count() == 42
+        for table in ('review', 'genre_title'):
+            with open(data_dir / f'{table}.rejected.csv',
+                      newline='') as rejected:
+                rows = list(csv.DictReader(rejected))
+            assert [row['id'] for row in rows] == ['9001'], (
+                'Строки с несуществующими внешними ключами должны попадать '
+                'в файл отклоненных строк.'
+            )
+            assert rows[0]['error']
+        assert 'review: 72, отклонено 1' in out.getvalue()
+
+    def test_03_parallel_load(self):
+        out = StringIO()
+        call_command('loadcsv', DATA_DIR, '--workers=2', '--split-size=0.001',
+                     '--batch-size=10', stdout=out)
+        assert Review.objects.count() == 72
+        assert Comment.objects.count() == 3
+        assert Review.objects.get(pk=1).pub_date == PUB_DATE, (
+            'loadcsv --workers должен сохранять даты из файла.'
+        )
+
+
+def test_09_dependency_graph():
+    graph = dependency_graph(list(TEST_DATA))
+    assert graph['users'] == graph['category'] == graph['genre'] == set()
+    assert graph['titles'] == {'category'}
+    assert graph['genre_title'] == {'genre', 'titles'}
+    assert graph['review'] == {'titles', 'users'}
+    assert graph['comments'] == {'review', 'users'}
+
+
+def test_09_split_ranges_keep_quoted_newlines():
+    path = os.path.join(MANAGE_PATH, DATA_DIR, 'review.csv')
+    with open(path, newline='', encoding='utf-8') as review_file:
+        expected = list(csv.DictReader(review_file))
+    fieldnames, ranges = split_ranges(path, 512)
+    assert len(ranges) > 1
+    rows = []
+    for start, end in ranges:
+        rows.extend(csv.DictReader(
+            iter_range_lines(path, start, end), fieldnames=fieldnames
+        ))
+    assert rows == expected, (
+        'Части файла должны разбираться в те же строки, что и файл целиком.'
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+class Test09IncrementalLoadCsv:
+
+    def test_01_incremental_upsert(self, tmp_path):
+        data_dir = tmp_path / 'data'
+        shutil.copytree(os.path.join(MANAGE_PATH, DATA_DIR), data_dir)
+        call_command('loadcsv', str(data_dir), '--incremental',
+                     stdout=StringIO())
+        assert Title.objects.count() == 32
+        out = StringIO()
+        call_command('loadcsv', str(data_dir), '--incremental', stdout=out)
+        assert Title.objects.count() == 32, (
+            'Повторная инкрементальная загрузка не должна дублировать строки.'
+        )
+        assert out.getvalue().count('файл не изменился') == len(TEST_DATA)
+
+        titles_path = data_dir / 'titles.csv'
+        content = titles_path.read_text(encoding='utf-8')
+        titles_path.write_text(
+            content.replace('Побег из Шоушенка', 'Shawshank', 1)
+            + '\n999,New title,2001,1\n',
+            encoding='utf-8'
+        )
+        out = StringIO()
+        call_command('loadcsv', str(data_dir), '--incremental', stdout=out)
+        assert 'новых 1, обновлено 1, без изменений 31' in out.getvalue()
+        assert Title.objects.get(pk=1).name == 'Shawshank'
+        assert Title.objects.filter(pk=999).exists()
+        assert out.getvalue().count('файл не изменился') == len(TEST_DATA) - 1
+
+    def test_02_incremental_keeps_dates(self, tmp_path):
+        data_dir = tmp_path / 'data'
+        shutil.copytree(os.path.join(MANAGE_PATH, DATA_DIR), data_dir)
+        call_command('loadcsv', str(data_dir), '--incremental',
+                     stdout=StringIO())
+        assert Review.objects.get(pk=1).pub_date == PUB_DATE, (
+            'Дата отзыва должна браться из файла, а не из времени загрузки.'
+        )
+        review_path = data_dir / 'review.csv'
+        content = review_path.read_text(encoding='utf-8')
+        review_path.write_text(
+            content.replace('Ставлю десять звёзд!', 'Ставлю девять!', 1),
+            encoding='utf-8'
+        )
+        out = StringIO()
+        call_command('loadcsv', str(data_dir), '--incremental', stdout=out)
+        assert 'новых 0, обновлено 1, без изменений 71' in out.getvalue(), (
+            'Измениться должна только отредактированная строка.'
+        )
+
+
+@pytest.mark.django_db(transaction=True)
+class Test09DumpCsv:
+
+    def test_01_dump_round_trips_through_loadcsv(self, tmp_path):
+        call_command('loadcsv', DATA_DIR, '--bulk', stdout=StringIO())
+        titles = list(Title.objects.order_by('pk').values(
+            'id', 'name', 'year', 'category_id', 'rating'
+        ))
+        reviews = list(Review.objects.order_by('pk').values_list(
+            'id', 'title_id', 'author_id', 'score', 'text'
+        ))
+        dump_dir = tmp_path / 'dump'
+        call_command('dumpcsv', str(dump_dir), stdout=StringIO())
+        assert sorted(os.listdir(dump_dir)) == sorted(TEST_DATA.values())
+
+        for model in (User, Title, Category, Genre):
+            model.objects.all().delete()
+        call_command('loadcsv', str(dump_dir), '--bulk', stdout=StringIO())
+        assert list(Title.objects.order_by('pk').values(
+            'id', 'name', 'year', 'category_id', 'rating'
+        )) == titles
+        assert list(Review.objects.order_by('pk').values_list(
+            'id', 'title_id', 'author_id', 'score', 'text'
+        )) == reviews
+
+    def test_02_dump_jsonl_gzip(self, tmp_path):
+        call_command('loadcsv', DATA_DIR, '--bulk', stdout=StringIO())
+        call_command('dumpcsv', str(tmp_path), '--format=jsonl', '--gzip',
+                     stdout=StringIO())
+        with gzip.open(tmp_path / 'titles.jsonl.gz', 'rt',
+                       encoding='utf-8') as dump:
+            rows = [json.loads(line) for line in dump]
+        assert len(rows) == Title.objects.count()
+        assert rows[0] == {
+            'id': 1, 'name': 'Побег из Шоушенка', 'year': 1994,
+            'description': '', 'category': 1,
+        }
+        with gzip.open(tmp_path / 'users.jsonl.gz', 'rt',
+                       encoding='utf-8') as dump:
+            assert 'password' not in json.loads(dump.readline())
+
+
+@pytest.mark.django_db(transaction=True)
+class Test09GenData:
+    SIZES = ('--users=20', '--titles=50', '--reviews=600',
+             '--comments-per-review=1')
+
+    def test_01_csv_is_reproducible_and_loadable(self, tmp_path):
+        first, second = tmp_path / 'first', tmp_path / 'second'
+        call_command('gendata', *self.SIZES, '--seed=7',
+                     f'--output={first}', stdout=StringIO())
+        call_command('gendata', *self.SIZES, '--seed=7',
+                     f'--output={second}', stdout=StringIO())
+        for file_name in TEST_DATA.values():
+            assert (first / file_name).read_bytes() == (
+                second / file_name
+            ).read_bytes(), 'При одном seed gendata должен давать те же csv.'
+        out = StringIO()
+        call_command('loadcsv', str(first), '--bulk', stdout=out)
+        assert 'отклонено' not in out.getvalue()
+        assert Review.objects.count() == 600
+        assert Title.objects.order_by('-review_count')[0].review_count <= 20
+
+    def test_02_direct_insert(self):
+        call_command('gendata', *self.SIZES, stdout=StringIO())
+        assert User.objects.count() == 20
+        assert Review.objects.count() == 600
+        assert Comment.objects.exists()
+        review = Review.objects.order_by('pub_date').first()
+        assert review.pub_date.year == 2015, (
+            'gendata должен сохранять сгенерированные даты публикации.'
+        )
+        title = review.title
+        assert title.review_count == title.reviews.count()
+
+    @pytest.mark.parametrize('mean', (0.5, 2))
+    def test_03_comments_per_review_mean(self, tmp_path, mean):
+        call_command(
+            'gendata', '--users=100', '--titles=50', '--reviews=5000',
+            f'--comments-per-review={mean}', f'--output={tmp_path}',
+            stdout=StringIO()
+        )
+        with open(tmp_path / TEST_DATA['comments'], newline='') as comments:
+            count = sum(1 for _ in csv.reader(comments)) - 1
+        assert count / 5000 == pytest.approx(mean, rel=0.1), (
+            'Среднее число комментариев на отзыв должно быть равно '
+            '--comments-per-review.'
+        )
@@ -0,0 +1,96 @@
+import gzip
+import json
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from reviews.models import Review, Title
+from tests.utils import create_single_review, create_titles
+
+
+def to_jsonl(records):
+    return '\n'.join(
+        record if isinstance(record, str) else json.dumps(record)
+        for record in records
+    ) + '\n'
+
+
+@pytest.mark.django_db(transaction=True)
+class Test10ReviewImport:
+
+    IMPORT_URL = '/api/v1/reviews/import/'
+
+    def get_records(self, titles, admin, user):
+        first, second = titles[0]['id'], titles[1]['id']
+        return [
+            {'title_id': first, 'author': admin.username, 'text': 'ok',
+             'score': 8, 'pub_date': '2020-05-01T10:00:00Z'},
+            {'title_id': first, 'author': user.username, 'text': 'ok',
+             'score': 4},
+            {'title_id': first, 'author': user.username, 'text': 'again',
+             'score': 10},
+            {'title_id': second, 'author': user.username, 'text': 'ok',
+             'score': 6},
+            {'title_id': second, 'author': 'nobody', 'text': 'ok',
+             'score': 6},
+            {'title_id': 9999, 'author': user.username, 'text': 'ok',
+             'score': 6},
+            {'title_id': second, 'author': admin.username, 'text': 'ok',
+             'score': 11},
+            '{broken json',
+        ]
+
+    def test_01_import_endpoint(self, admin_client, admin, user,
+                                user_client):
+        titles, _, _ = create_titles(admin_client)
+        create_single_review(admin_client, titles[1]['id'], 'first', 2)
+        records = self.get_records(titles, admin, user)
+        records.append({'title_id': titles[1]['id'],
+                        'author': admin.username, 'text': 'dup', 'score': 9})
+        response = admin_client.generic(
+            'POST', self.IMPORT_URL, to_jsonl(records),
+            content_type='application/x-ndjson'
+        )
+        assert response.status_code == HTTPStatus.OK
+        data = response.json()
+        assert (data['imported'], data['duplicates'], data['rejected']) == (
+            3, 2, 4
+        ), (
+            'Повторы пары (произведение, автор) в файле и в БД должны '
+            'отбрасываться, строки с ошибками - отклоняться.'
+        )
+        lines = sorted(error['line'] for error in data['errors'])
+        assert lines == [5, 6, 7, 8]
+        first = Title.objects.get(pk=titles[0]['id'])
+        assert (first.review_count, first.rating) == (2, 6), (
+            'После импорта рейтинг произведений должен пересчитываться.'
+        )
+        review = Review.objects.get(title=first, author=admin)
+        assert review.pub_date.year == 2020, (
+            'Импорт должен сохранять pub_date из файла.'
+        )
+        response = user_client.generic(
+            'POST', self.IMPORT_URL, to_jsonl(records),
+            content_type='application/x-ndjson'
+        )
+        assert response.status_code == HTTPStatus.FORBIDDEN
+
+    def test_02_import_command(self, admin_client, admin, user, tmp_path):
+        titles, _, _ = create_titles(admin_client)
+        path = tmp_path / 'reviews.jsonl.gz'
+        with gzip.open(path, 'wt', encoding='utf-8') as jsonl_file:
+            jsonl_file.write(
+                to_jsonl(self.get_records(titles, admin, user))
+            )
+        out = StringIO()
+        call_command('importreviews', str(path), '--batch-size=2',
+                     stdout=out)
+        assert 'Отзывов загружено: 3' in out.getvalue()
+        rejects_path = tmp_path / 'reviews.jsonl.gz.rejected.jsonl'
+        rejected = [
+            json.loads(line) for line in rejects_path.read_text().splitlines()
+        ]
+        assert sorted(reject['line'] for reject in rejected) == [5, 6, 7, 8]
+        assert Title.objects.get(pk=titles[1]['id']).review_count == 1
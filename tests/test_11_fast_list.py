@@ -0,0 +1,77 @@
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from api.views import CommentViewSet, ReviewViewSet, TitleViewSet
+from reviews.models import Category, Comment, Review, Title
+from tests.utils import create_comments
+
+VIEWSETS = (TitleViewSet, ReviewViewSet, CommentViewSet)
+
+
+def get_both(client, monkeypatch, url):
+    """ Ответы списка через values_list и через сериализатор """
+    fast = client.get(url)
+    with monkeypatch.context() as patch:
+        for viewset in VIEWSETS:
+            patch.setattr(viewset, 'fast_list', False)
+        slow = client.get(url)
+    assert fast.status_code == slow.status_code == HTTPStatus.OK, url
+    return fast.content, slow.content
+
+
+@pytest.mark.django_db(transaction=True)
+class Test11FastListParity:
+
+    def assert_parity(self, client, monkeypatch, urls):
+        for url in urls:
+            fast, slow = get_both(client, monkeypatch, url)
+            assert fast == slow, (
+                f'Ответ {url} без сериализатора должен побайтно совпадать '
+                'с ответом сериализатора.'
+            )
+
+    def test_01_loaded_catalog(self, client, monkeypatch):
+        call_command('loadcsv', 'static/data', '--bulk', stdout=StringIO())
+        Category.objects.filter(pk=1).delete()
+        Title.objects.create(name='Без отзывов', year=2001, description='')
+        title_id = Review.objects.values_list('title_id', flat=True)[0]
+        review = Comment.objects.select_related('review').first().review
+        self.assert_parity(client, monkeypatch, [
+            '/api/v1/titles/',
+            '/api/v1/titles/?limit=100',
+            '/api/v1/titles/?limit=5&offset=7',
+            '/api/v1/titles/?ordering=-rating',
+            '/api/v1/titles/?genre=drama,comedy&facets=true',
+            '/api/v1/titles/?sideload=true&limit=20',
+            '/api/v1/titles/?sideload=true&fields=id,genre',
+            '/api/v1/titles/?year_min=2000&ordering=name',
+            '/api/v1/titles/?category=nonexistent',
+            f'/api/v1/titles/{title_id}/reviews/?limit=100',
+            f'/api/v1/titles/{title_id}/reviews/?search=а',
+            f'/api/v1/titles/{review.title_id}/reviews/{review.pk}/comments/',
+        ])
+
+    def test_02_api_created_objects(self, admin_client, client, monkeypatch,
+                                    user_client, moderator_client, admin,
+                                    user, moderator):
+        authors_map = {
+            admin: admin_client,
+            user: user_client,
+            moderator: moderator_client,
+        }
+        comments, reviews, titles = create_comments(admin_client, authors_map)
+        title_id = titles[0]['id']
+        self.assert_parity(client, monkeypatch, [
+            '/api/v1/titles/',
+            f'/api/v1/titles/{title_id}/reviews/',
+            f'/api/v1/titles/{title_id}/reviews/{reviews[0]["id"]}/comments/',
+            f'/api/v1/titles/{title_id}/reviews/{reviews[1]["id"]}/comments/'
+            '?limit=1&offset=1',
+        ])
+
+    def test_03_missing_review_is_404(self, client):
+        response = client.get('/api/v1/titles/1/reviews/9999/comments/')
+        assert response.status_code == HTTPStatus.NOT_FOUND
@@ -0,0 +1,89 @@
+from http import HTTPStatus
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.views import TitleViewSet
+from tests.utils import create_reviews, create_titles
+
+
+@pytest.mark.django_db(transaction=True)
+class Test12SparseFields:
+
+    TITLES_URL = '/api/v1/titles/'
+
+    @pytest.mark.parametrize('fast_list', (True, False))
+    def test_01_title_fields(self, admin_client, client, monkeypatch,
+                             fast_list):
+        monkeypatch.setattr(TitleViewSet, 'fast_list', fast_list)
+        create_titles(admin_client)
+        client.get(self.TITLES_URL)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f'{self.TITLES_URL}?fields=id,name,rating')
+        assert response.status_code == HTTPStatus.OK
+        assert list(response.json()['results'][0]) == [
+            'id', 'name', 'rating'
+        ]
+        assert len(queries) == 2, (
+            'Без поля genre связи жанров не должны запрашиваться.'
+        )
+        assert 'description' not in queries[-1]['sql'], (
+            'Колонки полей, не вошедших в ?fields=, не должны читаться.'
+        )
+
+    def test_02_title_exclude(self, admin_client, client):
+        titles, _, _ = create_titles(admin_client)
+        response = client.get(f'{self.TITLES_URL}?exclude=description,id')
+        assert list(response.json()['results'][0]) == [
+            'name', 'year', 'rating', 'genre', 'category'
+        ]
+        response = client.get(
+            f'{self.TITLES_URL}{titles[0]["id"]}/?fields=genre'
+        )
+        assert response.json() == {'genre': [
+            {'name': 'Ужасы', 'slug': 'horror'},
+            {'name': 'Комедия', 'slug': 'comedy'},
+        ]}
+        response = client.get(f'{self.TITLES_URL}?fields=genre&limit=1')
+        assert response.json()['results'] == [{'genre': [
+            {'name': 'Ужасы', 'slug': 'horror'},
+            {'name': 'Комедия', 'slug': 'comedy'},
+        ]}]
+
+    def test_03_unknown_field(self, client):
+        response = client.get(f'{self.TITLES_URL}?fields=id,secret')
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert 'secret' in response.json()['fields']
+
+    def test_04_review_join_pruned(self, admin_client, client,
+                                   user_client, moderator_client, admin,
+                                   user, moderator):
+        authors_map = {
+            admin: admin_client,
+            user: user_client,
+            moderator: moderator_client,
+        }
+        reviews, titles = create_reviews(admin_client, authors_map)
+        url = f'{self.TITLES_URL}{titles[0]["id"]}/reviews/'
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f'{url}?fields=id,score')
+        assert list(response.json()['results'][0]) == ['id', 'score']
+        assert 'JOIN' not in queries[-1]['sql']
+        response = client.get(f'{url}{reviews[0]["id"]}/?exclude=title')
+        assert 'title' not in response.json()
+        assert response.json()['author'] == reviews[0]['author']
+
+    def test_05_other_viewsets(self, admin_client, admin):
+        create_titles(admin_client)
+        response = admin_client.get('/api/v1/categories/?fields=slug')
+        assert list(response.json()['results'][0]) == ['slug']
+        response = admin_client.get('/api/v1/genres/?exclude=name')
+        assert list(response.json()['results'][0]) == ['slug']
+        response = admin_client.get('/api/v1/users/me/?fields=username,role')
+        assert response.json() == {'username': admin.username,
+                                   'role': 'admin'}
+        response = admin_client.patch(
+            '/api/v1/users/me/?fields=bio', data={'bio': 'new bio'}
+        )
+        assert response.status_code == HTTPStatus.OK
@@ -0,0 +1,81 @@
+import json
+from http import HTTPStatus
+
+import pytest
+
+from tests.utils import create_reviews, create_titles
+
+COLUMNAR = 'application/vnd.yamdb.columnar+json'
+COLUMNAR_STREAM = 'application/vnd.yamdb.columnar-stream+json'
+
+
+@pytest.mark.django_db(transaction=True)
+class Test13Renderers:
+
+    TITLES_URL = '/api/v1/titles/'
+
+    def test_01_columnar_list(self, admin_client, client):
+        create_titles(admin_client)
+        plain = client.get(f'{self.TITLES_URL}?facets=true').json()
+        response = client.get(f'{self.TITLES_URL}?facets=true&format=columnar')
+        assert response.status_code == HTTPStatus.OK
+        assert response['Content-Type'].startswith(COLUMNAR)
+        data = json.loads(response.content)
+        assert list(data) == [
+            'count', 'next', 'previous', 'columns', 'rows', 'facets'
+        ]
+        assert data['columns'] == list(plain['results'][0])
+        assert [
+            dict(zip(data['columns'], row)) for row in data['rows']
+        ] == plain['results'], (
+            'Строки колоночного формата должны совпадать с объектами '
+            'обычного ответа.'
+        )
+        assert data['facets'] == plain['facets']
+        response = client.get(self.TITLES_URL, HTTP_ACCEPT=COLUMNAR)
+        assert json.loads(response.content)['columns'] == data['columns']
+
+    def test_02_columnar_passes_other_responses(self, admin_client, client):
+        titles, _, _ = create_titles(admin_client)
+        url = f'{self.TITLES_URL}{titles[0]["id"]}/?format=columnar'
+        response = client.get(url)
+        assert json.loads(response.content)['name'] == titles[0]['name']
+        response = client.get(f'{self.TITLES_URL}?ordering=description'
+                              '&format=columnar')
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert 'ordering' in json.loads(response.content)
+        response = client.get(f'{self.TITLES_URL}?genre=none&format=columnar')
+        assert json.loads(response.content)['rows'] == []
+
+    def test_03_streaming_matches_columnar(self, admin_client, client):
+        create_titles(admin_client)
+        for query in ('', '?sideload=true&fields=id,genre', '?genre=none'):
+            columnar = client.get(
+                f'{self.TITLES_URL}{query}', HTTP_ACCEPT=COLUMNAR
+            )
+            streaming = client.get(
+                f'{self.TITLES_URL}{query}', HTTP_ACCEPT=COLUMNAR_STREAM
+            )
+            assert streaming.streaming, (
+                'Потоковый рендерер должен отдавать StreamingHttpResponse.'
+            )
+            assert streaming['Content-Type'].startswith(COLUMNAR_STREAM)
+            assert b''.join(streaming.streaming_content) == columnar.content
+        response = client.get('/api/v1/categories/?format=columnar-stream')
+        assert json.loads(b''.join(response.streaming_content))['columns'] == [
+            'name', 'slug'
+        ]
+
+    def test_04_review_feed_streams(self, admin_client, admin, user,
+                                    user_client):
+        create_reviews(admin_client, {admin: admin_client, user: user_client})
+        url = '/api/v1/reviews/'
+        columnar = admin_client.get(url, HTTP_ACCEPT=COLUMNAR)
+        streaming = admin_client.get(url, HTTP_ACCEPT=COLUMNAR_STREAM)
+        assert streaming.streaming, (
+            'Лента отзывов с потоковым рендерером должна отдаваться '
+            'через StreamingHttpResponse.'
+        )
+        content = b''.join(streaming.streaming_content)
+        assert content == columnar.content
+        assert len(json.loads(content)['rows']) == 2
@@ -0,0 +1,119 @@
+import time
+from contextlib import ExitStack
+
+import pytest
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from api import cache
+from api.index import title_index
+from api_yamdb.db_routers import (
+    ReadReplicaRouter, is_pinned_to_primary, pin_to_primary, use_replicas
+)
+from reviews.models import Title
+from tests.utils import create_titles, run_in_process
+
+DATABASES = ['default', 'replica1', 'replica2']
+
+
+def count_queries(client, url, **extra):
+    """ Число запросов к каждой БД при GET url """
+    with ExitStack() as stack:
+        contexts = {
+            alias: stack.enter_context(
+                CaptureQueriesContext(connections[alias])
+            ) for alias in DATABASES
+        }
+        response = client.get(url, **extra)
+    assert response.status_code == 200
+    return {alias: len(context) for alias, context in contexts.items()}
+
+
+@pytest.mark.django_db(transaction=True, databases=DATABASES)
+class Test14ReadReplicas:
+
+    TITLES_URL = '/api/v1/titles/'
+
+    @pytest.fixture(autouse=True)
+    def replicas(self, settings):
+        settings.READ_REPLICAS = ['replica1', 'replica2']
+        settings.READ_YOUR_WRITES_SECONDS = 0.5
+
+    def test_01_reads_go_to_replicas(self, admin_client, client):
+        create_titles(admin_client)
+        time.sleep(0.6)
+        for _ in range(5):
+            queries = count_queries(client, self.TITLES_URL)
+            assert queries['default'] == 0, (
+                'Чтения вьюсетов должны уходить на реплики.'
+            )
+            assert queries['replica1'] + queries['replica2'] > 0
+
+    def test_02_read_your_writes(self, admin_client, client, user_client):
+        titles, _, _ = create_titles(admin_client)
+        queries = count_queries(admin_client, self.TITLES_URL)
+        assert queries['replica1'] + queries['replica2'] == 0, (
+            'Сразу после записи чтения автора должны идти в default.'
+        )
+        queries = count_queries(
+            user_client, f'{self.TITLES_URL}{titles[0]["id"]}/reviews/'
+        )
+        # В default остается только поиск пользователя по токену
+        assert queries['default'] == 1, (
+            'Запись одного пользователя не должна закреплять за default '
+            'чтения других.'
+        )
+        time.sleep(0.6)
+        queries = count_queries(admin_client, self.TITLES_URL)
+        assert queries['default'] == 1
+
+    def test_03_router_outside_requests(self):
+        router = ReadReplicaRouter()
+        assert router.db_for_read(Title) == 'default'
+        with use_replicas():
+            assert router.db_for_read(Title) in ('replica1', 'replica2')
+            assert router.db_for_write(Title) == 'default'
+        assert router.allow_migrate('replica1', 'reviews') is False
+
+    def test_04_snapshots_read_from_default(self, admin_client):
+        create_titles(admin_client)
+        cache.categories.invalidate()
+        title_index.invalidate()
+        with ExitStack() as stack:
+            contexts = {
+                alias: stack.enter_context(
+                    CaptureQueriesContext(connections[alias])
+                ) for alias in DATABASES
+            }
+            with use_replicas():
+                cache.categories.all()
+                title_index.match(year=1984)
+        assert len(contexts['default']) == 3
+        assert len(contexts['replica1']) + len(contexts['replica2']) == 0, (
+            'Общие снимки процесса не должны собираться с реплик.'
+        )
+
+    def test_05_pin_shared_between_processes(self, user, settings):
+        settings.READ_YOUR_WRITES_SECONDS = 5
+        assert not is_pinned_to_primary(user)
+        run_in_process(pin_to_primary, user)
+        assert is_pinned_to_primary(user), (
+            'Закрепление за default после записи должно действовать во '
+            'всех процессах сервера.'
+        )
+
+    def test_06_one_replica_per_request(self, admin_client, client):
+        create_titles(admin_client)
+        time.sleep(0.6)
+        for _ in range(10):
+            queries = count_queries(client, self.TITLES_URL)
+            replicas = [
+                alias for alias in ('replica1', 'replica2') if queries[alias]
+            ]
+            assert len(replicas) == 1, (
+                'Все чтения одного запроса должны идти на одну реплику, '
+                'чтобы COUNT и страница видели одно состояние.'
+            )
+        with use_replicas():
+            router = ReadReplicaRouter()
+            assert len({router.db_for_read(Title) for _ in range(20)}) == 1
@@ -0,0 +1,298 @@
+import importlib
+import os
+import shutil
+from contextlib import ExitStack
+from http import HTTPStatus
+from io import StringIO
+from types import SimpleNamespace
+
+import json
+
+import pytest
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from api.views import CommentViewSet, ReviewViewSet
+from reviews import sharding
+from reviews.management.importing import ReviewImporter
+from reviews.models import Category, Comment, Genre, Review, Title, User
+from reviews.sharding import (
+    ID_SPAN, ShardRoutingError, fan_out, shard_for_id, shard_for_title
+)
+from tests.conftest import MANAGE_PATH
+from tests.utils import create_comments, create_single_review
+
+SHARDS = ['shard1', 'shard2']
+DATABASES = ['default', *SHARDS]
+DATA_DIR = 'static/data'
+
+
+def count_queries(client, url):
+    """ Число запросов к каждой БД при GET url """
+    with ExitStack() as stack:
+        contexts = {
+            alias: stack.enter_context(
+                CaptureQueriesContext(connections[alias])
+            ) for alias in DATABASES
+        }
+        response = client.get(url)
+    assert response.status_code == HTTPStatus.OK
+    return response, {
+        alias: len(context) for alias, context in contexts.items()
+    }
+
+
+@pytest.mark.django_db(transaction=True, databases=DATABASES)
+class Test15Sharding:
+
+    @pytest.fixture(autouse=True)
+    def enable_sharding(self, settings):
+        settings.REVIEW_SHARDS = SHARDS
+        settings.REVIEW_SHARDING = True
+
+    @pytest.fixture
+    def authors_map(self, admin, user, moderator, admin_client,
+                    user_client, moderator_client):
+        return {
+            admin: admin_client,
+            user: user_client,
+            moderator: moderator_client,
+        }
+
+    def create_data(self, admin_client, authors_map):
+        comments, reviews, titles = create_comments(admin_client, authors_map)
+        for index, user_client in enumerate(authors_map.values(), 1):
+            create_single_review(
+                user_client, titles[1]['id'], f'second {index}', index + 6
+            )
+        return comments, reviews, titles
+
+    def test_01_rows_live_in_title_shard(self, admin_client, authors_map):
+        _, reviews, titles = self.create_data(admin_client, authors_map)
+        for title in titles:
+            alias = shard_for_title(title['id'])
+            assert Review.objects.using(alias).filter(
+                title_id=title['id']
+            ).count() == 3, 'Отзывы должны храниться в шарде произведения.'
+        assert not Review.objects.using('default').exists()
+        assert not Comment.objects.using('default').exists()
+        alias = shard_for_title(titles[0]['id'])
+        assert Comment.objects.using(alias).count() == 3
+        for review in reviews:
+            assert shard_for_id(review['id']) == alias, (
+                'id отзывов шарда должны лежать в его диапазоне.'
+            )
+            assert review['id'] >= ID_SPAN
+        title = Title.objects.get(pk=titles[1]['id'])
+        assert (title.rating, title.review_count) == (8, 3)
+
+    @pytest.mark.parametrize('fast_list', (True, False))
+    def test_02_title_reads_hit_one_shard(self, admin_client, authors_map,
+                                          client, monkeypatch, fast_list):
+        monkeypatch.setattr(ReviewViewSet, 'fast_list', fast_list)
+        monkeypatch.setattr(CommentViewSet, 'fast_list', fast_list)
+        comments, reviews, titles = self.create_data(
+            admin_client, authors_map
+        )
+        title_id = titles[0]['id']
+        alias = shard_for_title(title_id)
+        other = next(shard for shard in SHARDS if shard != alias)
+        url = f'/api/v1/titles/{title_id}/reviews/'
+        response, queries = count_queries(client, url)
+        assert queries[alias] > 0 and queries[other] == 0, (
+            'Чтение отзывов произведения должно идти в один шард.'
+        )
+        results = response.json()['results']
+        assert [review['text'] for review in results] == [
+            review['text'] for review in reviews
+        ]
+        assert {review['title'] for review in results} == {titles[0]['name']}
+        assert {review['author'] for review in results} == {
+            user.username for user in authors_map
+        }
+        response, queries = count_queries(
+            client, f'{url}{reviews[0]["id"]}/comments/'
+        )
+        assert queries[other] == 0
+        assert [
+            (comment['author'], comment['review'])
+            for comment in response.json()['results']
+        ] == [
+            (comment['author'], reviews[0]['text']) for comment in comments
+        ]
+
+    def skip_to_split_title_ids(self):
+        """
+        id произведений не сбрасываются между тестами: пропускаем id,
+        пока два следующих произведения не попадут в разные шарды.
+        """
+        while True:
+            title = Title.objects.create(name='skip', description='skip')
+            last_id = title.pk
+            title.delete()
+            if shard_for_title(last_id + 1) != shard_for_title(last_id + 2):
+                return
+
+    def test_03_feed_fans_out(self, admin_client, authors_map, user,
+                              user_client, monkeypatch):
+        self.skip_to_split_title_ids()
+        self.create_data(admin_client, authors_map)
+        assert len({shard_for_title(pk) for pk in Title.objects.values_list(
+            'pk', flat=True
+        )}) == 2, 'Произведения теста должны попасть в разные шарды.'
+        calls = []
+
+        def spy(func, aliases):
+            calls.append(list(aliases))
+            return fan_out(func, aliases)
+
+        monkeypatch.setattr(sharding, 'fan_out', spy)
+        data = admin_client.get('/api/v1/reviews/').json()
+        assert calls and all(aliases == SHARDS for aliases in calls), (
+            'Лента отзывов должна опрашивать все шарды.'
+        )
+        assert data['count'] == 6
+        dates = [review['pub_date'] for review in data['results']]
+        assert dates == sorted(dates, reverse=True)
+        page = admin_client.get('/api/v1/reviews/?limit=2&offset=3').json()
+        assert page['results'] == data['results'][3:5]
+        activity = admin_client.get(
+            f'/api/v1/reviews/?author={user.username}'
+        ).json()
+        assert activity['count'] == 2
+        assert {review['author'] for review in activity['results']} == {
+            user.username
+        }
+        response = user_client.get('/api/v1/reviews/')
+        assert response.status_code == HTTPStatus.FORBIDDEN
+
+    def test_04_deletes_reach_shards(self, admin_client, authors_map, user):
+        _, reviews, titles = self.create_data(admin_client, authors_map)
+        url = f'/api/v1/titles/{titles[0]["id"]}/reviews/{reviews[0]["id"]}/'
+        response = admin_client.delete(url)
+        assert response.status_code == HTTPStatus.NO_CONTENT
+        alias = shard_for_title(titles[0]['id'])
+        assert not Comment.objects.using(alias).exists(), (
+            'Комментарии удаляются вместе с отзывом в его шарде.'
+        )
+        response = admin_client.delete(f'/api/v1/users/{user.username}/')
+        assert response.status_code == HTTPStatus.NO_CONTENT
+        assert not Review.objects.across_shards().filter(
+            author_id=user.pk
+        ).exists()
+        assert Review.objects.across_shards().count() == 3
+        Title.objects.get(pk=titles[1]['id']).delete()
+        assert not Review.objects.for_title(titles[1]['id']).exists()
+        assert Review.objects.across_shards().count() == 1
+
+    def test_05_unrouted_queries_fail(self, settings):
+        with pytest.raises(ShardRoutingError):
+            list(Review.objects.all())
+        settings.REVIEW_SHARDING = False
+        assert list(Review.objects.all()) == []
+
+    def test_06_import_routes_by_title(self, admin_client, authors_map,
+                                       user, admin):
+        _, reviews, titles = self.create_data(admin_client, authors_map)
+        Review.objects.for_title(titles[1]['id']).filter(
+            author=user
+        ).delete()
+        lines = [json.dumps({
+            'title_id': title['id'], 'author': author.username,
+            'text': 'imported', 'score': 10,
+        }) for title in titles for author in (user, admin)]
+        result = ReviewImporter().run(lines)
+        assert result == {'imported': 1, 'duplicates': 3, 'rejected': 0}
+        review = Review.objects.for_title(titles[1]['id']).get(author=user)
+        assert review.text == 'imported'
+        assert review._state.db == shard_for_title(titles[1]['id'])
+        title = Title.objects.get(pk=titles[1]['id'])
+        assert (title.rating, title.review_count) == (26 / 3, 3)
+
+    def check_loaded(self, reviews=72, comments=3):
+        """ Загруженные строки лежат в шардах и диапазонах id шардов """
+        assert not Review.objects.using('default').exists()
+        assert not Comment.objects.using('default').exists()
+        loaded = list(Review.objects.across_shards())
+        assert len(loaded) == reviews
+        for review in loaded:
+            assert review._state.db == shard_for_title(review.title_id)
+            assert shard_for_id(review.pk) == review._state.db, (
+                'id отзывов из файла должны переноситься в диапазон шарда.'
+            )
+        loaded = list(Comment.objects.across_shards())
+        assert len(loaded) == comments
+        for comment in loaded:
+            assert shard_for_id(comment.pk) == comment._state.db
+            assert Review.objects.using(comment._state.db).filter(
+                pk=comment.review_id
+            ).exists(), 'Комментарий должен ссылаться на отзыв своего шарда.'
+        title = Title.objects.get(pk=1)
+        assert title.review_count == Review.objects.for_title(1).count() > 0
+
+    @pytest.mark.parametrize('options', (
+        (), ('--bulk', '--batch-size=10'), ('--incremental',),
+        ('--workers=2', '--split-size=0.001', '--batch-size=10'),
+    ))
+    def test_07_loadcsv(self, options):
+        out = StringIO()
+        call_command('loadcsv', DATA_DIR, *options, stdout=out)
+        assert 'отклонено' not in out.getvalue()
+        self.check_loaded()
+
+    def test_08_loadcsv_incremental_update(self, tmp_path):
+        data_dir = tmp_path / 'data'
+        shutil.copytree(os.path.join(MANAGE_PATH, DATA_DIR), data_dir)
+        call_command('loadcsv', str(data_dir), '--incremental',
+                     stdout=StringIO())
+        review_file = data_dir / 'review.csv'
+        content = review_file.read_text(encoding='utf-8')
+        review_file.write_text(
+            content.replace('Ставлю десять звёзд!', 'Ставлю девять!', 1),
+            encoding='utf-8'
+        )
+        out = StringIO()
+        call_command('loadcsv', str(data_dir), '--incremental', stdout=out)
+        assert 'новых 0, обновлено 1, без изменений 71' in out.getvalue()
+        self.check_loaded()
+
+    def test_09_dump_round_trip(self, tmp_path):
+        call_command('loadcsv', DATA_DIR, '--bulk', stdout=StringIO())
+        reviews = sorted(Review.objects.across_shards().values_list(
+            'id', 'title_id', 'author_id', 'text'
+        ))
+        call_command('dumpcsv', str(tmp_path), stdout=StringIO())
+        for model in (User, Title, Category, Genre):
+            model.objects.all().delete()
+        assert not Review.objects.across_shards().exists()
+        out = StringIO()
+        call_command('loadcsv', str(tmp_path), '--bulk', stdout=out)
+        assert 'отклонено' not in out.getvalue()
+        assert sorted(Review.objects.across_shards().values_list(
+            'id', 'title_id', 'author_id', 'text'
+        )) == reviews, 'id отзывов из выгрузки шардов должны сохраняться.'
+        self.check_loaded()
+
+    def test_10_gendata(self):
+        call_command(
+            'gendata', '--users=20', '--titles=50', '--reviews=600',
+            '--comments-per-review=1', stdout=StringIO()
+        )
+        self.check_loaded(600, Comment.objects.across_shards().count())
+        assert Comment.objects.across_shards().exists()
+
+    def test_11_migration_fills_stats(self, admin_client, authors_map):
+        _, _, titles = self.create_data(admin_client, authors_map)
+        Title.objects.update(rating=None, review_count=0)
+        migration = importlib.import_module(
+            'reviews.migrations.0002_title_review_stats'
+        )
+        migration.fill_review_stats(
+            apps, SimpleNamespace(connection=connections['default'])
+        )
+        assert not Title.objects.filter(review_count__gt=0).exists(), (
+            'Миграция данных должна читать отзывы своей БД, а не '
+            'выбирать шард роутером.'
+        )
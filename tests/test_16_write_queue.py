@@ -0,0 +1,135 @@
+import threading
+from http import HTTPStatus
+
+import pytest
+from django.db import connection, connections
+from rest_framework.test import APIClient
+
+from api_yamdb.db_writer import writer
+from reviews.models import Category, Comment, Review, Title, User
+from tests.utils import create_single_review, create_titles
+
+WRITERS = 500
+
+
+def post_concurrently(requests):
+    """
+    Отправляет запросы (пользователь, url, данные) одновременно, каждый
+    из своего потока. Возвращает коды ответов и исключения потоков.
+    """
+    barrier = threading.Barrier(len(requests))
+    statuses = []
+    errors = []
+
+    def post(user, url, data):
+        client = APIClient()
+        client.force_authenticate(user)
+        barrier.wait()
+        try:
+            statuses.append(client.post(url, data=data).status_code)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=post, args=request) for request in requests
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses, errors
+
+
+@pytest.mark.django_db(transaction=True)
+class Test16WriteQueue:
+
+    def test_01_wal_enabled(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            assert cursor.fetchone()[0] == 'wal', (
+                'Файловая БД SQLite должна работать в режиме WAL.'
+            )
+
+    def test_02_failed_job_rolls_back_alone(self):
+        futures = [
+            writer.submit(lambda: Category.objects.create(slug='first')),
+            writer.submit(lambda: Category.objects.create(slug='first')),
+            writer.submit(lambda: Category.objects.create(slug='second')),
+        ]
+        assert futures[0].result().slug == 'first'
+        with pytest.raises(Exception):
+            futures[1].result()
+        assert futures[2].result().slug == 'second'
+        assert set(Category.objects.values_list('slug', flat=True)) == {
+            'first', 'second'
+        }
+
+    def test_03_concurrent_writers(self, admin_client, admin, monkeypatch):
+        titles, _, _ = create_titles(admin_client)
+        title_id = titles[0]['id']
+        review_id = create_single_review(
+            admin_client, title_id, 'first', 5
+        ).json()['id']
+        User.objects.bulk_create([
+            User(username=f'writer{index}', email=f'writer{index}@yamdb.fake')
+            for index in range(WRITERS)
+        ])
+        users = list(User.objects.filter(username__startswith='writer'))
+        batch_sizes = []
+        commit = writer.commit
+
+        def spy(batch):
+            batch_sizes.append(len(batch))
+            return commit(batch)
+
+        monkeypatch.setattr(writer, 'commit', spy)
+        reviews_url = f'/api/v1/titles/{title_id}/reviews/'
+        comments_url = f'{reviews_url}{review_id}/comments/'
+        statuses, errors = post_concurrently([
+            (user, reviews_url, {'text': 'stress', 'score': 7})
+            for user in users
+        ] + [
+            (user, comments_url, {'text': 'stress'}) for user in users
+        ])
+        assert not errors, f'Ошибки при параллельной записи: {errors[:3]}'
+        assert statuses == [HTTPStatus.CREATED] * (2 * WRITERS)
+        assert Review.objects.filter(title_id=title_id).count() == WRITERS + 1
+        assert Comment.objects.count() == WRITERS
+        title = Title.objects.get(pk=title_id)
+        assert title.review_count == WRITERS + 1
+        assert max(batch_sizes) > 1, (
+            'Накопившиеся записи должны фиксироваться одной транзакцией.'
+        )
+
+    def test_04_stats_without_write_queue(self, admin_client, admin,
+                                          settings):
+        settings.WRITE_QUEUE = False
+        titles, _, _ = create_titles(admin_client)
+        title_id = titles[0]['id']
+        review_id = create_single_review(
+            admin_client, title_id, 'first', 5
+        ).json()['id']
+        writers = 100
+        User.objects.bulk_create([
+            User(username=f'writer{index}', email=f'writer{index}@yamdb.fake')
+            for index in range(writers)
+        ])
+        users = list(User.objects.filter(username__startswith='writer'))
+        reviews_url = f'/api/v1/titles/{title_id}/reviews/'
+        statuses, errors = post_concurrently([
+            (user, reviews_url, {'text': 'stress', 'score': 7})
+            for user in users
+        ] + [
+            (user, f'{reviews_url}{review_id}/comments/', {'text': 'stress'})
+            for user in users
+        ])
+        assert not errors, f'Ошибки при параллельной записи: {errors[:3]}'
+        assert statuses == [HTTPStatus.CREATED] * (2 * writers)
+        title = Title.objects.get(pk=title_id)
+        assert title.review_count == writers + 1, (
+            'Параллельные записи отзывов не должны затирать счетчик '
+            'произведения.'
+        )
+        assert Review.objects.get(pk=review_id).comment_count == writers
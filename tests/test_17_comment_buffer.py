@@ -0,0 +1,146 @@
+import importlib
+import os
+import threading
+import time
+from http import HTTPStatus
+
+import pytest
+from django.core.management import call_command
+
+from api import views
+from api_yamdb import asgi, wsgi
+from reviews.comment_buffer import ID_BLOCK, CommentBuffer
+from reviews.models import Comment, Review
+from tests.utils import create_reviews
+
+
+@pytest.mark.django_db(transaction=True)
+class Test17CommentBuffer:
+
+    @pytest.fixture
+    def buffer(self, settings, tmp_path, monkeypatch):
+        settings.COMMENT_WRITE_BEHIND = True
+        settings.COMMENT_JOURNAL_DIR = tmp_path
+        settings.COMMENT_FLUSH_INTERVAL = 60
+        settings.COMMENT_FLUSH_ROWS = 1000
+        buffer = CommentBuffer()
+        monkeypatch.setattr(views, 'comment_buffer', buffer)
+        return buffer
+
+    @pytest.fixture
+    def comments_url(self, admin_client, admin, user, user_client):
+        reviews, titles = create_reviews(
+            admin_client, {admin: admin_client, user: user_client}
+        )
+        return (
+            f'/api/v1/titles/{titles[0]["id"]}/reviews/'
+            f'{reviews[0]["id"]}/comments/'
+        )
+
+    def post_comments(self, client, url, count):
+        responses = [
+            client.post(url, data={'text': f'comment {index}'})
+            for index in range(count)
+        ]
+        assert all(
+            response.status_code == HTTPStatus.CREATED
+            for response in responses
+        )
+        return [response.json() for response in responses]
+
+    def test_01_acknowledged_before_flush(self, buffer, comments_url,
+                                          user_client, settings, tmp_path):
+        created = self.post_comments(user_client, comments_url, 3)
+        assert not Comment.objects.exists(), (
+            'До сброса буфера комментарии не должны попадать в БД.'
+        )
+        journal, = tmp_path.glob('*.jsonl')
+        assert len(journal.read_text().splitlines()) == 3
+        assert buffer.flush() == 3
+        assert user_client.get(comments_url).json()['results'] == created, (
+            'После сброса комментарии должны читаться с выданными id и '
+            'датами.'
+        )
+        review = Review.objects.get(text=created[0]['review'])
+        assert review.comment_count == 3
+        assert not journal.exists()
+        settings.COMMENT_WRITE_BEHIND = False
+        direct, = self.post_comments(user_client, comments_url, 1)
+        assert direct['id'] > created[0]['id'] + ID_BLOCK - 1, (
+            'Обычная вставка не должна занимать зарезервированные id.'
+        )
+        review.refresh_from_db()
+        assert review.comment_count == 4
+
+    def test_02_flush_by_rows(self, buffer, comments_url, user_client,
+                              settings):
+        settings.COMMENT_FLUSH_ROWS = 5
+        self.post_comments(user_client, comments_url, 5)
+        deadline = time.monotonic() + 5
+        while Comment.objects.count() < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert Comment.objects.count() == 5, (
+            'Набрав COMMENT_FLUSH_ROWS комментариев, буфер должен '
+            'записать их, не дожидаясь интервала.'
+        )
+
+    def test_03_replay_after_crash(self, buffer, comments_url, user_client,
+                                   tmp_path):
+        created = self.post_comments(user_client, comments_url, 3)
+        # Сбой процесса: очередь в памяти потеряна, блокировка журнала снята
+        buffer.pending.clear()
+        buffer.journal.close()
+        call_command('replaycomments')
+        assert sorted(
+            Comment.objects.values_list('pk', flat=True)
+        ) == [comment['id'] for comment in created]
+        assert Review.objects.get(
+            text=created[0]['review']
+        ).comment_count == 3
+        assert not list(tmp_path.glob('*.jsonl'))
+        assert CommentBuffer().recover() == 0
+
+    @pytest.mark.parametrize('module', (wsgi, asgi))
+    def test_04_replay_on_server_start(self, module, buffer, comments_url,
+                                       user_client, tmp_path, monkeypatch):
+        created = self.post_comments(user_client, comments_url, 2)
+        buffer.pending.clear()
+        buffer.journal.close()
+        # asgi.py включает async-представления только через окружение
+        monkeypatch.setenv('ASYNC_READ_VIEWS', '0')
+        importlib.reload(module)
+        assert sorted(
+            Comment.objects.values_list('pk', flat=True)
+        ) == [comment['id'] for comment in created], (
+            'Журналы должны переигрываться при запуске сервера.'
+        )
+        assert not list(tmp_path.glob('*.jsonl'))
+
+    def test_05_group_fsync(self, buffer, comments_url, monkeypatch):
+        review = Review.objects.order_by('pk').first()
+        calls = []
+        fsync = os.fsync
+
+        def slow_fsync(fd):
+            calls.append(fd)
+            time.sleep(0.02)
+            fsync(fd)
+
+        monkeypatch.setattr(os, 'fsync', slow_fsync)
+        threads = [
+            threading.Thread(target=buffer.add, args=(Comment(
+                review_id=review.pk, author_id=review.author_id,
+                text=f'comment {index}'
+            ),)) for index in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert buffer.synced == buffer.written == 20
+        assert len(calls) < 10, (
+            'Комментарии, дописанные во время fsync, должны сбрасываться '
+            'на диск одним следующим fsync.'
+        )
+        assert buffer.flush() == 20
+        assert Comment.objects.count() == 20
@@ -0,0 +1,63 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from reviews.management.commands.explainqueries import (
+    explain, find_full_scans
+)
+from reviews.models import GenreTitle, Review
+from tests.utils import create_comments, create_titles
+
+
+def plan_scans(queryset):
+    """ Таблицы, которые запрос выборки просматривает целиком """
+    with CaptureQueriesContext(connection) as context:
+        list(queryset)
+    sql = context.captured_queries[-1]['sql']
+    return find_full_scans(sql, explain('default', sql))
+
+
+@pytest.mark.django_db(transaction=True)
+class Test18QueryPlans:
+
+    def test_01_genre_title_unique(self, admin_client):
+        titles, _, _ = create_titles(admin_client)
+        link = GenreTitle.objects.filter(title_id=titles[0]['id']).first()
+        with pytest.raises(IntegrityError), transaction.atomic():
+            GenreTitle.objects.create(genre=link.genre, title=link.title)
+
+    def test_02_full_scans_detected(self, admin_client, admin, user,
+                                    user_client):
+        create_comments(admin_client, {admin: admin_client, user: user_client})
+        assert plan_scans(Review.objects.filter(text='text')) == [
+            'reviews_review'
+        ]
+        assert plan_scans(
+            Review.objects.select_related('title').order_by('-pub_date')[:5]
+        ) == [], 'Лента отзывов должна идти по индексу даты.'
+        assert plan_scans(
+            Review.objects.for_title(1).order_by('pub_date')
+        ) == []
+
+    def test_04_deep_offset_is_full_scan(self, admin_client, admin, user,
+                                         user_client):
+        create_comments(admin_client, {admin: admin_client, user: user_client})
+        reviews = Review.objects.order_by('pk')
+        assert plan_scans(reviews[:10]) == []
+        assert plan_scans(reviews[10:20]) == []
+        assert plan_scans(reviews[10000:10010]) == ['reviews_review'], (
+            'Глубокое смещение проходит таблицу до страницы - '
+            'это полный просмотр.'
+        )
+
+    def test_03_command_passes(self, admin_client, admin, user,
+                               user_client):
+        create_comments(admin_client, {admin: admin_client, user: user_client})
+        out = StringIO()
+        call_command('explainqueries', '--min-rows', '1', stdout=out)
+        output = out.getvalue()
+        assert 'Полных просмотров больших таблиц нет' in output
+        assert '/comments/' in output
@@ -0,0 +1,88 @@
+import asyncio
+import json
+from http import HTTPStatus
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import resolve
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tests.utils import create_comments, reload_urls
+
+
+@async_to_sync
+async def request(client, method, *args, **kwargs):
+    return await getattr(client, method)(*args, **kwargs)
+
+
+@pytest.mark.django_db(transaction=True)
+class Test19AsyncViews:
+
+    @pytest.fixture
+    def async_urls(self, settings):
+        settings.ASYNC_READ_VIEWS = True
+        reload_urls()
+        yield
+        settings.ASYNC_READ_VIEWS = False
+        reload_urls()
+
+    @pytest.fixture
+    def async_admin(self, admin):
+        return {'AUTHORIZATION': f'Bearer {AccessToken.for_user(admin)}'}
+
+    @pytest.fixture
+    def urls(self, admin_client, admin, user, user_client):
+        reviews, titles = create_comments(
+            admin_client, {admin: admin_client, user: user_client}
+        )[1:]
+        title_id = titles[0]['id']
+        review_id = reviews[0]['id']
+        comments = (
+            f'/api/v1/titles/{title_id}/reviews/{review_id}/comments/'
+        )
+        return [
+            '/api/v1/titles/', f'/api/v1/titles/{title_id}/',
+            '/api/v1/titles/?ordering=-name&limit=2',
+            f'/api/v1/titles/{title_id}/reviews/',
+            f'/api/v1/titles/{title_id}/reviews/{review_id}/',
+            comments,
+        ]
+
+    def test_01_read_views_async(self, async_urls):
+        for url in ('/api/v1/titles/', '/api/v1/titles/1/reviews/1/'):
+            assert asyncio.iscoroutinefunction(resolve(url).func), (
+                f'Чтение {url} под ASGI должно обслуживаться async-'
+                'представлением.'
+            )
+        assert not asyncio.iscoroutinefunction(
+            resolve('/api/v1/users/').func
+        )
+
+    def test_02_same_responses(self, urls, admin_client, async_urls,
+                               async_admin):
+        client = AsyncClient()
+        for url in urls:
+            expected = admin_client.get(url)
+            response = request(client, 'get', url, **async_admin)
+            assert response.status_code == expected.status_code, url
+            assert json.loads(response.content) == expected.json(), url
+
+    def test_03_concurrent_reads_and_write(self, urls, async_urls,
+                                           async_admin):
+        client = AsyncClient()
+
+        async def read_all():
+            return await asyncio.gather(*(
+                client.get(url, **async_admin) for url in urls * 10
+            ))
+
+        responses = async_to_sync(read_all)()
+        assert [response.status_code for response in responses] == (
+            [HTTPStatus.OK] * len(urls) * 10
+        )
+        response = request(
+            client, 'post', urls[-1], {'text': 'async'},
+            content_type='application/json', **async_admin
+        )
+        assert response.status_code == HTTPStatus.CREATED
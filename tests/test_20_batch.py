@@ -0,0 +1,104 @@
+from http import HTTPStatus
+
+import pytest
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from api import batch
+from tests.utils import create_comments
+
+BATCH_URL = '/api/v1/batch/'
+
+
+@pytest.mark.django_db(transaction=True)
+class Test20Batch:
+
+    @pytest.fixture
+    def paths(self, admin_client, admin, user, user_client):
+        reviews, titles = create_comments(
+            admin_client, {admin: admin_client, user: user_client}
+        )[1:]
+        title_id = titles[0]['id']
+        return [
+            f'/api/v1/titles/{title_id}/',
+            f'/api/v1/titles/{title_id}/reviews/',
+            f'/api/v1/titles/{title_id}/reviews/{reviews[0]["id"]}/'
+            'comments/?limit=1',
+            '/api/v1/categories/',
+            '/api/v1/genres/',
+            '/api/v1/users/me/',
+        ]
+
+    def post_batch(self, client, paths, **data):
+        response = client.post(BATCH_URL, data={
+            'requests': [{'path': path} for path in paths], **data
+        }, format='json')
+        assert response.status_code == HTTPStatus.OK, response.json()
+        return response.json()['responses']
+
+    @pytest.mark.parametrize('parallel', [False, True])
+    def test_01_same_as_separate_requests(self, paths, admin_client,
+                                          parallel):
+        responses = self.post_batch(
+            admin_client, paths + ['/api/v1/missing/'], parallel=parallel
+        )
+        for path, response in zip(paths, responses):
+            expected = admin_client.get(path)
+            assert response == {
+                'status': expected.status_code, 'body': expected.json()
+            }, path
+        assert responses[-1]['status'] == HTTPStatus.NOT_FOUND
+
+    def test_02_shared_authentication(self, paths, user_client,
+                                      monkeypatch):
+        calls = []
+        authenticate = JWTAuthentication.authenticate
+
+        def spy(self, request):
+            calls.append(request.path)
+            return authenticate(self, request)
+
+        monkeypatch.setattr(JWTAuthentication, 'authenticate', spy)
+        me, = self.post_batch(user_client, ['/api/v1/users/me/'] * 3)[:1]
+        assert me['body']['username'] == 'TestUser'
+        assert calls == [BATCH_URL], (
+            'Подзапросы должны использовать аутентификацию пакета.'
+        )
+        anonymous, = self.post_batch(
+            APIClient(), ['/api/v1/users/me/']
+        )
+        assert anonymous['status'] == HTTPStatus.UNAUTHORIZED
+
+    def test_03_identical_reads_once(self, paths, admin_client,
+                                     monkeypatch):
+        calls = []
+        call = batch.call
+
+        def spy(request, item):
+            calls.append(item['path'])
+            return call(request, item)
+
+        monkeypatch.setattr(batch, 'call', spy)
+        responses = self.post_batch(admin_client, paths * 2, parallel=True)
+        assert responses[:len(paths)] == responses[len(paths):]
+        assert sorted(calls) == sorted(paths)
+
+    def test_04_write_then_read(self, paths, user_client):
+        comments = paths[2].split('?')[0]
+        created, listed = self.post_batch(user_client, [], requests=[
+            {'path': comments, 'method': 'POST', 'body': {'text': 'batch'}},
+            {'path': comments},
+        ], parallel=True)
+        assert created['status'] == HTTPStatus.CREATED
+        assert created['body'] in listed['body']['results']
+
+    def test_05_validation(self, admin_client):
+        response = admin_client.post(BATCH_URL, data={
+            'requests': [{'path': '/api/v1/genres/'}] * 21
+        }, format='json')
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        for path in (BATCH_URL, '/admin/'):
+            response = admin_client.post(BATCH_URL, data={
+                'requests': [{'path': path}]
+            }, format='json')
+            assert response.status_code == HTTPStatus.BAD_REQUEST, path
@@ -0,0 +1,154 @@
+import asyncio
+import re
+import threading
+from http import HTTPStatus
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, Client
+
+from api_yamdb.metrics import registry
+from tests.utils import create_titles, reload_urls
+
+SAMPLE = re.compile(r'^(\w+)(\{.*\})? (\S+)$')
+TITLES = 'route="TitleViewSet.list"'
+
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == HTTPStatus.OK
+    assert response['Content-Type'].startswith('text/plain')
+    samples = {}
+    for line in response.content.decode().splitlines():
+        match = SAMPLE.match(line)
+        if match:
+            samples[match[1] + (match[2] or '')] = float(match[3])
+    return samples
+
+
+@pytest.mark.django_db(transaction=True)
+class Test21Metrics:
+
+    @pytest.fixture(autouse=True)
+    def metrics_dir(self, settings, tmp_path):
+        settings.METRICS_DIR = tmp_path
+        settings.METRICS_FLUSH_INTERVAL = 0
+        return tmp_path
+
+    def test_01_request_metrics(self, admin_client):
+        create_titles(admin_client)
+        client = Client()
+        before = scrape(client)
+        for _ in range(3):
+            assert admin_client.get('/api/v1/titles/').status_code == (
+                HTTPStatus.OK
+            )
+        assert admin_client.get('/api/v1/titles/0/').status_code == (
+            HTTPStatus.NOT_FOUND
+        )
+        after = scrape(client)
+
+        def delta(key):
+            return after.get(key, 0) - before.get(key, 0)
+
+        assert delta(
+            'yamdb_http_requests_total{%s,method="GET",status="200"}'
+            % TITLES
+        ) == 3
+        assert delta(
+            'yamdb_http_requests_total{route="TitleViewSet.retrieve",'
+            'method="GET",status="404"}'
+        ) == 1
+        for name in ('yamdb_http_request_duration_seconds',
+                     'yamdb_http_response_size_bytes',
+                     'yamdb_db_queries_per_request'):
+            assert delta(f'{name}_count{{{TITLES}}}') == 3, name
+            assert delta(
+                f'{name}_bucket{{{TITLES},le="+Inf"}}'
+            ) == 3, name
+        assert delta(f'yamdb_db_queries_per_request_sum{{{TITLES}}}') >= 3
+        assert delta(f'yamdb_db_query_duration_seconds_sum{{{TITLES}}}') > 0
+
+    def test_02_threads_and_processes(self, admin_client, metrics_dir):
+        key = (
+            'yamdb_http_requests_total{route="CategoryViewSet.list",'
+            'method="GET",status="200"}'
+        )
+        client = Client()
+        before = scrape(client).get(key, 0)
+        threads = [
+            threading.Thread(target=admin_client.get,
+                             args=('/api/v1/categories/',))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert scrape(client)[key] == before + 4, (
+            'Метрики потоков должны складываться.'
+        )
+        registry.flush()
+        own, = metrics_dir.glob('*.json')
+        (metrics_dir / 'other.json').write_text(own.read_text())
+        assert scrape(client)[key] == 2 * (before + 4), (
+            'Снимки других процессов из METRICS_DIR должны складываться.'
+        )
+
+    def test_03_finished_threads(self, admin_client):
+        key = (
+            'yamdb_http_requests_total{route="GenreViewSet.list",'
+            'method="GET",status="200"}'
+        )
+        client = Client()
+        before = scrape(client).get(key, 0)
+        for _ in range(50):
+            threads = [
+                threading.Thread(target=admin_client.get,
+                                 args=('/api/v1/genres/',))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert len(registry.shards) < 20, (
+            'Наборы завершившихся потоков не должны копиться.'
+        )
+        assert scrape(client)[key] == before + 200, (
+            'Метрики завершившихся потоков должны сохраняться.'
+        )
+
+    def test_04_internal_only(self):
+        response = Client(REMOTE_ADDR='203.0.113.7').get('/metrics')
+        assert response.status_code == HTTPStatus.FORBIDDEN, (
+            '/metrics должен отвечать только адресам METRICS_ALLOWED_IPS.'
+        )
+
+    def test_05_asgi_async_views(self, admin_client, settings):
+        create_titles(admin_client)
+        client = Client()
+        before = scrape(client)
+        settings.ASYNC_READ_VIEWS = True
+        reload_urls()
+        try:
+            async def read_all():
+                return await asyncio.gather(*(
+                    AsyncClient().get('/api/v1/titles/') for _ in range(5)
+                ))
+
+            responses = async_to_sync(read_all)()
+        finally:
+            settings.ASYNC_READ_VIEWS = False
+            reload_urls()
+        assert {response.status_code for response in responses} == {
+            HTTPStatus.OK
+        }
+        after = scrape(client)
+        key = f'yamdb_db_queries_per_request_count{{{TITLES}}}'
+        assert after[key] - before.get(key, 0) == 5
+        key = f'yamdb_db_queries_per_request_sum{{{TITLES}}}'
+        assert after[key] - before.get(key, 0) >= 5, (
+            'SQL async-представлений из пула потоков должен входить в '
+            'счет запроса.'
+        )
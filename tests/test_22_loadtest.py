@@ -0,0 +1,46 @@
+import re
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from reviews.models import Comment, Review, User
+from tests.utils import create_reviews
+
+WINDOW = re.compile(r'^\s+[\d.]+s\s+[\d.]+ req/s\s+p50')
+
+
+@pytest.mark.django_db(transaction=True)
+class Test22LoadTest:
+
+    @pytest.fixture(autouse=True)
+    def reviews(self, admin_client, admin):
+        return create_reviews(admin_client, {admin: admin_client})[0]
+
+    def run(self, *args):
+        out = StringIO()
+        call_command(
+            'loadtest', '--duration=2', '--interval=0.5', *args, stdout=out
+        )
+        return out.getvalue()
+
+    def test_01_threads(self):
+        output = self.run('--users=4', '--think=0.01')
+        assert sum(
+            bool(WINDOW.match(line)) for line in output.splitlines()
+        ) >= 2, 'Отчет должен выводиться каждый интервал.'
+        for action in ('signup', 'token', 'browse', 'read_reviews'):
+            assert re.search(rf'^{action}\s+[1-9]', output, re.M), action
+        users = User.objects.filter(username__startswith='load')
+        assert users.count() >= 4
+        authors = set(Review.objects.values_list('author', flat=True)) | set(
+            Comment.objects.values_list('author', flat=True)
+        )
+        assert authors & set(users.values_list('pk', flat=True)), (
+            'Пользователи нагрузки должны писать отзывы и комментарии.'
+        )
+
+    def test_02_processes(self):
+        output = self.run('--users=2', '--processes=2', '--think=0.05')
+        assert re.search(r'^browse\s+[1-9]', output, re.M)
+        assert User.objects.filter(username__startswith='load').count() >= 2
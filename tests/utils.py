@@ -1,5 +1,10 @@
+import importlib
+import multiprocessing
 from http import HTTPStatus
 
+from django.db import connections
+from django.urls import clear_url_caches
+
 
 check_name_and_slug_patterns = (
     (
@@ -305,3 +310,28 @@ def check_fields(obj_type, url_pattern, obj, expected_data, detail=False):
         f'данные {obj_types[obj_type]}{results_in_msg}. Поле `id` не '
         'найдено или не является целым числом.'
     )
+
+
+def run_child(func, *args):
+    for alias in connections:
+        connections[alias].close()
+    func(*args)
+
+
+def run_in_process(func, *args):
+    """ func(*args) в другом процессе: со своей памятью и кэшами """
+    process = multiprocessing.get_context('fork').Process(
+        target=run_child, args=(func, *args)
+    )
+    process.start()
+    process.join(60)
+    assert process.exitcode == 0, 'Процесс завершился с ошибкой.'
+
+
+def reload_urls():
+    """ Маршруты заново: ASYNC_READ_VIEWS читается при импорте urls """
+    import api.urls
+    import api_yamdb.urls
+    importlib.reload(api.urls)
+    importlib.reload(api_yamdb.urls)
+    clear_url_caches()